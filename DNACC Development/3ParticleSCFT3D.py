@@ -3,6 +3,7 @@ import matplotlib.pyplot as plt
 import scipy as sci
 import math as m
 import time
+from Potentials import createPotential
 from decimal import *
 
 
@@ -54,29 +55,14 @@ def Particles3SCFT(intialDensityA,intialDensityB,Height, Depth, Length, Width, v
 
 	flag  = 0
 
-	PotentialAB = np.ones((number_of_lattice_pointsX, number_of_lattice_pointsY, number_of_lattice_pointsZ))
-	
 	A1 = Height
 	A2 = Depth
 	length = Length
 	gamma = Width
 
 	#Create the piecewise interaction potential
-	for j in range(0,number_of_lattice_pointsX):
-		for i in range(0, number_of_lattice_pointsY):
-			for k in range(0, number_of_lattice_pointsZ):
-				r = m.sqrt(yys[i]**2 + xxs[j]**2 + zzs[k]**2)
-				if r <= length:
-					PotentialAB[j][i][k] = ((A1+A2)*(m.cos(3.14*r/length))/2.0 + (A1 - A2)/2.0)
-				else:
-					PotentialAB[j][i][k] = (-A2*(m.exp(-((r-length)**2.0)/(2.0*(gamma**2.0)))))
-
-
-
-
-	PotentialAB = np.roll(PotentialAB, half_number_of_lattice_pointsX, axis = 0)
-	PotentialAB = np.roll(PotentialAB, half_number_of_lattice_pointsY, axis = 1)
-	PotentialAB = np.roll(PotentialAB, half_number_of_lattice_pointsZ, axis = 2)
+	#(already shifted so that its zero lines up with the zero of the grid)
+	PotentialAB = createPotential(A1, A2, length, gamma, (number_of_lattice_pointsX, number_of_lattice_pointsY, number_of_lattice_pointsZ), (xsize, ysize, zsize))
 
 	#fft the potential for later use
 	Vkab = np.fft.rfft2(PotentialAB)/((float(number_of_lattice_pointsY)*float(number_of_lattice_pointsX)))
@@ -0,0 +1,326 @@
+#------------------------------------------------------------
+# Name: Benchmark.py
+#
+# Description: Times the solvers on a fixed set of problems, so that changes
+#              to them can be measured and regressions caught. Each case is
+#              one solver family at one grid size:
+#
+#                ap1d          1D asymptotic preserving DFT (dft_1d_v3.py)
+#                ap2d          2D DFT like (DNACCFunctions.AlgorithmDFTLike2D)
+#                scft2d        2D two species SCFT (Particles2DSCFT)
+#                scft3species2d, scft3species3d
+#                              three species SCFT (ThreeParticleSCFT2D/3D)
+#                shiftedloop2d the shifted Boltzmann weight SCFT loop of
+#                              DNACC Main/2particles_2d.py as copied into
+#                              shiftedIterations below (the script itself is
+#                              Python 2 and solves as it is imported), a fixed
+#                              number of iterations
+#
+#              Every case starts from random densities with a fixed seed and
+#              runs in a fresh process, so its peak resident memory is its own.
+#              A case is timed several times and the fastest run is kept, which
+#              is the one least disturbed by the rest of the machine; a single
+#              run varies by more than the regression threshold. The iterations
+#              to the tolerance, the time of the fastest run, the time per
+#              iteration and the peak memory go to a JSON file. Given the JSON
+#              of an earlier run as a baseline, every case that got slower per
+#              iteration by more than the threshold, or whose iteration count
+#              changed, is reported and the exit status is 1.
+#
+#              python Benchmark.py --sizes 32 64 128 --output after.json --baseline before.json
+#
+#              benchmarkBaseline.json is the reference run of the default cases
+#              and sizes, with the machine it ran on; compare against it on the
+#              same machine.
+#------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import multiprocessing
+
+import numpy as np
+
+import dnacc
+import FFTBackend
+from Kernels import peakMemory
+
+
+# the potential parameters every case uses (dft_1d_v3.py and the sweep drivers)
+potentialParameters = (0.35, 0.35, 2.0, 0.5)
+
+# the cases in the order they are run, with the number of dimensions of their grid
+cases = [('ap1d', 1), ('ap2d', 2), ('scft2d', 2), ('scft3species2d', 2), ('scft3species3d', 3), ('shiftedloop2d', 2)]
+
+
+#----------------------------------------------------------------------------------------
+#Name: setupCase
+#
+#Description: The System, the solver settings and the initial densities of a case at the
+#             given number of lattice points per axis. maxIterations caps the iterations
+#             of every incompressibility stage.
+#
+#Returns: (system, method, settings, initialDensities)
+#----------------------------------------------------------------------------------------
+def setupCase(name, size, seed, maxIterations):
+    A1, A2, length, gamma = potentialParameters
+    randomState = np.random.RandomState(seed)
+
+    if name == 'ap1d':
+        system   = dnacc.System.withPairPotential((size,), 15.0, [0.5, 0.5], [1.0, 1.0], A1, A2, length, gamma)
+        settings = dict(incompressibility = [100.0], tolerance = 1e-4, smallmix = 0.01, bigmix = 0.1,
+                        perc = 0.1, bigStepCount = 5, asymptoticPreserving = True)
+        initial  = 0.5 - 0.1*randomState.rand(size) + 0.1
+
+        return system, 'DFT', dict(settings, numberOfIterations = maxIterations), initial
+
+    if name == 'ap2d':
+        system   = dnacc.System.withPairPotential((size, size), 15.0, [0.5, 0.5], [1.0, 1.0], A1, A2, length, gamma)
+        settings = dict(tolerance = 1e-4, smallmix = 0.01, bigmix = 0.1, perc = 0.1, bigStepCount = 1000)
+
+        return system, 'DFT', dict(settings, numberOfIterations = maxIterations), \
+            system.generateRandomInitialDensities(0.15, seed)[0]
+
+    if name == 'scft2d':
+        system   = dnacc.System.withPairPotential((size, size), 15.0, [0.5, 0.5], [1.0, 1.0], A1, A2, length, gamma)
+        settings = dict(incompressibility = [10, 100, 900], mixParameter = [0.01, 0.005, 0.0005], tolerance = 1e-4)
+
+        return system, 'SCFT', dict(settings, numberOfIterations = maxIterations), \
+            system.generateRandomInitialDensities(0.15, seed)
+
+    if name in ('scft3species2d', 'scft3species3d'):
+        gridShape = (size,)*(2 if name == 'scft3species2d' else 3)
+        system    = dnacc.System.withPairPotential(gridShape, 15.0, [0.33, 0.33, 0.34], [1.0, 1.0, 1.0],
+                                                   A1, A2, length, gamma)
+        settings  = dict(incompressibility = [10, 100, 1000], mixParameter = [0.01, 0.005, 0.0005], tolerance = 1e-4)
+
+        return system, 'SCFT', dict(settings, numberOfIterations = maxIterations), \
+            system.generateRandomInitialDensities(0.05, seed)
+
+    raise ValueError("unknown benchmark case %r" % name)
+
+
+#----------------------------------------------------------------------------------------
+#Name: shiftedIterations
+#
+#Description: A copy of the iteration of DNACC Main/2particles_2d.py (Boltzmann weights
+#             shifted by their largest exponent before they are exponentiated), run for the
+#             given number of iterations at the first incompressibility stage. A change to
+#             the loop of the script has to be made here as well to be measured.
+#
+#Returns: The number of iterations done
+#----------------------------------------------------------------------------------------
+def shiftedIterations(size, seed, iterations):
+    fa, fb, alpha, kappa, mix = 0.5, 0.5, 0.0001, 100.0, 0.01
+    A1, A2, length, gamma = potentialParameters
+
+    system = dnacc.System.withPairPotential((size, size), 15.0, [fa, fb], [1.0, alpha], A1, A2, length, gamma)
+    Vkab   = system.fourierPotentials[0, 1]
+    phia   = fa + 0.15*np.random.RandomState(seed).randn(size, size)
+    phib   = 1 - phia
+
+    for n in range(iterations):
+        icnvb  = system.volume*np.fft.irfft2(np.fft.rfft2(phib)*Vkab, phia.shape)
+        icnvba = system.volume*np.fft.irfft2(np.fft.rfft2(phia)*Vkab, phia.shape)
+        wa = icnvb - kappa*(1 - phia - phib)
+        wb = icnvba - kappa*(1 - phia - phib)
+
+        wa_exp = np.exp(-wa - np.max(-wa))
+        wb_exp = np.exp(-alpha*wb - np.max(-alpha*wb))
+        QA = np.sum(wa_exp)
+        QB = np.sum(wb_exp)
+
+        phiatemp = fa*system.volume*wa_exp/QA
+        phibtemp = fb*system.volume*wb_exp/QB
+        phianew  = phiatemp + fa - system.cellVolume*np.sum(phiatemp)/system.volume
+        phibnew  = phibtemp + fb - system.cellVolume*np.sum(phibtemp)/system.volume
+        phia = mix*phianew + (1 - mix)*phia
+        phib = mix*phibnew + (1 - mix)*phib
+
+    return iterations
+
+
+#----------------------------------------------------------------------------------------
+#Name: runCase
+#
+#Description: Runs one case repeats times, meant to be called in a process of its own.
+#             Every run solves the same problem, so the iterations are the same and only
+#             the time of the fastest run is kept.
+#
+#Returns: A dictionary with the case, its grid and its timings, or the error it raised
+#----------------------------------------------------------------------------------------
+def runCase(name, dimensions, size, seed, maxIterations, shiftedIterationCount, repeats = 3):
+    record = {'case': name, 'size': size, 'gridShape': [size]*dimensions, 'seed': seed}
+    runs   = []
+
+    try:
+        for run in range(repeats):
+            if name == 'shiftedloop2d':
+                start      = time.time()
+                iterations = shiftedIterations(size, seed, shiftedIterationCount)
+                runs.append(time.time() - start)
+                converged  = None
+            else:
+                system, method, settings, initial = setupCase(name, size, seed, maxIterations)
+                solver = dnacc.Solver(system, method, **settings)
+
+                start      = time.time()
+                result     = solver.solve(initial)
+                runs.append(time.time() - start)
+                iterations = int(result.iterations)
+                converged  = bool(result.flag)
+    except Exception as error:
+        record['error'] = '%s: %s' % (type(error).__name__, str(error).split('\n')[0])
+        return record
+
+    seconds = min(runs)
+    record.update(iterations          = iterations,
+                  converged           = converged,
+                  seconds             = seconds,
+                  runs                = runs,
+                  secondsPerIteration = seconds/iterations if iterations else None,
+                  peakMemory          = peakMemory())
+
+    return record
+
+
+def machineDescription():
+    return {'python':   platform.python_version(),
+            'numpy':    np.__version__,
+            'platform': platform.platform(),
+            'cpus':     multiprocessing.cpu_count(),
+            'fft':      FFTBackend.defaultBackend().name,
+            'date':     time.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+#----------------------------------------------------------------------------------------
+#Name: runBenchmarks
+#
+#Description: Runs the named cases at every size, skipping grids of more than maxPoints
+#             points, each in a fresh process and repeats times.
+#
+#Returns: The benchmark, a dictionary with the machine description and the records
+#----------------------------------------------------------------------------------------
+def runBenchmarks(names, sizes, seed = 2, maxIterations = 30000, shiftedIterationCount = 200, maxPoints = 2**16,
+                  repeats = 3, stream = sys.stdout):
+    dimensions = dict(cases)
+    records    = []
+    pool       = multiprocessing.Pool(1, maxtasksperchild = 1)
+
+    try:
+        for name in names:
+            for size in sizes:
+                if size**dimensions[name] > maxPoints:
+                    continue
+
+                record = pool.apply(runCase, (name, dimensions[name], size, seed, maxIterations, shiftedIterationCount,
+                                              repeats))
+                records.append(record)
+                if stream is not None:
+                    stream.write(formatRecord(record) + '\n')
+                    stream.flush()
+    finally:
+        pool.close()
+        pool.join()
+
+    return {'machine': machineDescription(), 'results': records}
+
+
+def formatRecord(record):
+    if 'error' in record:
+        return '%-16s %5d  failed: %s' % (record['case'], record['size'], record['error'])
+
+    return '%-16s %5d %8d %10s %12.3f %14.3f %10.1f' % (
+        record['case'], record['size'], record['iterations'],
+        '-' if record['converged'] is None else ('yes' if record['converged'] else 'no'),
+        record['seconds'],
+        1e3*record['secondsPerIteration'] if record['secondsPerIteration'] is not None else float('nan'),
+        record['peakMemory']/2.0**20 if record['peakMemory'] is not None else float('nan'))
+
+
+#----------------------------------------------------------------------------------------
+#Name: compare
+#
+#Description: Compares the records of a benchmark with those of a baseline, matching
+#             them by case and size. A case regressed if its time per iteration grew by
+#             more than threshold (a fraction) or its number of iterations changed. A case
+#             that did no iterations, now or in the baseline, has no time per iteration to
+#             compare.
+#
+#Returns: A list of (case, size, reason) for every regression
+#----------------------------------------------------------------------------------------
+def compare(benchmark, baseline, threshold = 0.1):
+    previous    = dict(((record['case'], record['size']), record) for record in baseline['results'])
+    regressions = []
+
+    for record in benchmark['results']:
+        old = previous.get((record['case'], record['size']))
+        if old is None or 'error' in old:
+            continue
+        if 'error' in record:
+            regressions.append((record['case'], record['size'], 'failed: %s' % record['error']))
+            continue
+
+        if record['iterations'] != old['iterations'] and record['case'] != 'shiftedloop2d':
+            regressions.append((record['case'], record['size'],
+                                'iterations changed from %d to %d' % (old['iterations'], record['iterations'])))
+
+        if record['secondsPerIteration'] is None or old['secondsPerIteration'] is None:
+            continue
+
+        ratio = record['secondsPerIteration']/old['secondsPerIteration']
+        if ratio > 1.0 + threshold:
+            regressions.append((record['case'], record['size'],
+                                '%.0f%% slower per iteration (%.3f ms, was %.3f ms)' %
+                                (100.0*(ratio - 1.0), 1e3*record['secondsPerIteration'],
+                                 1e3*old['secondsPerIteration'])))
+
+    return regressions
+
+
+def main(arguments = None):
+    names = [name for name, dimensions in cases]
+
+    parser = argparse.ArgumentParser(description = 'Times the DNACC solvers on a fixed set of problems.')
+    parser.add_argument('--cases', nargs = '+', default = names, choices = names)
+    parser.add_argument('--sizes', nargs = '+', type = int, default = [32, 64, 128, 256],
+                        help = 'lattice points per axis')
+    parser.add_argument('--seed', type = int, default = 2)
+    parser.add_argument('--maxIterations', type = int, default = 30000, help = 'iterations per stage')
+    parser.add_argument('--shiftedIterations', type = int, default = 200, help = 'iterations of the shiftedloop2d case')
+    parser.add_argument('--maxPoints', type = int, default = 2**16,
+                        help = 'largest grid to run, in points (the default runs 3D at 32 only)')
+    parser.add_argument('--repeats', type = int, default = 3,
+                        help = 'runs of every case, the fastest is kept')
+    parser.add_argument('--output', default = 'benchmark.json', help = 'JSON file the results are written to')
+    parser.add_argument('--baseline', default = None, help = 'JSON of an earlier run to compare with')
+    parser.add_argument('--threshold', type = float, default = 0.1,
+                        help = 'slowdown per iteration counted as a regression (0.1 = 10%%)')
+    arguments = parser.parse_args(arguments)
+
+    print('%-16s %5s %8s %10s %12s %14s %10s' % ('case', 'size', 'iters', 'converged', 'seconds', 'ms per iter', 'peak MB'))
+    benchmark = runBenchmarks(arguments.cases, arguments.sizes, arguments.seed, arguments.maxIterations,
+                              arguments.shiftedIterations, arguments.maxPoints, arguments.repeats)
+
+    with open(arguments.output, 'w') as output:
+        json.dump(benchmark, output, indent = 1, sort_keys = True)
+
+    if arguments.baseline is None:
+        return 0
+
+    with open(arguments.baseline) as baseline:
+        regressions = compare(benchmark, json.load(baseline), arguments.threshold)
+
+    for name, size, reason in regressions:
+        print('regression: %s at %d: %s' % (name, size, reason))
+    if not regressions:
+        print('no regressions against %s' % arguments.baseline)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
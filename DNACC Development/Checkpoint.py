@@ -0,0 +1,107 @@
+#------------------------------------------------------------
+# Name: Checkpoint.py
+#
+# Description: Periodic checkpoints of a running solve, so that a job that
+#              is killed (walltime, node failure) can carry on where it
+#              stopped instead of starting over. A checkpoint holds the
+#              fields, the mixing state (devtot, count, Anderson history),
+#              the incompressibility stage and the iteration counter, which
+#              is everything the iteration depends on, so a resumed solve
+#              follows the uninterrupted one bit for bit.
+#
+#              Checkpoints are written to a temporary file that is synced
+#              and then renamed over the previous one, so a kill in the
+#              middle of a write leaves the previous checkpoint intact.
+#------------------------------------------------------------
+
+import os
+import time
+import tempfile
+
+import numpy as np
+
+
+# os.replace overwrites atomically on every platform, os.rename only on POSIX; also used by
+# ResultStore
+replaceFile = getattr(os, 'replace', os.rename)
+
+
+class Checkpointer(object):
+
+#----------------------------------------------------------------------------------------
+#Name: __init__
+#
+#Description: A checkpoint is written to fileName every everyIterations iterations or
+#             every everySeconds seconds of wall time, whichever comes first. With neither
+#             given it is written every 1000 iterations.
+#----------------------------------------------------------------------------------------
+    def __init__(self, fileName, everyIterations = None, everySeconds = None):
+        if everyIterations is None and everySeconds is None:
+            everyIterations = 1000
+
+        self.fileName        = fileName
+        self.everyIterations = everyIterations
+        self.everySeconds    = everySeconds
+        self.saves           = 0
+        self._lastIteration  = None
+        self._lastTime       = time.time()
+
+#----------------------------------------------------------------------------------------
+#Name: due
+#
+#Returns: True if a checkpoint should be written after the given iteration
+#----------------------------------------------------------------------------------------
+    def due(self, iteration):
+        if self._lastIteration is None:
+            self._lastIteration = iteration
+
+        if self.everyIterations is not None and iteration - self._lastIteration >= self.everyIterations:
+            return True
+        if self.everySeconds is not None and time.time() - self._lastTime >= self.everySeconds:
+            return True
+
+        return False
+
+#----------------------------------------------------------------------------------------
+#Name: save
+#
+#Description: Writes the state, a set of named arrays and numbers, as the new checkpoint
+#----------------------------------------------------------------------------------------
+    def save(self, iteration, **state):
+        directory = os.path.dirname(os.path.abspath(self.fileName))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        handle, temporaryName = tempfile.mkstemp(suffix = '.tmp', dir = directory)
+        with os.fdopen(handle, 'wb') as temporaryFile:
+            np.savez(temporaryFile, **state)
+            temporaryFile.flush()
+            os.fsync(temporaryFile.fileno())
+        replaceFile(temporaryName, self.fileName)
+
+        self.saves         += 1
+        self._lastIteration = iteration
+        self._lastTime      = time.time()
+
+#----------------------------------------------------------------------------------------
+#Name: load
+#
+#Returns: The state of the last checkpoint, with numbers as Python scalars, or None if
+#         there is no checkpoint
+#----------------------------------------------------------------------------------------
+    def load(self):
+        if not os.path.exists(self.fileName):
+            return None
+
+        with np.load(self.fileName) as stored:
+            state = dict((name, stored[name]) for name in stored.files)
+
+        for name, value in state.items():
+            if value.ndim == 0:
+                state[name] = value.item()
+
+        return state
+
+    def remove(self):
+        if os.path.exists(self.fileName):
+            os.remove(self.fileName)
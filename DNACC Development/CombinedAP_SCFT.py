@@ -19,6 +19,7 @@ import scipy as sci
 import math as m
 import time
 from decimal import *
+from ResultStore import ResultStore
 
 
 
@@ -251,7 +252,9 @@ phibnew = np.sum(np.sum(phib))/(number_of_lattice_pointsY*number_of_lattice_poin
 print divergence[-1], phianew, phibnew
 
 if flag == 0:
-    np.savetxt('lamelark.txt',phia)
+    parameters = {'A1': A1, 'A2': A2, 'length': length, 'gamma': gamma, 'alphaA': alphaA, 'alphaB': alphaB,
+                  'volumeFractionA': volumeFractionA, 'incompresiblity': incompresiblity}
+    ResultStore('.').save('lamelark', [phia, phib], parameters, flag, divergence[-1], len(divergence), divergence, FreeEnergyMicro)
 
 
 fig1 = plt.figure(1)
@@ -0,0 +1,171 @@
+#------------------------------------------------------------
+# Name: Divergence.py
+#
+# Description: Early abort of solves that are not going anywhere. A fixed
+#              point iteration that has gone NaN, blown up, settled on a
+#              plateau, started flip flopping between two states or pinned
+#              most of the grid to the clamping bounds will not reach the
+#              tolerance, but would still run to numberOfIterations. A
+#              DivergenceDetector watches the residual of every iteration and
+#              says why such a solve should stop, as an Abort holding one of
+#              the abortReasons, so a sweep can free the worker at once and
+#              record what went wrong.
+#
+#              The checks only keep a handful of numbers, they cost nothing
+#              next to an iteration.
+#------------------------------------------------------------
+
+import numpy as np
+
+
+# every reason a solve can be stopped for
+abortReasons = ('nan', 'overflow', 'plateau', 'oscillation', 'clamp saturation')
+
+
+class Abort(object):
+
+#----------------------------------------------------------------------------------------
+#Name: __init__
+#
+#Description: Why and where a solve was stopped: reason is one of abortReasons, iteration
+#             and stage the iteration it happened in, residual the deviation then and
+#             detail a sentence for people.
+#----------------------------------------------------------------------------------------
+    def __init__(self, reason, iteration, stage, residual, detail = ''):
+        self.reason    = reason
+        self.iteration = int(iteration)
+        self.stage     = int(stage)
+        self.residual  = float(residual)
+        self.detail    = detail
+
+    # a plain dictionary, for JSON manifests
+    def asDict(self):
+        return {'reason': self.reason, 'iteration': self.iteration, 'stage': self.stage,
+                'residual': self.residual, 'detail': self.detail}
+
+    def __repr__(self):
+        return 'Abort(%r, iteration %d, stage %d: %s)' % (self.reason, self.iteration, self.stage, self.detail)
+
+
+class DivergenceDetector(object):
+
+    # reasons that only end the current incompressibility stage when there are more to come
+    stagnationReasons = ('plateau', 'oscillation')
+
+#----------------------------------------------------------------------------------------
+#Name: __init__
+#
+#Description: A residual that is NaN aborts with 'nan', one that is infinite or more than
+#             overflowFactor times the best residual of the stage with 'overflow'. The
+#             limit is relative because the size of the residual depends on the problem:
+#             the DFT like residual scales like 1/alphaA^2 and starts above 1e11 at
+#             alphaA = 1e-6 in solves that converge. A residual that has not fallen below
+#             (1 - plateauTolerance) times the best so far for plateauWindow iterations
+#             is a 'plateau'. One that has gone up and down in turn for
+#             oscillationWindow iterations without such an improvement is an
+#             'oscillation'. When at least clampLimit of the grid has been clamped on
+#             every one of clampWindow iterations without an improvement it is
+#             'clamp saturation'.
+#----------------------------------------------------------------------------------------
+    def __init__(self, overflowFactor = 1e10, plateauWindow = 5000, plateauTolerance = 0.01,
+                 oscillationWindow = 1000, clampLimit = 0.9, clampWindow = 200):
+        self.overflowFactor    = overflowFactor
+        self.plateauWindow     = plateauWindow
+        self.plateauTolerance  = plateauTolerance
+        self.oscillationWindow = oscillationWindow
+        self.clampLimit        = clampLimit
+        self.clampWindow       = clampWindow
+        self.reset()
+
+    # a new stage starts, the residual may jump
+    def reset(self):
+        self._best         = np.inf
+        self._since        = 0      # iterations since the best residual improved
+        self._previous     = None
+        self._rising       = None
+        self._alternations = 0      # iterations in a row the residual changed direction
+        self._clamped      = 0      # iterations in a row with a saturated clamp
+
+#----------------------------------------------------------------------------------------
+#Name: state
+#
+#Description: The counters as numbers, for checkpoints. setState puts them back.
+#----------------------------------------------------------------------------------------
+    def state(self):
+        return {'best':         self._best,
+                'since':        self._since,
+                'previous':     np.nan if self._previous is None else self._previous,
+                'rising':       -1 if self._rising is None else int(self._rising),
+                'alternations': self._alternations,
+                'clamped':      self._clamped}
+
+    def setState(self, state):
+        self._best         = float(state['best'])
+        self._since        = int(state['since'])
+        self._previous     = None if np.isnan(state['previous']) else float(state['previous'])
+        self._rising       = None if int(state['rising']) < 0 else bool(state['rising'])
+        self._alternations = int(state['alternations'])
+        self._clamped      = int(state['clamped'])
+
+#----------------------------------------------------------------------------------------
+#Name: check
+#
+#Description: Hands the detector the residual of an iteration, and for the DFT like
+#             equations the fraction of the grid the clamping set.
+#
+#Returns: An Abort if the solve should stop, None otherwise
+#----------------------------------------------------------------------------------------
+    def check(self, iteration, stage, residual, clampedFraction = None):
+        residual = float(residual)
+
+        if np.isnan(residual):
+            return Abort('nan', iteration, stage, residual, 'the residual is NaN')
+        if np.isinf(residual):
+            return Abort('overflow', iteration, stage, residual, 'the residual is infinite')
+        if abs(residual) > self.overflowFactor*self._best:
+            return Abort('overflow', iteration, stage, residual,
+                         'the residual %g is above %g times the best, %g' % (residual, self.overflowFactor, self._best))
+
+        if residual < (1.0 - self.plateauTolerance)*self._best:
+            self._best  = residual
+            self._since = 0
+        else:
+            self._since += 1
+
+        if self._previous is not None and residual != self._previous:
+            rising = residual > self._previous
+            self._alternations = self._alternations + 1 if rising != self._rising else 0
+            self._rising       = rising
+        self._previous = residual
+
+        if clampedFraction is not None and clampedFraction >= self.clampLimit:
+            self._clamped += 1
+        else:
+            self._clamped = 0
+
+        if self._since >= self.plateauWindow:
+            return Abort('plateau', iteration, stage, residual,
+                         'no %g%% improvement in %d iterations' % (100.0*self.plateauTolerance, self._since))
+        if self._alternations >= self.oscillationWindow and self._since >= self.oscillationWindow:
+            return Abort('oscillation', iteration, stage, residual,
+                         'the residual went up and down for %d iterations' % self._alternations)
+        if self._clamped >= self.clampWindow and self._since >= self.clampWindow:
+            return Abort('clamp saturation', iteration, stage, residual,
+                         '%.0f%% of the grid clamped for %d iterations' % (100.0*clampedFraction, self._clamped))
+
+        return None
+
+
+#----------------------------------------------------------------------------------------
+#Name: getDetector
+#
+#Returns: detector if it is a DivergenceDetector, a new one with the default limits if it
+#         is True, or None (no early abort)
+#----------------------------------------------------------------------------------------
+def getDetector(detector = None):
+    if isinstance(detector, DivergenceDetector):
+        return detector
+    if detector:
+        return DivergenceDetector()
+
+    return None
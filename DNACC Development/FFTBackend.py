@@ -0,0 +1,245 @@
+#------------------------------------------------------------
+# Name: FFTBackend.py
+#
+# Description: The real FFTs used by the solvers, behind one interface so
+#              the library doing them can be swapped:
+#
+#                numpy   np.fft, single threaded (the default)
+#                scipy   scipy.fft with a pool of worker threads
+#                pyfftw  FFTW plans built once per array shape and reused,
+#                        with aligned buffers, threads and wisdom that can
+#                        be kept in a file between runs
+#
+#              The backend is chosen with setDefaultBackend, with the fft
+#              setting of dnacc.Solver, or with the environment variables
+#              DNACC_FFT_BACKEND (numpy, scipy or pyfftw) and
+#              DNACC_FFT_WORKERS (number of threads, -1 for every core).
+#              DNACC_FFTW_WISDOM names the pyFFTW wisdom file.
+#
+#              All backends scale like np.fft (the inverse divides by the
+#              number of points) and transform single precision input in
+#              single precision. np.fft's single precision transforms are
+#              slower than its double precision ones; scipy's and FFTW's are
+#              faster.
+#------------------------------------------------------------
+
+import os
+import pickle
+import multiprocessing
+
+import numpy as np
+
+# names may be unicode under Python 2
+try:
+    _stringTypes = basestring
+except NameError:
+    _stringTypes = str
+
+
+class NumpyFFT(object):
+
+    name = 'numpy'
+
+    def __init__(self, workers = 1):
+        self.workers = 1
+        self.hasOut  = self._hasOut()
+
+    # np.fft takes out= from NumPy 2.0 on
+    @staticmethod
+    def _hasOut():
+        try:
+            np.fft.rfftn(np.zeros(2), out = np.zeros(2, dtype = complex))
+        except TypeError:
+            return False
+        return True
+
+#----------------------------------------------------------------------------------------
+#Name: rfftn
+#
+#Description: The real to complex FFT of a over the given axes (all axes by default). If
+#             out is given the result is written into it.
+#----------------------------------------------------------------------------------------
+    def rfftn(self, a, axes = None, out = None):
+        if out is None:
+            return np.fft.rfftn(a, axes = axes)
+        if self.hasOut:
+            return np.fft.rfftn(a, axes = axes, out = out)
+
+        out[...] = np.fft.rfftn(a, axes = axes)
+        return out
+
+#----------------------------------------------------------------------------------------
+#Name: irfftn
+#
+#Description: The complex to real inverse FFT of a, giving a real array whose transformed
+#             axes have the shape s.
+#----------------------------------------------------------------------------------------
+    def irfftn(self, a, s, axes = None, out = None):
+        if out is None:
+            return np.fft.irfftn(a, s = s, axes = axes)
+        if self.hasOut:
+            return np.fft.irfftn(a, s = s, axes = axes, out = out)
+
+        out[...] = np.fft.irfftn(a, s = s, axes = axes)
+        return out
+
+
+class ScipyFFT(object):
+
+    name = 'scipy'
+
+    def __init__(self, workers = -1):
+        import scipy.fft
+
+        self.fft     = scipy.fft
+        self.workers = workers
+
+    def rfftn(self, a, axes = None, out = None):
+        result = self.fft.rfftn(a, axes = axes, workers = self.workers)
+        if out is None:
+            return result
+
+        out[...] = result
+        return out
+
+    def irfftn(self, a, s, axes = None, out = None):
+        result = self.fft.irfftn(a, s = s, axes = axes, workers = self.workers)
+        if out is None:
+            return result
+
+        out[...] = result
+        return out
+
+
+class FFTWBackend(object):
+
+    name = 'pyfftw'
+
+#----------------------------------------------------------------------------------------
+#Name: __init__
+#
+#Description: workers is the number of FFTW threads (-1 for every core) and plannerEffort
+#             how hard FFTW searches for a fast plan. With a wisdom file the wisdom is read
+#             when the backend is created and written back whenever a new plan is made, so
+#             later runs on the same machine skip the planning.
+#----------------------------------------------------------------------------------------
+    def __init__(self, workers = -1, plannerEffort = 'FFTW_MEASURE', wisdomFile = None):
+        import pyfftw
+        import pyfftw.builders
+
+        self.pyfftw        = pyfftw
+        self.workers       = multiprocessing.cpu_count() if workers < 0 else workers
+        self.plannerEffort = plannerEffort
+        self.wisdomFile    = wisdomFile
+        self._plans        = {}
+
+        if wisdomFile is not None and os.path.exists(wisdomFile):
+            with open(wisdomFile, 'rb') as wisdom:
+                pyfftw.import_wisdom(pickle.load(wisdom))
+
+    def _plan(self, kind, shape, dtype, axes, s = None):
+        key = (kind, shape, np.dtype(dtype).str, axes, s)
+        if key not in self._plans:
+            template = self.pyfftw.empty_aligned(shape, dtype = dtype)
+            build    = getattr(self.pyfftw.builders, kind)
+            arguments = {'axes': axes, 'threads': self.workers, 'planner_effort': self.plannerEffort}
+            if s is not None:
+                arguments['s'] = s
+
+            self._plans[key] = build(template, **arguments)
+            self._saveWisdom()
+
+        return self._plans[key]
+
+    def _saveWisdom(self):
+        if self.wisdomFile is None:
+            return
+
+        with open(self.wisdomFile, 'wb') as wisdom:
+            pickle.dump(self.pyfftw.export_wisdom(), wisdom)
+
+    # a plan returns its own output array, which its next call overwrites
+    def rfftn(self, a, axes = None, out = None):
+        a      = np.asarray(a)
+        axes   = tuple(range(a.ndim)) if axes is None else tuple(axes)
+        result = self._plan('rfftn', a.shape, np.result_type(a.dtype, np.float32), axes)(a)
+        if out is None:
+            return result.copy()
+
+        out[...] = result
+        return out
+
+    def irfftn(self, a, s, axes = None, out = None):
+        a      = np.asarray(a)
+        axes   = tuple(range(a.ndim - len(s), a.ndim)) if axes is None else tuple(axes)
+        result = self._plan('irfftn', a.shape, np.result_type(a.dtype, np.complex64), axes, tuple(s))(a)
+        if out is None:
+            return result.copy()
+
+        out[...] = result
+        return out
+
+
+backends = {'numpy': NumpyFFT, 'scipy': ScipyFFT, 'pyfftw': FFTWBackend}
+
+
+#----------------------------------------------------------------------------------------
+#Name: createBackend
+#
+#Description: Creates the backend with the given name. workers defaults to
+#             DNACC_FFT_WORKERS, or to every core for the threaded backends.
+#----------------------------------------------------------------------------------------
+def createBackend(name, workers = None):
+    name = name.lower()
+    if name not in backends:
+        raise ValueError("unknown FFT backend %r, expected one of %s" % (name, ", ".join(sorted(backends))))
+
+    if workers is None:
+        workers = int(os.environ.get('DNACC_FFT_WORKERS', -1))
+
+    if name == 'pyfftw':
+        return FFTWBackend(workers, wisdomFile = os.environ.get('DNACC_FFTW_WISDOM'))
+
+    return backends[name](workers)
+
+
+_default = None
+
+#----------------------------------------------------------------------------------------
+#Name: defaultBackend
+#
+#Description: The backend used by every solver that is not given one, taken from
+#             DNACC_FFT_BACKEND the first time it is needed.
+#----------------------------------------------------------------------------------------
+def defaultBackend():
+    global _default
+    if _default is None:
+        _default = createBackend(os.environ.get('DNACC_FFT_BACKEND', 'numpy'))
+
+    return _default
+
+
+def setDefaultBackend(backend, workers = None):
+    global _default
+    _default = getBackend(backend, workers)
+
+
+# forget the default, so that it is read from the environment again
+def resetDefaultBackend():
+    global _default
+    _default = None
+
+
+#----------------------------------------------------------------------------------------
+#Name: getBackend
+#
+#Returns: backend if it is a backend, the backend of that name if it is a name, or the
+#         default backend if it is None
+#----------------------------------------------------------------------------------------
+def getBackend(backend = None, workers = None):
+    if backend is None:
+        return defaultBackend()
+    if isinstance(backend, _stringTypes):
+        return createBackend(backend, workers)
+
+    return backend
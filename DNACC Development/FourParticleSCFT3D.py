@@ -3,6 +3,7 @@ import matplotlib.pyplot as plt
 import scipy as sci
 import math as m
 import time
+import dnacc
 from decimal import *
 
 
@@ -10,161 +11,46 @@ from decimal import *
 
 #parameters = np.loadtxt('try.txt')
 
-def Particles4SCFT(intialDensityA,intialDensityB,Height, Depth, Length, Width, volumeFraction = [0.25,0.25,0.25],alphas = [1, 1, 1] ):
+#Four particles in 3D. The density of the fourth particle is whatever the first three leave.
+#intialDensityC is the initial density of the third, uniform at its volume fraction if it is
+#not given; only then are the first two densities, the coordinates and the flag returned, as
+#before the fourth particle, otherwise the third density follows the first two. alphas of
+#three particles leave the fourth at 1.
+#Every pair of different particles interacts through the (Height, Depth, Length, Width)
+#potential, unless pairParameters gives the 4x4 matrix of the (A1, A2, length, gamma) of
+#each pair (see dnacc.System.withPairParameters). incompressibility = 'adaptive' lets the
+#solver pick the stages and their mixing parameters (see Schedule.py). levels lists coarser
+#numbers of lattice points to solve on first (see dnacc.Solver). symmetry = 'detect' solves
+#lamellae or cylinders on their 1D or 2D cross section (see Symmetry.py).
+def Particles4SCFT(intialDensityA,intialDensityB,Height, Depth, Length, Width, volumeFraction = [0.25,0.25,0.25],alphas = [1, 1, 1, 1], pairParameters = None, mixing = 'picard', historyDepth = 5, incompressibility = [10, 100, 1000], levels = None, symmetry = None, intialDensityC = None):
 
 	np.set_printoptions(precision = 4)
-	t1              = time.clock()
-	volumeFractionA = volumeFraction[0]
-	volumeFractionB = volumeFraction[1] 
-	volumeFractionC = 1 - volumeFraction[0] - volumeFraction[1]
-	alphaA          = AlphaA
-	alphaB          = AlphaB
-	alphaC	        = 1.0
-	
-	perc            = 0.1          # Percent deviation for trying a big step.
-	bigmix          = 0.1
-	#incompresiblity = 100/alphaA        # Defines the stregnth of the global energy penalty 
-	
-	kappa 	 = [10, 100,1000]
-	smallmix = [0.01 ,0.005, 0.0005]
-
-	number_of_iterations 			= 10000	# Default 30000
-	tolerence 						= 10**(-4) 	# the tolerance 
-	number_of_lattice_pointsX 	= len(intialDensityA)      	# number of lattice points for the j direction
-	number_of_lattice_pointsY       = len(intialDensityA)
-	number_of_lattice_pointsZ       = len(intialDensityA)
-
-	half_number_of_lattice_pointsX 	= number_of_lattice_pointsX/2 # the halfway point in the lattice
-	half_number_of_lattice_pointsY  = number_of_lattice_pointsY/2
-	half_number_of_lattice_pointsZ  = number_of_lattice_pointsY/2
-
-	
-	#define box demsions and grid spacing
-	xsize 							= 6.0    								#  
-	ysize                           =6.0
-	zsize							= 6.0
-	dx 								= xsize/float(number_of_lattice_pointsX)
-	dy                              = ysize/float(number_of_lattice_pointsY)
-	dz                          	= zsize/float(number_of_lattice_pointsZ)
-	xxs 							= [i*dx - xsize/2.0 for i in range(0,number_of_lattice_pointsX)]
-	yys                             = [i*dy - ysize/2.0 for i in range(0,number_of_lattice_pointsY)]
-	zzs                         	= [i*dz - zsize/2.0 for i in range(0,number_of_lattice_pointsZ)]
-
-
-	flag  = 0
-
-	PotentialAB = np.ones((number_of_lattice_pointsX, number_of_lattice_pointsY, number_of_lattice_pointsZ))
-	
-	A1 = Height
-	A2 = Depth
-	length = Length
-	gamma = Width
-
-	#Create the piecewise interaction potential
-	for j in range(0,number_of_lattice_pointsX):
-		for i in range(0, number_of_lattice_pointsY):
-			for k in range(0, number_of_lattice_pointsZ):
-				r = m.sqrt(yys[i]**2 + xxs[j]**2 + zzs[k]**2)
-				if r <= length:
-					PotentialAB[j][i][k] = ((A1+A2)*(m.cos(3.14*r/length))/2.0 + (A1 - A2)/2.0)
-				else:
-					PotentialAB[j][i][k] = (-A2*(m.exp(-((r-length)**2.0)/(2.0*(gamma**2.0)))))
-
-
-
-	PotentialAB = np.roll(PotentialAB, half_number_of_lattice_pointsX, axis = 0)
-	PotentialAB = np.roll(PotentialAB, half_number_of_lattice_pointsY, axis = 1)
-	PotentialAB = np.roll(PotentialAB, half_number_of_lattice_pointsZ, axis = 2)
-
-	#fft the potential for later use
-	Vkab = np.fft.rfftn(PotentialAB)/((float(number_of_lattice_pointsY)*float(number_of_lattice_pointsX)*float(number_of_lattice_pointsZ)))
-
-	#Randomize the density of particle A using a Gaussian distribution
-	#phia = volumeFractionA + std*np.random.randn(number_of_lattice_pointsY,number_of_lattice_pointsX)
-
-	phia = intialDensityA
-
-	phib = intialDensityB
-
-	phic = 1 - intialDensityA - intialDensityB
-	
-
-	
-	divergence          = []
-	step                = []
-	percentDeviation    = []
-	devtot = 100.0*np.ones(5)
-	count  = 0
-	g = 0
-	for b in xrange(3):
-		for j in xrange(number_of_iterations):
-                        
-			#SCFT.
-			iphia = np.fft.rfftn(phia);
-			iphib = np.fft.rfftn(phib);
-			iphic = np.fft.rfftn(phic);
-
-			cnva  = iphia*Vkab;
-			cnvb  = iphib*Vkab;
-			cnvc  = iphic*Vkab;
-
-
-			icnva = xsize*ysize*zsize*np.fft.irfftn(cnva);
-			icnvb = xsize*ysize*zsize*np.fft.irfftn(cnvb);
-			icnvc = xsize*ysize*zsize*np.fft.irfftn(cnvc)
-
-
-			wa = icnvb + icnvc - kappa[b]*(1 - phia - phib - phic);
-			wb = icnva + icnvc - kappa[b]*(1 - phia - phib - phic);
-			wc = icnvb + icnva - kappa[b]*(1 - phia - phib - phic)
-
-			ewa = np.exp(-alphaA*wa)
-			ewb = np.exp(-alphaB*wb)
-			ewc = np.exp(-alphaC*wc)
-			#print phianew
-
-
-			#print phianew
-
-
-			QA = dx*dy*dz*np.sum(np.sum(np.sum(ewa)))
-			QB = dx*dy*dz*np.sum(np.sum(np.sum(ewb)))
-			QC = dx*dy*dz*np.sum(np.sum(np.sum(ewc)))
-
-			#picard mixing to increase the convergence
-			phiatemp = volumeFractionA*xsize*ysize*zsize*ewa/QA;
-			phibtemp = volumeFractionB*xsize*ysize*zsize*ewb/QB;
-			phictemp = volumeFractionC*xsize*ysize*zsize*ewc/QC;
-
-			phiaave = volumeFractionA - dx*dy*dz*np.sum(phiatemp)/(xsize*ysize*zsize)
-			phibave = volumeFractionB - dx*dy*dz*np.sum(phibtemp)/(xsize*ysize*zsize)
-			phicave = volumeFractionC - dx*dy*dz*np.sum(phictemp)/(xsize*ysize*zsize)
-
-			phianew = phiatemp+phiaave
-			phibnew = phibtemp+phibave
-			phicnew = phictemp+phicave
-
-			    #print phia
-			#print(g, devtot[0], perdev)   
-			phia = smallmix[b]*phianew + (1 - smallmix[b])*phia
-			phib = smallmix[b]*phibnew + (1 - smallmix[b])*phib
-			phic = smallmix[b]*phicnew + (1 - smallmix[b])*phic
-
-
-			dev = phianew-phia;
-			dev2 = dev*dev;
-			norm = np.sum(phianew*phianew)
-			phidev = np.sum(dev2)/norm
-			if abs(phidev) < tolerence:
-			    flag = 1
-			    break
-
-
-
-	#will return the density if the code converges to a certain tolerance, otherwise will return an array of zeros.
-	print phidev
-	if (phidev <= tolerence):
-		return phia, phib, xxs, yys, zzs, flag
-	else:
-		return phia, phib, xxs, yys, zzs, flag
-
+	numberOfLatticePoints = len(intialDensityA)
+	alphas = list(alphas) + [1.0]*(4 - len(alphas))
+	initialDensities = [intialDensityA, intialDensityB,
+	                    volumeFraction[2]*np.ones(np.shape(intialDensityA)) if intialDensityC is None else intialDensityC]
+
+	if pairParameters is None:
+		pairParameters = [[None if i == j else (Height, Depth, Length, Width) for j in range(4)] for i in range(4)]
+
+	system = dnacc.System.withPairParameters((numberOfLatticePoints, numberOfLatticePoints, numberOfLatticePoints), 6.0,
+	                                         [volumeFraction[0], volumeFraction[1], volumeFraction[2],
+	                                          1 - volumeFraction[0] - volumeFraction[1] - volumeFraction[2]],
+	                                         alphas, pairParameters)
+	solver = dnacc.Solver(system, 'SCFT',
+	                      incompressibility  = incompressibility,
+	                      mixParameter       = [0.01 ,0.005, 0.0005],
+	                      numberOfIterations = 10000,
+	                      tolerance          = 10**(-4),
+	                      mixing             = mixing,
+	                      historyDepth       = historyDepth,
+	                      levels             = levels,
+	                      symmetry           = symmetry)
+
+	result = solver.solve(initialDensities)
+	xxs, yys, zzs = system.coordinates
+
+	print(result.deviation)
+	if intialDensityC is None:
+		return result.densities[0], result.densities[1], xxs, yys, zzs, result.flag
+	return result.densities[0], result.densities[1], result.densities[2], xxs, yys, zzs, result.flag
@@ -0,0 +1,316 @@
+#------------------------------------------------------------
+# Name: Kernels.py
+#
+# Description: In place iteration kernels for the fixed point solvers. A
+#              kernel allocates every full grid work array it needs once,
+#              when it is created, and then runs the iteration with out=
+#              ufuncs and FFTs writing into those arrays, so the steady state
+#              loop does not allocate grid sized temporaries. The operations
+#              are done in the same order as in the straightforward
+#              expressions, so the results are identical to them bit for bit,
+#              except that a field summed from more than one species may round
+#              differently from the einsum of Solver.convolve.
+#
+#              FFTs go through an FFTBackend and write into the work arrays;
+#              NumPy's n dimensional transforms still use internal temporaries
+#              for all but the last axis, pyFFTW plans do not.
+#
+#              Each phase of an iteration is timed with the kernel's
+#              Profiling.PhaseTimer, which does nothing unless it is enabled.
+#
+#              A kernel works in one precision, float64 by default. With
+#              float32 every work array, the potentials and the spectra
+#              (complex64) are single precision, which halves the memory
+#              traffic of an iteration. With np.longdouble they are extended
+#              precision.
+#
+#              The Boltzmann weights exp(-alpha w) overflow for the very strong
+#              potentials (A1 in the thousands) that used to need mpmath. Where
+#              the largest exponent of a species is out of the safe range of
+#              the precision, the exponents are shifted by it before they are
+#              exponentiated (the log-sum-exp trick). The shift cancels between
+#              the weights and the partition function, so the densities are
+#              unchanged, and within the safe range nothing is shifted.
+#------------------------------------------------------------
+
+import sys
+
+import numpy as np
+
+from FFTBackend import getBackend
+from Profiling import getTimer
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+#----------------------------------------------------------------------------------------
+#Name: peakMemory
+#
+#Description: The peak resident memory of this process so far, in bytes, or None where
+#             the resource module is not available (Windows).
+#----------------------------------------------------------------------------------------
+def peakMemory():
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else 1024*peak
+
+
+#----------------------------------------------------------------------------------------
+#Name: exponentShifts
+#
+#Description: maxima are the largest exponents of the Boltzmann weights of every species.
+#             An exponent further from zero than half the log of the largest number of the
+#             precision could overflow exp, or the sum of the weights, or underflow it to
+#             zero.
+#
+#Returns: The amount to subtract from the exponents of every species, the maximum where it
+#         is out of that range and zero elsewhere
+#----------------------------------------------------------------------------------------
+def exponentShifts(maxima, dtype = np.float64):
+    limit = 0.5*np.log(np.finfo(dtype).max)
+
+    return np.where(np.abs(maxima) > limit, maxima, 0.0).astype(dtype)
+
+
+class Kernel(object):
+
+    # the total size of the work arrays in bytes
+    @property
+    def nbytes(self):
+        return sum(value.nbytes for value in vars(self).values() if isinstance(value, np.ndarray))
+
+
+class SCFTKernel(Kernel):
+
+#----------------------------------------------------------------------------------------
+#Name: __init__
+#
+#Description: Work arrays for one SCFT iteration of the given System: the spectra of the
+#             densities and of the fields, one product buffer, the fields (which become
+#             the Boltzmann weights), the new densities and two grids for the deviation.
+#             timer is the Profiling.PhaseTimer the phases are timed with and dtype the
+#             precision of the densities, np.float64 or np.float32.
+#----------------------------------------------------------------------------------------
+    def __init__(self, system, fft = None, timer = None, dtype = np.float64):
+        self.system = system
+        self.fft    = getBackend(fft)
+        self.timer  = getTimer(timer if timer is not None else False)
+        self.dtype  = np.dtype(dtype)
+        complexType = np.result_type(self.dtype, np.complex64)
+
+        speciesShape = (system.numberOfSpecies,) + (1,)*system.numberOfDimensions
+        self.negativeAlphas    = (-system.alphas.reshape(speciesShape)).astype(self.dtype)
+        self.fractionsVolume   = (system.volumeFractions*system.volume).reshape(speciesShape).astype(self.dtype)
+        self.volumeFractions   = system.volumeFractions.astype(self.dtype)
+        self.fourierPotentials = system.fourierPotentials.astype(complexType, copy = False)
+        self.pairs             = [(i, j) for i in range(system.numberOfSpecies) for j in range(system.numberOfSpecies)
+                                  if system.interacting[i, j]]
+
+        self.spectra      = np.empty((system.numberOfSpecies,) + system.fourierShape, dtype = complexType)
+        self.fieldSpectra = np.empty((system.numberOfSpecies,) + system.fourierShape, dtype = complexType)
+        self.product      = np.empty(system.fourierShape, dtype = complexType)
+        self.fields       = np.empty((system.numberOfSpecies,) + system.gridShape, dtype = self.dtype)
+        self.newDensities = np.empty((system.numberOfSpecies,) + system.gridShape, dtype = self.dtype)
+        self.total        = np.empty(system.gridShape, dtype = self.dtype)
+        self.square       = np.empty(system.gridShape, dtype = self.dtype)
+        self.Q            = np.empty(system.numberOfSpecies, dtype = self.dtype)
+        self.average      = np.empty(system.numberOfSpecies, dtype = self.dtype)
+        self.maxima       = np.empty(system.numberOfSpecies, dtype = self.dtype)
+
+#----------------------------------------------------------------------------------------
+#Name: update
+#
+#Description: The right hand side of the SCFT equations for the given densities, see
+#             Solver._scftUpdate.
+#
+#Returns: The new densities, in a work array that the next call overwrites
+#----------------------------------------------------------------------------------------
+    def update(self, densities, kappa):
+        system = self.system
+        fields = self.fields
+        timer  = self.timer
+        kappa  = float(kappa)
+        start  = timer.start()
+
+        # w_i = sum_j V * phi_j - kappa (1 - sum phi), the convolutions summed in k-space so
+        # that every field takes one inverse transform (see Solver.convolve)
+        self.fft.rfftn(densities, system.axes, self.spectra)
+        self.fieldSpectra[...] = 0.0
+        for i, j in self.pairs:
+            np.multiply(self.spectra[j], self.fourierPotentials[i, j], out = self.product)
+            self.fieldSpectra[i] += self.product
+        self.fft.irfftn(self.fieldSpectra, system.gridShape, system.axes, out = fields)
+        fields *= system.volume
+        start = timer.lap('convolution', start)
+
+        np.sum(densities, axis = 0, out = self.total)
+        np.subtract(1.0, self.total, out = self.total)
+        self.total *= kappa
+        fields -= self.total
+        start = timer.lap('field update', start)
+
+        # Boltzmann weights and partition functions, shifted where they would overflow
+        fields *= self.negativeAlphas
+        np.max(fields, axis = system.axes, out = self.maxima)
+        shifts = exponentShifts(self.maxima, self.dtype)
+        if np.any(shifts):
+            fields -= shifts.reshape(self.fractionsVolume.shape)
+        np.exp(fields, out = fields)
+        start = timer.lap('exponentiation', start)
+
+        np.sum(fields, axis = system.axes, out = self.Q)
+        self.Q *= system.cellVolume
+
+        newDensities = np.multiply(fields, self.fractionsVolume, out = self.newDensities)
+        newDensities /= self.Q.reshape(self.fractionsVolume.shape)
+
+        np.sum(newDensities, axis = system.axes, out = self.average)
+        self.average *= system.cellVolume
+        self.average /= system.volume
+        np.subtract(self.volumeFractions, self.average, out = self.average)
+        newDensities += self.average.reshape(self.fractionsVolume.shape)
+        timer.lap('normalization', start)
+
+        return newDensities
+
+    # Picard mixing, densities = mix*newDensities + (1 - mix)*densities in place
+    def mix(self, densities, newDensities, mix):
+        mix   = float(mix)
+        start = self.timer.start()
+        np.multiply(newDensities, mix, out = self.fields)
+        densities *= 1.0 - mix
+        np.add(self.fields, densities, out = densities)
+        self.timer.lap('mixing', start)
+
+        return densities
+
+    # sum (new - mixed)^2/sum new^2 for the first species
+    def deviation(self, newDensities, densities):
+        start = self.timer.start()
+        np.subtract(newDensities[0], densities[0], out = self.square)
+        np.multiply(self.square, self.square, out = self.square)
+        deviation = np.sum(self.square)
+
+        np.multiply(newDensities[0], newDensities[0], out = self.square)
+        deviation /= np.sum(self.square)
+        self.timer.lap('convergence check', start)
+
+        return deviation
+
+
+class DFTKernel(Kernel):
+
+#----------------------------------------------------------------------------------------
+#Name: __init__
+#
+#Description: Work arrays for one iteration of the DFT like equations: the spectrum, two
+#             grids for the logarithm terms, the convolution and a mask for the clamping.
+#             The logarithms count as the field update and the step and the clamping as
+#             the mixing; these equations have no exponentiation or normalization.
+#             dtype is the precision of phia, as for SCFTKernel.
+#----------------------------------------------------------------------------------------
+    def __init__(self, system, asymptoticPreserving = False, fft = None, timer = None, dtype = np.float64):
+        self.system               = system
+        self.asymptoticPreserving = asymptoticPreserving
+        self.fft                  = getBackend(fft)
+        self.timer                = getTimer(timer if timer is not None else False)
+        self.dtype                = np.dtype(dtype)
+        complexType               = np.result_type(self.dtype, np.complex64)
+
+        self.potential   = system.fourierPotentials[0, 1].astype(complexType, copy = False)
+        self.spectrum    = np.empty(system.fourierShape, dtype = complexType)
+        self.phianew     = np.empty(system.gridShape, dtype = self.dtype)
+        self.work        = np.empty(system.gridShape, dtype = self.dtype)
+        self.convolution = np.empty(system.gridShape, dtype = self.dtype)
+        self.mask        = np.empty(system.gridShape, dtype = bool)
+
+        # set by clamp when it is asked to count
+        self.clampedFraction = None
+
+#----------------------------------------------------------------------------------------
+#Name: residual
+#
+#Description: phianew of the reformulated equations, see Solver._dftResidual
+#
+#Returns: phianew, in a work array that the next call overwrites
+#----------------------------------------------------------------------------------------
+    def residual(self, phia, kappa):
+        system = self.system
+        # Python floats, so that single precision arrays stay single precision
+        volumeFractionA, volumeFractionB = [float(f) for f in system.volumeFractions]
+        alphaA, alphaB = [float(a) for a in system.alphas]
+        kappa   = float(kappa)
+        phianew = self.phianew
+        work    = self.work
+        start   = self.timer.start()
+
+        np.subtract(phia, volumeFractionA, out = work)
+        self.fft.rfftn(work, out = self.spectrum)
+        self.spectrum *= self.potential
+        self.fft.irfftn(self.spectrum, system.gridShape, out = self.convolution)
+        self.convolution *= system.volume
+        start = self.timer.lap('convolution', start)
+
+        np.divide(phia, volumeFractionA, out = phianew)
+        np.log(phianew, out = phianew)
+        phianew *= -(1/alphaA)
+
+        np.subtract(1, phia, out = work)
+        work /= volumeFractionB
+        np.log(work, out = work)
+        work *= 1/alphaB
+
+        phianew += work
+        self.convolution *= 2/(alphaA*alphaB)
+        phianew += self.convolution
+        phianew += kappa*(volumeFractionA - np.mean(phia))
+
+        if self.asymptoticPreserving:
+            phianew *= alphaA
+        self.timer.lap('field update', start)
+
+        return phianew
+
+    # sum phianew^2/sum phia^2
+    def deviation(self, phianew, phia):
+        start = self.timer.start()
+        np.multiply(phianew, phianew, out = self.work)
+        deviation = np.sum(self.work)
+
+        np.multiply(phia, phia, out = self.work)
+        deviation /= np.sum(self.work)
+        self.timer.lap('convergence check', start)
+
+        return deviation
+
+    # the Picard step phia + step*phianew in place
+    def step(self, phia, phianew, step):
+        step  = float(step)
+        start = self.timer.start()
+        np.multiply(phianew, step, out = self.work)
+        phia += self.work
+        self.timer.lap('mixing', start)
+
+        return phia
+
+    # densities above bounds[1] or below bounds[0] are set to clampedValues; with count the
+    # fraction of the grid that was clamped is kept in clampedFraction
+    def clamp(self, phia, bounds, clampedValues, count = False):
+        start = self.timer.start()
+        np.greater_equal(phia, bounds[1], out = self.mask)
+        np.putmask(phia, self.mask, clampedValues[1])
+        clamped = np.count_nonzero(self.mask) if count else 0
+        np.less_equal(phia, bounds[0], out = self.mask)
+        np.putmask(phia, self.mask, clampedValues[0])
+        if count:
+            self.clampedFraction = (clamped + np.count_nonzero(self.mask))/float(self.mask.size)
+        self.timer.lap('mixing', start)
+
+        return phia
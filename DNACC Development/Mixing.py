@@ -0,0 +1,268 @@
+#------------------------------------------------------------
+# Name: Mixing.py
+#
+# Description: Mixing schemes for the self consistent iterations. The plain
+#              Picard step x + mix*(G(x) - x) needs tens of thousands of
+#              iterations when mix has to be small. Anderson mixing (also known
+#              as DIIS) remembers the last few iterates and their residuals and
+#              takes the step that the history predicts will make the residual
+#              smallest, which usually converges in far fewer iterations.
+#
+#              The adaptive mixer keeps the Picard step but learns the mixing
+#              parameter from the residuals: it grows the parameter while the
+#              residual keeps falling, backs it off (no further than the Picard
+#              parameter it started from) when the residual rises and takes the
+#              last step again with a smaller parameter when the residual
+#              explodes, so no schedule has to be tuned by hand.
+#
+#              Both have the same update(x, residual, mixParameter) interface,
+#              so any fixed point loop can use either of them.
+#------------------------------------------------------------
+
+import numpy as np
+
+
+class AndersonMixer(object):
+
+#----------------------------------------------------------------------------------------
+#Name: __init__
+#
+#Description: historyDepth is the number of previous iterates remembered. Whenever the
+#             residual grows by more than growthFactor from one step to the next the
+#             history is thrown away and a plain Picard step is taken instead. The
+#             residual of an Anderson step often goes up a little on the way down, so
+#             growthFactor leaves room for that.
+#----------------------------------------------------------------------------------------
+    def __init__(self, historyDepth = 5, growthFactor = 1.5):
+        self.historyDepth = historyDepth
+        self.growthFactor = growthFactor
+        self.fallbacks    = 0
+        self.reset()
+
+    def reset(self):
+        self._iterates     = []
+        self._residuals    = []
+        self._previousNorm = None
+
+#----------------------------------------------------------------------------------------
+#Name: state
+#
+#Description: The history as plain arrays, for checkpoints. setState puts it back.
+#----------------------------------------------------------------------------------------
+    def state(self):
+        return {'iterates':     np.array(self._iterates),
+                'residuals':    np.array(self._residuals),
+                'previousNorm': np.nan if self._previousNorm is None else self._previousNorm,
+                'fallbacks':    self.fallbacks}
+
+    def setState(self, state):
+        self._iterates     = [np.array(x) for x in state['iterates']]
+        self._residuals    = [np.array(f) for f in state['residuals']]
+        self._previousNorm = None if np.isnan(state['previousNorm']) else state['previousNorm']
+        self.fallbacks     = int(state['fallbacks'])
+
+#----------------------------------------------------------------------------------------
+#Name: update
+#
+#Description: x is the current iterate and residual the Picard direction G(x) - x (any
+#             shape; everything is flattened). mixParameter is the Picard mixing
+#             parameter, used for the plain step and as the relaxation of the Anderson
+#             step.
+#
+#Returns: The next iterate, with the shape of x
+#----------------------------------------------------------------------------------------
+    def update(self, x, residual, mixParameter):
+        shape    = np.shape(x)
+        x        = np.ravel(x)
+        residual = np.ravel(residual)
+        norm     = np.sqrt(np.dot(residual, residual))
+
+        if self._previousNorm is not None and norm > self.growthFactor*self._previousNorm:
+            self.fallbacks += 1
+            self.reset()
+
+        self._previousNorm = norm
+        self._iterates.append(x.copy())
+        self._residuals.append(residual.copy())
+        if len(self._iterates) > self.historyDepth + 1:
+            del self._iterates[0]
+            del self._residuals[0]
+
+        if len(self._iterates) == 1:
+            return (x + mixParameter*residual).reshape(shape)
+
+        # differences between successive iterates and residuals
+        dX = np.array(self._iterates[1:]) - np.array(self._iterates[:-1])
+        dF = np.array(self._residuals[1:]) - np.array(self._residuals[:-1])
+
+        coefficients = np.linalg.lstsq(dF.T, residual, rcond = 1e-12)[0]
+
+        newX = x + mixParameter*residual - np.dot(coefficients, dX + mixParameter*dF)
+
+        return newX.reshape(shape)
+
+    # Anderson mixing relaxes with the mixing parameter it is given
+    def relaxation(self, mixParameter):
+        return mixParameter
+
+    # the length of the history and the fallbacks to a Picard step so far, for telemetry
+    def policy(self):
+        return {'history':   len(self._iterates),
+                'fallbacks': self.fallbacks}
+
+
+class AdaptiveMixer(object):
+
+#----------------------------------------------------------------------------------------
+#Name: __init__
+#
+#Description: The mixing parameter passed to the first update is the starting point, taken
+#             to be one the Picard step is stable with. It is multiplied by growth after
+#             patience steps in a row that lowered the residual and by shrink after a step
+#             that raised it, staying between the starting point (the floor) and
+#             maximumFactor times it (and at most 1). The residual also rises while the
+#             iteration leaves a saddle point, and shrinking the step below the floor
+#             there would keep it on the saddle. After any shrink the parameter is held
+#             for window steps before it may grow again, so it does not swing up and down
+#             with a residual that rises every few steps.
+#
+#             A residual more than rollbackFactor times the previous one, after the
+#             parameter has grown above the floor, is taken as the iteration blowing up:
+#             that step is undone and taken again from the previous iterate, with the
+#             parameter multiplied by shrink. Only a residual that is not finite takes
+#             the parameter, and the floor with it, further down, to minimumFactor times
+#             the starting point; at the floor the DFT like residual jumps whenever a
+#             density is clamped, which a shorter step does not change.
+#----------------------------------------------------------------------------------------
+    def __init__(self, growth = 1.2, shrink = 0.5, patience = 5, rollbackFactor = 2.0,
+                 minimumFactor = 0.001, maximumFactor = 10.0, window = 50):
+        self.growth         = growth
+        self.shrink         = shrink
+        self.patience       = patience
+        self.rollbackFactor = rollbackFactor
+        self.minimumFactor  = minimumFactor
+        self.maximumFactor  = maximumFactor
+        self.window         = window
+        self.rollbacks      = 0
+        self.mixParameter   = None
+        self._minimum       = None
+        self._floor         = None
+        self._maximum       = None
+        self.reset()
+
+    def reset(self):
+        self._iterate      = None
+        self._residual     = None
+        self._previousNorm = None
+        self._streak       = 0
+        self._hold         = 0
+
+#----------------------------------------------------------------------------------------
+#Name: policy
+#
+#Returns: The state of the controller (mixing parameter, its bounds and floor, the number
+#         of steps in a row that lowered the residual, the steps it is still held for and
+#         the rollbacks so far), for telemetry
+#----------------------------------------------------------------------------------------
+    def policy(self):
+        return {'mixParameter': self.mixParameter,
+                'minimum':      self._minimum,
+                'floor':        self._floor,
+                'maximum':      self._maximum,
+                'streak':       self._streak,
+                'hold':         self._hold,
+                'rollbacks':    self.rollbacks}
+
+#----------------------------------------------------------------------------------------
+#Name: state
+#
+#Description: The controller and the step it can roll back to as plain arrays, for
+#             checkpoints. setState puts it back.
+#----------------------------------------------------------------------------------------
+    def state(self):
+        return {'mixParameter': np.nan if self.mixParameter is None else self.mixParameter,
+                'bounds':       np.array([self._minimum, self._floor, self._maximum]) if self.mixParameter is not None
+                                else np.array([np.nan, np.nan, np.nan]),
+                'iterate':      np.array([]) if self._iterate is None else self._iterate,
+                'residual':     np.array([]) if self._residual is None else self._residual,
+                'previousNorm': np.nan if self._previousNorm is None else self._previousNorm,
+                'streak':       self._streak,
+                'hold':         self._hold,
+                'rollbacks':    self.rollbacks}
+
+    def setState(self, state):
+        self.reset()
+        self.rollbacks = int(state['rollbacks'])
+        self._streak   = int(state['streak'])
+        self._hold     = int(state['hold'])
+        if not np.isnan(state['mixParameter']):
+            self.mixParameter                         = float(state['mixParameter'])
+            self._minimum, self._floor, self._maximum = [float(bound) for bound in state['bounds']]
+        if not np.isnan(state['previousNorm']):
+            self._previousNorm = float(state['previousNorm'])
+        if np.size(state['iterate']):
+            self._iterate  = np.array(state['iterate'])
+            self._residual = np.array(state['residual'])
+
+    # the mixing parameter of the next step, mixParameter until the first update
+    def relaxation(self, mixParameter):
+        return mixParameter if self.mixParameter is None else self.mixParameter
+
+#----------------------------------------------------------------------------------------
+#Name: update
+#
+#Description: x is the current iterate and residual the Picard direction G(x) - x, as for
+#             AndersonMixer.update. mixParameter only sets the starting point and the
+#             bounds on the first call.
+#
+#Returns: The next iterate, with the shape of x
+#----------------------------------------------------------------------------------------
+    def update(self, x, residual, mixParameter):
+        if self.mixParameter is None:
+            self.mixParameter = float(mixParameter)
+            self._minimum     = self.minimumFactor*self.mixParameter
+            self._floor       = self.mixParameter
+            self._maximum     = min(self.maximumFactor*self.mixParameter, 1.0)
+
+        shape    = np.shape(x)
+        x        = np.ravel(x)
+        residual = np.ravel(residual)
+        norm     = np.sqrt(np.dot(residual, residual))
+
+        if self._previousNorm is not None:
+            # above the floor a jump in the residual is put down to the step, a residual
+            # that is not finite to the step whatever its size
+            if not np.isfinite(norm):
+                bottom = self._minimum
+            elif norm > self.rollbackFactor*self._previousNorm:
+                bottom = self._floor
+            else:
+                bottom = None
+
+            if bottom is not None and self._iterate is not None and self.mixParameter > bottom:
+                # undo the last step and take it again, shorter
+                self.rollbacks   += 1
+                self._streak      = 0
+                self._hold        = self.window
+                self.mixParameter = max(self.shrink*self.mixParameter, bottom)
+                self._floor       = min(self._floor, self.mixParameter)
+
+                return (self._iterate + self.mixParameter*self._residual).reshape(shape)
+
+            self._hold = max(self._hold - 1, 0)
+            if norm < self._previousNorm:
+                self._streak += 1
+                if self._streak >= self.patience and self._hold == 0:
+                    self._streak      = 0
+                    self.mixParameter = min(self.growth*self.mixParameter, self._maximum)
+            else:
+                self._streak = 0
+                if self.mixParameter > self._floor:
+                    self._hold        = self.window
+                    self.mixParameter = max(self.shrink*self.mixParameter, self._floor)
+
+        self._previousNorm = norm
+        self._iterate      = x.copy()
+        self._residual     = residual.copy()
+
+        return (x + self.mixParameter*residual).reshape(shape)
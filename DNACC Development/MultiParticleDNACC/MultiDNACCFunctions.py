@@ -5,12 +5,18 @@
 #
 #
 # Created by Shawn Dion
+#
+# Potentials and dnacc live in DNACC Development, which has to be on the path of
+# the script importing this module (test.py puts it there).
 ################################################################################
 
 
 import numpy as np
 import math  as m
 
+from Potentials import potentialFromCoordinates
+import dnacc
+
 
 #Functions for stuff
 
@@ -18,116 +24,77 @@ import math  as m
 #
 # pass the size of the potentials to generate the potential which is then
 # resized to make sure the zero of the potential will match up with the zero
-# of the grid.
+# of the grid. The work is done by the shared Potentials module, which builds
+# the whole grid in one NumPy broadcast.
 def createPotential1D( A1, A2, length ,gamma, size = [32],segments =[]):
-	for j in range(0,size[0]):
-		r = segments[j]
-
-		if r <= length:
-			PotentialAB1D[j] = ((A1+A2)*(m.cos(3.14*r/length))/2.0 + (A1 - A2)/2.0)
-		else:
-			PotentialAB1D[j] = (-A2*(m.exp(-((r-length)**2.0)/(2.0*(gamma**2.0)))))
-
-		PotentialAB = np.roll(PotentialAB1D, size[0]/2, axis = 0)
-	return PotentialAB1D
+	return potentialFromCoordinates(A1, A2, length, gamma, [segments[0:size[0]]])
 
 def createPotential2D( A1, A2, length ,gamma, size = [32,32],segments =[]):
-	for i in range(0,size[0]):
-		for  j in range(0,size[1]):
-			r = m.sqrt((segments[0][i])**2 + segments[1][j]**2)
-
-			if r <= length:
-				PotentialAB2D[i][j] = ((A1+A2)*(m.cos(3.14*r/length))/2.0 + (A1 - A2)/2.0)
-			else:
-		   		PotentialAB2D[i][j] = (-A2*(m.exp(-((r-length)**2.0)/(2.0*(gamma**2.0)))))
-
-	PotentialAB2D = np.roll(PotentialAB2D, size[0]/2, axis = 0)
-	PotentialAB2D = np.roll(PotentialAB2D, size[1]/2, axis = 1)
-
-	return PotentialAB2D
+	return potentialFromCoordinates(A1, A2, length, gamma, [segments[0][0:size[0]], segments[1][0:size[1]]])
 
 def createPotential3D( A1, A2, length ,gamma, size = [32,32,32], segments =[]):
-	PotentialAB3D = np.empty(size)
-	for i in range(0, size[0]):
-		for  j in range(0,size[1]):
-			for  k in range(0,size[2]):
+	return potentialFromCoordinates(A1, A2, length, gamma, [segments[0][0:size[0]], segments[1][0:size[1]], segments[2][0:size[2]]])
 
-				r = m.sqrt((segments[0][i])**2 + segments[1][j]**2+ segments[2][k]**2)
 
-				if r <= length:
-					PotentialAB3D[i][j][k] = ((A1+A2)*(m.cos(3.14*r/length))/2.0 + (A1 - A2)/2.0)
-				else:
-					PotentialAB3D[i][j][k] = (-A2*(m.exp(-((r-length)**2.0)/(2.0*(gamma**2.0)))))
+#solver for a system of any number of particles on a 1D, 2D or 3D grid. pairParameters
+#is the NxN matrix of the (A1, A2, length, gamma) of the potential between every pair
+#of particles (None where they do not interact, it has to be symmetric), see
+#dnacc.System.withPairParameters. Densities are held as one [particle, *grid] array,
+#so every step of the iteration works on all the particles at once. incompressibility
+#= 'adaptive' lets the solver pick the stages and their mix (see Schedule.py).
+#
+#Returns the list of densities and the flag (1 if converged)
+def solveSystemSCFT(	intialDensities = [],
+						pairParameters = [],
+						volumeFractions = [],
+						Alphas = [],
+						BoxSizes = [6,6,6],
+						numberOfIterations = 10000,
+						incompressibility  = [10, 100, 1000],
+						mix 			   = [0.01, 0.005, 0.0005],
+						tolerance = 0.00001,
+						**settings):
 
-	PotentialAB = np.roll(PotentialAB3D, size[0]/2, axis = 0)
-	PotentialAB = np.roll(PotentialAB3D, size[1]/2, axis = 1)
-	PotentialAB = np.roll(PotentialAB3D, size[2]/2, axis = 2)
+	gridShape = np.shape(intialDensities[0])
+	system = dnacc.System.withPairParameters(gridShape, BoxSizes[0:len(gridShape)], volumeFractions, Alphas, pairParameters)
 
-	return PotentialAB3D
+	return _solve(system, intialDensities, numberOfIterations, incompressibility, mix, tolerance, settings)
 
 
-#solver for a system defined by the instance of the class designed to solve for
-#equlibrium densities
+#solver for a system of any number of particles in three dimensions. Potentials[i] is the
+#real space potential (see createPotential3D) that every other particle feels from
+#particle i, so the field of a particle is the sum of the convolutions of the other
+#densities with their potentials, minus the incompressibility term. volumeFractions are
+#scaled to add up to 1, so [0.33, 0.33, 0.33] stands for thirds.
+#
+#Returns the list of densities and the flag (1 if converged)
 def solveSystemSCFT3D(	intialDensities = [],
 						Potentials = [],
 						volumeFractions = [],
 						Alphas = [],
  						BoxSizes = [6,6,6],
 						numberOfIterations = 10000,
-						incompressibility  = 1000,
-						mix 			   = 0.01,
-						tolerance =0.00001):
-
-	numberOfParticles 		= len(intialDensities)
-	numberOfSegments		= len(intialDensities[0])
-	currentDensities 		= intialDensities
-	FourierIntegral 		= []
-	chemicalPotentialFields = []
-	exponentialFields 		= []
-	boltzmanWeights 		= []
-	tempDensities 			= []
-	averageDensities		= []
-	newDensities			= []
-	flag = 0
-	for j in range(numberOfIterations):
-
-		#calculate Fourier components of the Chemcial Potential
-		for i in range(numberOfParticles):
-
-			currentIntegral = np.fft.rfftn(intialDensities[i])*np.fft.rfftn(Potentials[i])
-
-			FourierIntegral.append( BoxSizes[0]*BoxSizes[1]*BoxSizes[2]*np.fft.irfftn(currentIntegral))
-
-
-
-		#calculate the chemical potential for each particle
-		for currentParticle in range(numberOfParticles):
-			print currentParticle
-			chemicalPotentialFields.append(([sum(i) for i in zip(*FourierIntegral)] - FourierIntegral[currentParticle]) - incompressibility*(np.ones((numberOfSegments,numberOfSegments,numberOfSegments)) - ([sum(i) for i in zip(*currentDensities)] )))
-
-			exponentialFields.append(np.exp(Alphas[currentParticle]*chemicalPotentialFields[currentParticle]))
-
-			boltzmanWeights.append((BoxSizes[0]/len(currentDensities[currentParticle]))*(BoxSizes[1]/len(currentDensities[currentParticle]))*(BoxSizes[2]/len(currentDensities[currentParticle]))*np.sum(exponentialFields[currentParticle]))
-
-			tempDensities.append(volumeFractions[currentParticle]*BoxSizes[0]*BoxSizes[1]*BoxSizes[0]*exponentialFields[currentParticle]/boltzmanWeights[currentParticle])
-
-			averageDensities.append(volumeFractions[currentParticle]*(BoxSizes[0]*BoxSizes[1]*BoxSizes[2]/len(currentDensities[currentParticle])*np.sum(tempDensities[currentParticle])))
-
-			newDensities.append(tempDensities[currentParticle] + averageDensities[currentParticle])
-
-			currentDensities[currentParticle] = mix*newDensities[currentParticle] + (1 - mix)*currentDensities[currentParticle]
-
+						incompressibility  = [10, 100, 1000],
+						mix 			   = [0.01, 0.005, 0.0005],
+						tolerance =0.00001,
+						**settings):
 
-		deviation = currentDensities[0] - newDensities[0]
+	numberOfParticles = len(intialDensities)
+	potentials = [[None if i == j else Potentials[j] for j in range(numberOfParticles)] for i in range(numberOfParticles)]
+	volumeFractions = np.asarray(volumeFractions, dtype = float)/np.sum(volumeFractions)
+	system = dnacc.System(np.shape(intialDensities[0]), BoxSizes, volumeFractions, Alphas, potentials = potentials)
 
-		deviation2 = deviation*deviation
+	return _solve(system, intialDensities, numberOfIterations, incompressibility, mix, tolerance, settings)
 
-		norm = np.sum(newDensities[0]*newDensities[0])
 
-		densitiyDeviation = np.sum(deviation2)/norm
+def _solve(system, intialDensities, numberOfIterations, incompressibility, mix, tolerance, settings):
+	solver = dnacc.Solver(system, 'SCFT',
+	                      incompressibility  = incompressibility,
+	                      mixParameter       = mix,
+	                      numberOfIterations = numberOfIterations,
+	                      tolerance          = tolerance,
+	                      **settings)
 
-		if densitiyDeviation < tolerance:
-			flag = 1
-			break
+	result = solver.solve(intialDensities)
 
-		return currentDensities, flag
+	return list(result.densities), result.flag
@@ -1,3 +1,6 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))   # dnacc and Potentials
 import MultiDNACCFunctions as MF
 import numpy as np
 #import matplotlib.pyplot as plt
@@ -0,0 +1,175 @@
+#------------------------------------------------------------
+# Name: NewtonKrylov.py
+#
+# Description: A Jacobian free Newton-Krylov minimizer of a free energy whose
+#              gradient is the residual F(x) of a set of self consistent
+#              equations, F = -c grad f for some c > 0, as for the DFT like
+#              equations. Each Newton step solves H dx = F, H = -J the Hessian,
+#              with the conjugate gradient method, which only needs products
+#              of the Jacobian with a vector, so J is never formed, and a line
+#              search then takes a step along dx that lowers the free energy.
+#
+#              Solving J dx = -F for any zero of F (GMRES with a line search
+#              on |F|) converges on saddle points and on the uniform state as
+#              readily as on a minimum. The conjugate gradient solve stops at a
+#              direction of negative curvature and follows it downhill, and the
+#              line search only accepts steps that lower the free energy, so
+#              the iteration runs downhill from any state it is started on. It
+#              can still come to rest on a saddle point, where the gradient
+#              vanishes too; the caller checks for that (see Stability.py).
+#
+#              The densities live in (0, 1): the iteration works on their
+#              logit u = log(x/(1 - x)), on which the bounds are never in the
+#              way, with d x/d u = x(1 - x).
+#
+#              Used for the stiff DFT like / asymptotic preserving equations,
+#              where the Picard iteration needs hundreds of thousands of steps
+#              once alphaA drops below 1e-6.
+#------------------------------------------------------------
+
+import numpy as np
+
+
+# the densities of the logits u, written with tanh so that it does not overflow
+def _densities(u):
+    return 0.5*(1.0 + np.tanh(0.5*u))
+
+
+#----------------------------------------------------------------------------------------
+#Name: _conjugateGradient
+#
+#Description: Solves A p = b with the preconditioned conjugate gradient method, A applied
+#             by product and the preconditioner by inverse, until the residual is below
+#             krylovTolerance times that of b or iterations products were taken. A
+#             direction d with d.A d <= 0 ends the solve, since on it the quadratic model
+#             falls without bound.
+#
+#Returns: The solution so far and the direction of negative curvature, None if there
+#         was none, and whether it was found in the first product
+#----------------------------------------------------------------------------------------
+def _conjugateGradient(product, inverse, b, krylovTolerance, iterations):
+    p = np.zeros_like(b)
+    r = b.copy()
+    z = inverse(r)
+    d = z.copy()
+    rz = np.sum(r*z)
+    bound = krylovTolerance*np.sqrt(np.sum(b**2))
+
+    for k in range(iterations):
+        Ad = product(d)
+        curvature = np.sum(d*Ad)
+        if curvature <= 0.0:
+            return p, d, k == 0
+
+        a  = rz/curvature
+        p  = p + a*d
+        r  = r - a*Ad
+        if np.sqrt(np.sum(r**2)) < bound:
+            break
+
+        z      = inverse(r)
+        rzNext = np.sum(r*z)
+        d      = z + (rzNext/rz)*d
+        rz     = rzNext
+
+    return p, None, False
+
+
+#----------------------------------------------------------------------------------------
+#Name: newtonKrylov
+#
+#Description: residual(x) returns F(x), jacobianVector(x, v) returns J(x) v, both with
+#             the shape of x, and objective(x) the free energy that F runs down. x0 holds
+#             densities inside (0, 1). preconditioner(x), if given, returns a function
+#             applying a symmetric positive definite approximation of the inverse of
+#             -J(x) to a vector. Convergence is measured the way the Picard loops measure
+#             it, sum(F^2)/sum(x^2) < tolerance. krylovTolerance is the relative residual
+#             the conjugate gradient solve of a Newton step is stopped at, krylovIterations
+#             its largest number of products.
+#
+#             callback(n, x, deviation, freeEnergy), if given, is called with every iterate
+#             x, the one after n Newton steps, before its next step; anything but None it
+#             returns stops the iteration. timer is a Profiling.PhaseTimer the 'krylov
+#             solve' and 'line search' of every step are timed with.
+#
+#Returns: x, flag (1 if converged), the deviation of every iterate and what the callback
+#         stopped the iteration with, or None. The iteration also stops with flag 0 when
+#         no step along the Newton direction lowers the free energy.
+#----------------------------------------------------------------------------------------
+def newtonKrylov(residual, jacobianVector, objective, x0,
+                 preconditioner          = None,
+                 tolerance               = 1e-4,
+                 maximumNewtonIterations = 100,
+                 krylovTolerance         = 0.1,
+                 krylovIterations        = 50,
+                 callback                = None,
+                 timer                   = None):
+
+    x = np.clip(np.array(x0, dtype = float), 1e-12, 1.0 - 1e-12)
+    u = np.log(x/(1.0 - x))
+    x = _densities(u)
+
+    F          = residual(x)
+    energy     = objective(x)
+    deviations = []
+
+    for n in range(maximumNewtonIterations + 1):
+        deviation = np.sum(F**2)/np.sum(x**2)
+        deviations.append(deviation)
+
+        stopped = None if callback is None else callback(n, x, deviation, energy)
+        if stopped is not None:
+            return x, 0, deviations, stopped
+        if not np.isfinite(deviation):
+            break
+        if deviation < tolerance:
+            return x, 1, deviations, None
+        if n == maximumNewtonIterations:
+            break
+
+        clock = None if timer is None else timer.start()
+
+        # the gradient and the Hessian of the free energy in u, up to the factor c
+        D       = x*(1.0 - x)
+        Fu      = D*F
+        shift   = -F*D*(1.0 - 2.0*x)
+        product = lambda v: -D*jacobianVector(x, D*v) + shift*v
+
+        if preconditioner is None:
+            inverse = lambda r: r
+        else:
+            applyInverse = preconditioner(x)
+            inverse      = lambda r: applyInverse(r/D)/D
+
+        step, negative, first = _conjugateGradient(product, inverse, Fu, krylovTolerance, krylovIterations)
+
+        # downhill along a direction of negative curvature, as far in u as the Newton step
+        if negative is not None:
+            negative = np.sign(np.sum(Fu*negative) or 1.0)*negative/np.max(np.abs(negative))
+            step     = negative if first else step + negative*np.max(np.abs(step))
+        if not np.sum(Fu*step) > 0.0:
+            step = inverse(Fu)
+
+        if timer is not None:
+            clock = timer.lap('krylov solve', clock)
+
+        length = 1.0
+        while length > 1e-12:
+            trial       = _densities(u + length*step)
+            trialEnergy = objective(trial)
+            if trialEnergy < energy:
+                break
+            length *= 0.5
+
+        if timer is not None:
+            timer.lap('line search', clock)
+
+        if not length > 1e-12:
+            break
+
+        u      = u + length*step
+        x      = trial
+        energy = trialEnergy
+        F      = residual(x)
+
+    return x, 0, deviations, None
@@ -0,0 +1,132 @@
+#------------------------------------------------------------
+# Name: PotentialCache.py
+#
+# Description: Least recently used cache of the Fourier transformed pair
+#              potentials (Vkab) used by the solvers. A sweep calls the
+#              solver many times with the same potential parameters and only
+#              the alpha or the initial condition changing, so the potential
+#              is built and transformed once and then reused. Entries are
+#              keyed by the potential parameters, grid shape and box size and
+#              can optionally be spilled to a directory of .npy files so that
+#              restarted runs skip the construction as well.
+#
+#              The size of the default cache and the directory it spills to
+#              can be set with the DNACC_POTENTIAL_CACHE_SIZE and
+#              DNACC_POTENTIAL_CACHE_DIR environment variables.
+#------------------------------------------------------------
+
+import os
+import hashlib
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+from Potentials import createPotential
+
+
+class PotentialCache(object):
+
+#----------------------------------------------------------------------------------------
+#Name: __init__
+#
+#Description: maximumSize is the number of transformed potentials held in memory. If a
+#             directory is given every transformed potential is also written there and
+#             read back when it is not in memory.
+#----------------------------------------------------------------------------------------
+    def __init__(self, maximumSize = 32, directory = None):
+        self.maximumSize = maximumSize
+        self.directory   = directory
+        self.hits        = 0
+        self.misses      = 0
+        self._entries    = OrderedDict()
+
+#----------------------------------------------------------------------------------------
+#Name: key
+#
+#Description: The content address of a potential. Everything that changes the transformed
+#             potential is part of the key: the four potential parameters, the grid shape,
+#             the box size along each axis and the number of dimensions.
+#----------------------------------------------------------------------------------------
+    def key(self, A1, A2, length, gamma, shape, boxSize):
+        shape   = tuple(int(n) for n in np.atleast_1d(shape))
+        boxSize = tuple(float(size) for size in np.broadcast_to(np.asarray(boxSize, dtype = float), (len(shape),)))
+
+        return (float(A1), float(A2), float(length), float(gamma), shape, boxSize, len(shape))
+
+#----------------------------------------------------------------------------------------
+#Name: fourierPotential
+#
+#Description: Returns Vkab = rfftn(PotentialAB)/(number of lattice points) for the given
+#             potential, building it only if it is neither in memory nor on disk.
+#
+#Returns: A read only complex array, shared between all callers
+#----------------------------------------------------------------------------------------
+    def fourierPotential(self, A1, A2, length, gamma, shape, boxSize):
+        key = self.key(A1, A2, length, gamma, shape, boxSize)
+
+        if key in self._entries:
+            self.hits += 1
+            Vk = self._entries.pop(key)
+            self._entries[key] = Vk
+            return Vk
+
+        Vk = self._load(key)
+        if Vk is None:
+            self.misses += 1
+            PotentialAB = createPotential(A1, A2, length, gamma, key[4], key[5])
+            Vk = np.fft.rfftn(PotentialAB)/float(PotentialAB.size)
+            self._save(key, Vk)
+        else:
+            self.hits += 1
+
+        Vk.flags.writeable = False
+        self._entries[key] = Vk
+        while len(self._entries) > self.maximumSize:
+            self._entries.popitem(last = False)
+
+        return Vk
+
+    def clear(self):
+        self._entries.clear()
+        self.hits   = 0
+        self.misses = 0
+
+    def _fileName(self, key):
+        return os.path.join(self.directory, 'Vk_' + hashlib.sha1(repr(key).encode('ascii')).hexdigest() + '.npy')
+
+    def _load(self, key):
+        if self.directory is None:
+            return None
+
+        fileName = self._fileName(key)
+        if not os.path.exists(fileName):
+            return None
+
+        return np.load(fileName)
+
+    # write to a temporary file first so a killed run never leaves half a potential behind
+    def _save(self, key, Vk):
+        if self.directory is None:
+            return
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        handle, temporaryName = tempfile.mkstemp(suffix = '.npy', dir = self.directory)
+        with os.fdopen(handle, 'wb') as temporaryFile:
+            np.save(temporaryFile, Vk)
+        os.rename(temporaryName, self._fileName(key))
+
+
+defaultCache = PotentialCache(maximumSize = int(os.environ.get('DNACC_POTENTIAL_CACHE_SIZE', 32)),
+                              directory   = os.environ.get('DNACC_POTENTIAL_CACHE_DIR'))
+
+
+#----------------------------------------------------------------------------------------
+#Name: fourierPotential
+#
+#Description: Looks the transformed potential up in the default cache
+#----------------------------------------------------------------------------------------
+def fourierPotential(A1, A2, length, gamma, shape, boxSize):
+    return defaultCache.fourierPotential(A1, A2, length, gamma, shape, boxSize)
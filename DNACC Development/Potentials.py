@@ -0,0 +1,68 @@
+#------------------------------------------------------------
+# Name: Potentials.py
+#
+# Description: Builds the piecewise cosine-core / Gaussian-well pair
+#              potential used by every DNACC solver on 1D, 2D and 3D
+#              grids. The radial distance is computed with a single
+#              NumPy broadcast and the np.roll origin shift is folded
+#              into the coordinates, so no Python loops run over the grid.
+#------------------------------------------------------------
+
+import numpy as np
+
+
+#----------------------------------------------------------------------------------------
+#Name: gridCoordinates
+#
+#Description: Returns the list of 1D coordinate arrays [xxs, yys, zzs, ...] for a grid of
+#             the given shape, centred on the middle of a box of the given size. The box
+#             size can either be a single number or one size per axis.
+#----------------------------------------------------------------------------------------
+def gridCoordinates(shape, boxSize):
+    shape = tuple(int(n) for n in np.atleast_1d(shape))
+    sizes = np.broadcast_to(np.asarray(boxSize, dtype = float), (len(shape),))
+
+    return [np.arange(n)*(size/float(n)) - size/2.0 for n, size in zip(shape, sizes)]
+
+
+#----------------------------------------------------------------------------------------
+#Name: potentialFromCoordinates
+#
+#Description: Evaluates the piecewise interaction potential on the grid spanned by the
+#             1D coordinate arrays in "coordinates" (one per dimension). Each axis is
+#             rolled by half its length so that the zero of the potential lines up with
+#             the zero of the computational grid, exactly as the old
+#             np.roll(PotentialAB, half_number_of_lattice_points, axis) calls did.
+#----------------------------------------------------------------------------------------
+def potentialFromCoordinates(A1, A2, length, gamma, coordinates):
+    numberOfDimensions = len(coordinates)
+
+    rSquared = 0.0
+    for axis, axisCoordinates in enumerate(coordinates):
+        axisCoordinates = np.asarray(axisCoordinates, dtype = float)
+        axisCoordinates = np.roll(axisCoordinates, len(axisCoordinates)//2)
+
+        broadcastShape       = [1]*numberOfDimensions
+        broadcastShape[axis] = len(axisCoordinates)
+        rSquared = rSquared + axisCoordinates.reshape(broadcastShape)**2
+
+    r = np.sqrt(rSquared)
+
+    # 3.14 rather than pi so the potentials match the ones the solvers have always used
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        core = (A1 + A2)*np.cos(3.14*r/length)/2.0 + (A1 - A2)/2.0
+        well = -A2*np.exp(-((r - length)**2.0)/(2.0*(gamma**2.0)))
+
+    return np.where(r <= length, core, well)
+
+
+#----------------------------------------------------------------------------------------
+#Name: createPotential
+#
+#Description: Creates the shifted pair potential for a grid of the given shape (1, 2 or
+#             3 dimensions) in a box of size boxSize.
+#
+#Returns: An array of the given shape holding the potential
+#----------------------------------------------------------------------------------------
+def createPotential(A1, A2, length, gamma, shape, boxSize):
+    return potentialFromCoordinates(A1, A2, length, gamma, gridCoordinates(shape, boxSize))
@@ -0,0 +1,131 @@
+#------------------------------------------------------------
+# Name: Profiling.py
+#
+# Description: Per phase timing of the solver iterations. A PhaseTimer adds
+#              up the wall time and the number of calls of each phase of an
+#              iteration (the convolutions, the field update, the
+#              exponentiation of the Boltzmann weights, the normalization by
+#              the partition functions, the mixing and the convergence check)
+#              and prints a table of them when a solve finishes.
+#
+#              The solvers call start and lap around every phase. A disabled
+#              timer returns from both at once without reading the clock, so
+#              leaving the calls in costs next to nothing. Timing is switched
+#              on with the profile setting of dnacc.Solver, by setting enabled
+#              on a timer in the middle of a run, or for every solver with the
+#              environment variable DNACC_PROFILE=1.
+#------------------------------------------------------------
+
+import os
+import sys
+import time
+
+# the most precise wall clock there is (time.perf_counter is Python 3 only)
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+class PhaseTimer(object):
+
+    # the phases in the order they are shown
+    phases = ('convolution', 'field update', 'exponentiation', 'normalization', 'mixing', 'convergence check')
+
+#----------------------------------------------------------------------------------------
+#Name: __init__
+#
+#Description: enabled switches the timing on. stream is where finish prints the summary
+#             table (e.g. sys.stdout), None to only keep the numbers.
+#----------------------------------------------------------------------------------------
+    def __init__(self, enabled = True, stream = None):
+        self.enabled = enabled
+        self.stream  = stream
+        self.reset()
+
+    def reset(self):
+        self.seconds = dict((phase, 0.0) for phase in self.phases)
+        self.calls   = dict((phase, 0) for phase in self.phases)
+        self.total   = 0.0
+        self._begin  = _clock()
+
+    # the clock at the start of a phase, None when timing is off
+    def start(self):
+        return _clock() if self.enabled else None
+
+#----------------------------------------------------------------------------------------
+#Name: lap
+#
+#Description: Adds the time since start (from start or a previous lap) to phase
+#
+#Returns: The clock now, the start of the next phase
+#----------------------------------------------------------------------------------------
+    def lap(self, phase, start):
+        if start is None:
+            return None
+
+        now = _clock()
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + now - start
+        self.calls[phase]   = self.calls.get(phase, 0) + 1
+
+        return now
+
+    # a solve is starting, the phases are counted from zero
+    def begin(self):
+        self.reset()
+
+    # a solve has finished, prints the table if there is a stream
+    def finish(self):
+        self.total = _clock() - self._begin
+        if self.enabled and self.stream is not None:
+            self.stream.write(self.table() + '\n')
+            self.stream.flush()
+
+#----------------------------------------------------------------------------------------
+#Name: summary
+#
+#Returns: A list of (phase, calls, seconds, seconds per call, fraction of the solve) for
+#         every phase that was timed, followed by the time spent outside of them (with
+#         None for its calls and seconds per call)
+#----------------------------------------------------------------------------------------
+    def summary(self):
+        total = self.total if self.total > 0 else sum(self.seconds.values())
+        names = list(self.phases) + sorted(set(self.seconds) - set(self.phases))
+
+        rows = []
+        for phase in names:
+            if self.calls.get(phase, 0) == 0:
+                continue
+            seconds = self.seconds[phase]
+            rows.append((phase, self.calls[phase], seconds, seconds/self.calls[phase],
+                         seconds/total if total > 0 else 0.0))
+
+        other = total - sum(self.seconds.values())
+        if self.total > 0 and other > 0:
+            rows.append(('other', None, other, None, other/total))
+
+        return rows
+
+    def table(self):
+        lines = ['%-18s %10s %12s %14s %7s' % ('phase', 'calls', 'seconds', 'us per call', '%'),
+                 '-'*65]
+        for phase, calls, seconds, perCall, fraction in self.summary():
+            if calls is None:
+                lines.append('%-18s %10s %12.4f %14s %6.1f%%' % (phase, '', seconds, '', 100.0*fraction))
+            else:
+                lines.append('%-18s %10d %12.4f %14.2f %6.1f%%' % (phase, calls, seconds, 1e6*perCall, 100.0*fraction))
+        lines.append('%-18s %10s %12.4f' % ('total', '', self.total))
+
+        return '\n'.join(lines)
+
+
+#----------------------------------------------------------------------------------------
+#Name: getTimer
+#
+#Returns: timer if it is a PhaseTimer, a timer printing to stdout if it is True, or a
+#         disabled timer otherwise, unless DNACC_PROFILE asks for every solve to be timed
+#----------------------------------------------------------------------------------------
+def getTimer(timer = None):
+    if isinstance(timer, PhaseTimer):
+        return timer
+    if timer or (timer is None and os.environ.get('DNACC_PROFILE', '0') not in ('', '0')):
+        return PhaseTimer(True, sys.stdout)
+
+    return PhaseTimer(False)
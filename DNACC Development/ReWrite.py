@@ -19,6 +19,8 @@ import scipy as sci
 import math as m
 import time
 from decimal import *
+from ResultStore import ResultStore
+from Telemetry import Telemetry
 
 
 
@@ -127,8 +129,7 @@ phia[phia <= 0.0]  = 0.0000001
 
 
 print phia
-divergence          = []
-step                = []
+telemetry           = Telemetry(every = 10, logFile = 'test.telemetry')    # watch it with Telemetry.readLog
 percentDeviation    = []
 devtot = 100.0*np.ones(5)
 count  = 0
@@ -171,14 +172,12 @@ for j in xrange(number_of_iterations):
     if (perdev < perc and count > 10):
         mixParameter = bigmix        # Try a big step
         count   = 0
-        print  devtot[0]
     else: 
         mixParameter = smallmix      # Stick with small step.
         count   = count+1
         #print phia
     #print(g, devtot[0], perdev)   
-    step.append(g)
-    divergence.append(devtot[0])
+    telemetry.record(g, 0, devtot[0], mixParameter, incompresiblity)
     g= g +1
 
     if abs(devtot[0]) < tolerence:
@@ -193,6 +192,11 @@ for j in xrange(number_of_iterations):
     phia[phia >= 0.99]  = 0.9999
     phia[phia <= 0.01]  = 0.0001
 
+telemetry.close()
+history    = telemetry.history()
+step       = history['iteration']
+divergence = history['residual']
+
 #plot plot plot, we will plot
 
 
@@ -225,10 +229,12 @@ phianew = np.sum(np.sum(phia))/(number_of_lattice_pointsY*number_of_lattice_poin
 phibnew = np.sum(np.sum(phib))/(number_of_lattice_pointsY*number_of_lattice_pointsX)
 
 
-print divergence[-1], phianew, phibnew
+print devtot[0], phianew, phibnew
 
 if flag == 0:
-    np.savetxt('test.txt',phia)
+    parameters = {'A1': A1, 'A2': A2, 'length': length, 'gamma': gamma, 'alphaA': alphaA, 'alphaB': alphaB,
+                  'volumeFractionA': volumeFractionA, 'incompresiblity': incompresiblity}
+    ResultStore('.').save('test', [phia, phib], parameters, flag, devtot[0], g, divergence, FreeEnergyMicro)
 
 fig1 = plt.figure(1)
 phia_plt = plt.contourf(xxs, yys, phia)
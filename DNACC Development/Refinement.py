@@ -0,0 +1,129 @@
+#------------------------------------------------------------
+# Name: Refinement.py
+#
+# Description: Spectral resampling of periodic grids, for solving coarse to
+#              fine. A solve at 128^3 or 256x256 that starts from noise
+#              spends most of its iterations growing the morphology out of
+#              it, which a grid with a fraction of the points does just as
+#              well. The converged densities of the coarse grid are carried
+#              to the finer one by zero padding their spectrum, which is
+#              exact for everything the coarse grid resolves, and the finer
+#              solve only has to polish them (see Solver levels in dnacc.py).
+#
+#              The same routine truncates a spectrum to move to a coarser
+#              grid, which is how the potentials of the coarse levels and
+#              their initial densities are made from the fine ones.
+#------------------------------------------------------------
+
+import numpy as np
+
+from FFTBackend import getBackend
+
+
+#----------------------------------------------------------------------------------------
+#Name: resampleSpectrum
+#
+#Description: Moves an rfftn spectrum over the given axes (the last of them the halved
+#             one) from a grid of shape gridShape to one of shape newShape, keeping every
+#             frequency both grids hold. Going to a finer grid the rest is zero; the
+#             Nyquist coefficient of an even axis is split between the two frequencies
+#             it stands for. Going to a coarser grid the coefficients of the dropped
+#             frequencies are left out, except those at plus and minus the new Nyquist
+#             frequency, which alias onto it and are added up.
+#
+#Returns: The spectrum on the new grid
+#----------------------------------------------------------------------------------------
+def resampleSpectrum(spectrum, gridShape, newShape, axes):
+    gridShape, newShape = tuple(gridShape), tuple(newShape)
+    axes = [axis % spectrum.ndim for axis in axes]
+
+    # the halved axis first, its aliases are mirror images over all the other axes
+    spectrum = _resampleHalfAxis(spectrum, gridShape[-1], newShape[-1], axes)
+    for axis, size, newSize in zip(axes[:-1], gridShape[:-1], newShape[:-1]):
+        spectrum = _resampleAxis(spectrum, size, newSize, axis)
+
+    return spectrum
+
+
+# a full frequency axis of length size, 0, 1, ..., -2, -1
+def _resampleAxis(spectrum, size, newSize, axis):
+    if size == newSize:
+        return spectrum
+
+    def index(start, stop):
+        return tuple(slice(start, stop) if a == axis else slice(None) for a in range(spectrum.ndim))
+
+    shape       = list(spectrum.shape)
+    shape[axis] = newSize
+    resampled   = np.zeros(shape, dtype = spectrum.dtype)
+
+    common   = min(size, newSize)
+    positive = (common + 1)//2          # frequencies 0 .. positive - 1
+    negative = common//2                # frequencies -negative .. -1
+    resampled[index(0, positive)] = spectrum[index(0, positive)]
+    resampled[index(newSize - negative, newSize)] = spectrum[index(size - negative, size)]
+
+    if common % 2 == 0 and newSize > size:
+        nyquist = 0.5*spectrum[index(size//2, size//2 + 1)]
+        resampled[index(newSize - size//2, newSize - size//2 + 1)] = nyquist
+        resampled[index(size//2, size//2 + 1)]                     = nyquist
+    elif common % 2 == 0:
+        resampled[index(newSize//2, newSize//2 + 1)] = (spectrum[index(newSize//2, newSize//2 + 1)] +
+                                                        spectrum[index(size - newSize//2, size - newSize//2 + 1)])
+
+    return resampled
+
+
+# the halved axis of an rfftn spectrum, of a grid axis of length size
+def _resampleHalfAxis(spectrum, size, newSize, axes):
+    if size == newSize:
+        return spectrum
+
+    axis = axes[-1]
+
+    def index(start, stop):
+        return tuple(slice(start, stop) if a == axis else slice(None) for a in range(spectrum.ndim))
+
+    shape       = list(spectrum.shape)
+    shape[axis] = newSize//2 + 1
+    resampled   = np.zeros(shape, dtype = spectrum.dtype)
+
+    common = min(size, newSize)
+    resampled[index(0, common//2 + 1)] = spectrum[index(0, common//2 + 1)]
+
+    if common % 2 == 0 and newSize > size:
+        resampled[index(size//2, size//2 + 1)] *= 0.5
+    elif common % 2 == 0:
+        # the coefficient at -newSize/2 is the complex conjugate of the one at +newSize/2
+        # with every other frequency negated
+        mirror = np.conj(spectrum[index(newSize//2, newSize//2 + 1)])
+        others = tuple(axes[:-1])
+        if others:
+            mirror = np.roll(np.flip(mirror, others), 1, others)
+        resampled[index(newSize//2, newSize//2 + 1)] += mirror
+
+    return resampled
+
+
+#----------------------------------------------------------------------------------------
+#Name: resample
+#
+#Description: Spectral interpolation of the real array values, whose trailing axes hold a
+#             periodic grid, onto a grid of shape newShape over the same box. Every Fourier
+#             mode the two grids share is kept, so the values keep their average and a
+#             smooth field comes back unchanged when it is refined and coarsened again.
+#
+#Returns: The array with its grid axes resampled
+#----------------------------------------------------------------------------------------
+def resample(values, newShape, fft = None):
+    values    = np.asarray(values)
+    newShape  = tuple(int(n) for n in newShape)
+    gridShape = values.shape[values.ndim - len(newShape):]
+    if gridShape == newShape:
+        return values.copy()
+
+    fft      = getBackend(fft)
+    axes     = tuple(range(values.ndim - len(newShape), values.ndim))
+    spectrum = resampleSpectrum(fft.rfftn(values, axes), gridShape, newShape, axes)
+
+    return (float(np.prod(newShape))/np.prod(gridShape))*fft.irfftn(spectrum, newShape, axes)
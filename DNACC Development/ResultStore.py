@@ -0,0 +1,181 @@
+#------------------------------------------------------------
+# Name: ResultStore.py
+#
+# Description: Binary storage of the solutions, replacing the np.savetxt
+#              text files. A result is kept under a key such as
+#              "Output0/1_2_0_1" as <key>.npz, holding the densities of all
+#              the species (2D or 3D, phia, phib, phic, ...) together with the
+#              parameters, the convergence flag, deviation, number of
+#              iterations, deviation history and free energy, so a single
+#              file says everything about the run. Nothing is pickled, the
+#              parameters are kept as JSON.
+#
+#              The densities are compressed by default. A store created with
+#              compressed = False keeps them in a separate <key>.npy instead,
+#              which analysis code can memory map rather than read.
+#------------------------------------------------------------
+
+import os
+import json
+import tempfile
+
+import numpy as np
+
+import dnacc
+from Checkpoint import replaceFile
+
+
+# names of the density fields, in species order
+speciesNames = ['phia', 'phib', 'phic', 'phid', 'phie', 'phif']
+
+
+class ResultStore(object):
+
+#----------------------------------------------------------------------------------------
+#Name: __init__
+#
+#Description: directory is the root of the store, created when the first result is saved
+#----------------------------------------------------------------------------------------
+    def __init__(self, directory, compressed = True):
+        self.directory  = directory
+        self.compressed = compressed
+
+    def fileName(self, key, extension = '.npz'):
+        return os.path.join(self.directory, key + extension)
+
+    def __contains__(self, key):
+        return os.path.exists(self.fileName(key))
+
+#----------------------------------------------------------------------------------------
+#Name: keys
+#
+#Returns: The sorted keys of every result in the store
+#----------------------------------------------------------------------------------------
+    def keys(self):
+        keys = []
+        for path, directories, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.npz'):
+                    key = os.path.relpath(os.path.join(path, name[:-len('.npz')]), self.directory)
+                    keys.append(key.replace(os.sep, '/'))
+
+        return sorted(keys)
+
+#----------------------------------------------------------------------------------------
+#Name: save
+#
+#Description: densities is an array [species, *grid]; pass [phia] to keep the first
+#             species only. Any of the other values can be left out.
+#
+#Returns: The name of the file written
+#----------------------------------------------------------------------------------------
+    def save(self, key, densities, parameters = None, flag = None, deviation = None, iterations = None,
+             divergence = None, freeEnergy = None):
+
+        densities = np.asarray(densities, dtype = float)
+
+        values = {'species':    np.array(speciesNames[:len(densities)]),
+                  'parameters': np.array(json.dumps(parameters or {}, sort_keys = True)),
+                  'divergence': np.asarray(divergence if divergence is not None else [], dtype = float)}
+        for name, value in [('flag', flag), ('deviation', deviation), ('iterations', iterations),
+                            ('freeEnergy', freeEnergy)]:
+            if value is not None:
+                values[name] = np.array(value)
+
+        if self.compressed:
+            values['densities'] = densities
+        else:
+            self._write(self.fileName(key, '.npy'), lambda handle: np.save(handle, densities))
+
+        save = np.savez_compressed if self.compressed else np.savez
+        self._write(self.fileName(key), lambda handle: save(handle, **values))
+
+        return self.fileName(key)
+
+    def saveResult(self, key, result, parameters = None):
+        return self.save(key, result.densities, parameters, result.flag, result.deviation, result.iterations,
+                         result.divergence, result.freeEnergy)
+
+#----------------------------------------------------------------------------------------
+#Name: densities
+#
+#Description: With mmap the densities of an uncompressed store are memory mapped read
+#             only; compressed densities always have to be read in full.
+#
+#Returns: The array [species, *grid] of the densities saved under key
+#----------------------------------------------------------------------------------------
+    def densities(self, key, mmap = False):
+        if os.path.exists(self.fileName(key, '.npy')):
+            return np.load(self.fileName(key, '.npy'), mmap_mode = 'r' if mmap else None)
+
+        with np.load(self.fileName(key)) as stored:
+            return stored['densities']
+
+#----------------------------------------------------------------------------------------
+#Name: metadata
+#
+#Returns: A dictionary with everything saved under key except the densities
+#----------------------------------------------------------------------------------------
+    def metadata(self, key):
+        with np.load(self.fileName(key)) as stored:
+            metadata = dict((name, stored[name]) for name in stored.files if name != 'densities')
+
+        metadata['parameters'] = json.loads(str(metadata['parameters']))
+        metadata['species']    = [str(name) for name in metadata['species']]
+        for name in ('flag', 'deviation', 'iterations', 'freeEnergy'):
+            if name in metadata:
+                metadata[name] = metadata[name].item()
+
+        return metadata
+
+#----------------------------------------------------------------------------------------
+#Name: load
+#
+#Returns: The dnacc.Result saved under key and its parameters
+#----------------------------------------------------------------------------------------
+    def load(self, key, mmap = False):
+        metadata = self.metadata(key)
+        result   = dnacc.Result(self.densities(key, mmap), metadata.get('flag'), metadata.get('deviation'),
+                                metadata.get('iterations'), metadata['divergence'], metadata.get('freeEnergy'))
+
+        return result, metadata['parameters']
+
+    # write to a temporary file first so a killed run never leaves half a result behind
+    def _write(self, fileName, write):
+        directory = os.path.dirname(fileName)
+        if not os.path.exists(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                pass   # made by another process in the meantime
+
+        handle, temporaryName = tempfile.mkstemp(suffix = '.tmp', dir = directory)
+        with os.fdopen(handle, 'wb') as temporaryFile:
+            write(temporaryFile)
+
+        # mkstemp makes the file private, give it the permissions of any other new file
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temporaryName, 0o666 & ~umask)
+        replaceFile(temporaryName, fileName)
+
+
+#----------------------------------------------------------------------------------------
+#Name: loadDensity
+#
+#Description: Reads an initial condition or a saved solution from a .npz result, a .npy
+#             array or a text file such as dots.txt. .npy files are memory mapped.
+#
+#Returns: The density array; [species, *grid] for results
+#----------------------------------------------------------------------------------------
+def loadDensity(fileName):
+    if fileName.endswith('.npz'):
+        with np.load(fileName) as stored:
+            if 'densities' in stored.files:
+                return stored['densities']
+        return np.load(fileName[:-len('.npz')] + '.npy')
+
+    if fileName.endswith('.npy'):
+        return np.load(fileName, mmap_mode = 'r')
+
+    return np.loadtxt(fileName)
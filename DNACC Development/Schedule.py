@@ -0,0 +1,253 @@
+#------------------------------------------------------------
+# Name: Schedule.py
+#
+# Description: Incompressibility continuation of the fixed point solvers. The
+#              solvers used to run a fixed list of stages, kappa = 10, 100,
+#              1000 with hand picked mixing parameters, each to the final
+#              tolerance or to numberOfIterations. A schedule hands a solver
+#              the kappa and mixing parameter of every stage, the tolerance a
+#              stage is left at and the stage that comes after it, and keeps a
+#              record of the iterations and time each stage took.
+#
+#              FixedSchedule is the old behaviour. AdaptiveSchedule picks the
+#              mixing parameter of every stage from the stability limit of the
+#              Picard iteration at its kappa (see stableMix); the 0.01 of the
+#              first, most expensive, stage was a quarter of what it can take.
+#              It leaves a stage before the last as soon as its residual stops
+#              falling instead of running it into numberOfIterations, and raises
+#              kappa by more after a quick stage and by less after a slow one.
+#------------------------------------------------------------
+
+import numpy as np
+
+
+class FixedSchedule(object):
+
+#----------------------------------------------------------------------------------------
+#Name: __init__
+#
+#Description: One stage per entry of kappas, with the matching entry of mixes (the last
+#             one for all the stages beyond it), each converged to the full tolerance.
+#----------------------------------------------------------------------------------------
+    def __init__(self, kappas, mixes = (0.01,)):
+        self.kappas = [float(kappa) for kappa in np.atleast_1d(kappas)]
+        self.mixes  = [float(mix) for mix in np.atleast_1d(mixes)]
+        self.reset()
+
+    # a solve is starting
+    def reset(self):
+        self.records = []
+
+    # the solver hands over its System and the final kappa of its method
+    def prepare(self, system, target):
+        pass
+
+    @property
+    def target(self):
+        return self.kappas[-1]
+
+    def kappa(self, stage):
+        return self.kappas[stage]
+
+    def mix(self, stage):
+        return self.mixes[min(stage, len(self.mixes) - 1)]
+
+    def isLast(self, stage):
+        return stage == len(self.kappas) - 1
+
+    # True once the deviation of an iteration of the stage is good enough to leave it
+    def converged(self, stage, deviation, tolerance):
+        return abs(deviation) < tolerance
+
+#----------------------------------------------------------------------------------------
+#Name: finish
+#
+#Description: Records that a stage took iterations iterations and seconds seconds and
+#             ended at deviation. mix is the mixing parameter it used.
+#
+#Returns: The next stage, None after the last
+#----------------------------------------------------------------------------------------
+    def finish(self, stage, iterations, seconds, deviation, mix):
+        self.records.append((stage, self.kappa(stage), mix, iterations, seconds, deviation))
+
+        return self._next(stage, iterations)
+
+    def _next(self, stage, iterations):
+        return None if self.isLast(stage) else stage + 1
+
+#----------------------------------------------------------------------------------------
+#Name: stages
+#
+#Returns: A dictionary per finished stage (stage, kappa, mixParameter, iterations,
+#         seconds, deviation), for the Result of a solve
+#----------------------------------------------------------------------------------------
+    def stages(self):
+        names = ('stage', 'kappa', 'mixParameter', 'iterations', 'seconds', 'deviation')
+
+        return [dict(zip(names, (int(r[0]), float(r[1]), float(r[2]), int(r[3]), float(r[4]), float(r[5]))))
+                for r in self.records]
+
+#----------------------------------------------------------------------------------------
+#Name: state
+#
+#Description: The records (and the kappas of an adaptive schedule) as arrays, for
+#             checkpoints. setState puts them back.
+#----------------------------------------------------------------------------------------
+    def state(self):
+        return {'records': np.array(self.records, dtype = float).reshape(-1, 6)}
+
+    def setState(self, state):
+        self.records = [tuple(record) for record in np.asarray(state['records'])]
+
+
+
+
+class AdaptiveSchedule(FixedSchedule):
+
+#----------------------------------------------------------------------------------------
+#Name: __init__
+#
+#Description: The stages run from kappa = start up to target (by default the final kappa
+#             of the method, 1000 for SCFT and 100/alphaA for the DFT like equations).
+#             The mixing parameter of a stage is safety times stableMix at its kappa. A
+#             stage before the last is left once its deviation is below stageFactor times
+#             the tolerance, or when it has not fallen below stallFactor times what it was
+#             stallWindow iterations before. Each kappa is growth times the one before;
+#             after the first stage, which starts from the initial densities, a stage
+#             that took at most fastStage iterations doubles growth (up to
+#             maximumGrowth) and one that took slowStage or more halves it (down to
+#             minimumGrowth).
+#----------------------------------------------------------------------------------------
+    def __init__(self, start = 10.0, target = None, growth = 10.0, safety = 0.5, stageFactor = 1.0,
+                 stallWindow = 3000, stallFactor = 0.9, fastStage = 200, slowStage = 5000,
+                 minimumGrowth = 2.0, maximumGrowth = 100.0):
+        self.start         = float(start)
+        self.targetKappa   = None if target is None else float(target)
+        self.initialGrowth = float(growth)
+        self.safety        = safety
+        self.stageFactor   = stageFactor
+        self.stallWindow   = stallWindow
+        self.stallFactor   = stallFactor
+        self.fastStage     = fastStage
+        self.slowStage     = slowStage
+        self.minimumGrowth = minimumGrowth
+        self.maximumGrowth = maximumGrowth
+        self.system        = None
+        self._mixes        = {}
+        self.reset()
+
+    def reset(self):
+        self.records = []
+        self.growth  = self.initialGrowth
+        self.kappas  = [] if self.targetKappa is None else [min(self.start, self.targetKappa)]
+        self._resetStall()
+
+    # the deviation and iteration count the stall check of the stage compares against
+    def _resetStall(self):
+        self._count     = 0
+        self._reference = np.inf
+
+    def prepare(self, system, target):
+        self.system = system
+        self._mixes = {}
+        if self.targetKappa is None:
+            self.targetKappa = float(target)
+            self.reset()
+
+    @property
+    def target(self):
+        return self.targetKappa
+
+    def mix(self, stage):
+        kappa = self.kappas[stage]
+        if kappa not in self._mixes:
+            self._mixes[kappa] = self.safety*stableMix(self.system, kappa)
+
+        return self._mixes[kappa]
+
+    def isLast(self, stage):
+        return self.kappas[stage] >= self.targetKappa
+
+    def converged(self, stage, deviation, tolerance):
+        if self.isLast(stage):
+            return abs(deviation) < tolerance
+        if abs(deviation) < self.stageFactor*tolerance:
+            return True
+
+        self._count += 1
+        if self._count < self.stallWindow:
+            return False
+
+        stalled         = abs(deviation) > self.stallFactor*self._reference
+        self._count     = 0
+        self._reference = abs(deviation)
+
+        return stalled
+
+    def _next(self, stage, iterations):
+        self._resetStall()
+        if self.isLast(stage):
+            return None
+
+        if stage > 0 and iterations <= self.fastStage:
+            self.growth = min(2.0*self.growth, self.maximumGrowth)
+        elif stage > 0 and iterations >= self.slowStage:
+            self.growth = max(0.5*self.growth, self.minimumGrowth)
+
+        del self.kappas[stage + 1:]
+        self.kappas.append(min(self.growth*self.kappas[stage], self.targetKappa))
+
+        return stage + 1
+
+    def state(self):
+        state = FixedSchedule.state(self)
+        state['kappas']    = np.array(self.kappas)
+        state['growth']    = self.growth
+        state['count']     = self._count
+        state['reference'] = self._reference
+
+        return state
+
+    def setState(self, state):
+        FixedSchedule.setState(self, state)
+        self.kappas     = [float(kappa) for kappa in state['kappas']]
+        self.growth     = float(state['growth'])
+        self._count     = int(state['count'])
+        self._reference = float(state['reference'])
+
+
+#----------------------------------------------------------------------------------------
+#Name: stableMix
+#
+#Description: The largest mixing parameter for which the Picard iteration of the SCFT
+#             equations of system is stable at incompressibility kappa. Linearised, the
+#             update of a density i changes by -alpha_i phi_i times the change of its
+#             field, which at wave vector k is sum_j (volume V_ij(k) + kappa) times the
+#             change of density j. With phi_i at most one, the largest eigenvalue g of
+#             alpha^(1/2) (volume V(k) + kappa) alpha^(1/2) over all k except k = 0 (the
+#             normalisation fixes the average) bounds the gain of the iteration, which is
+#             stable for mixing parameters below 2/(1 + g).
+#
+#Returns: The mixing parameter
+#----------------------------------------------------------------------------------------
+def stableMix(system, kappa):
+    n         = system.numberOfSpecies
+    root      = np.sqrt(system.alphas)
+    couplings = system.volume*np.moveaxis(system.fourierPotentials.real, (0, 1), (-2, -1)).reshape(-1, n, n)[1:] + kappa
+    gain      = np.max(np.linalg.eigvalsh(root[:, np.newaxis]*couplings*root))
+
+    return 2.0/(1.0 + max(gain, 0.0))
+
+
+#----------------------------------------------------------------------------------------
+#Name: formatStages
+#
+#Returns: A table of the stages of a Result, one line per stage
+#----------------------------------------------------------------------------------------
+def formatStages(stages):
+    lines = ['%5s %10s %12s %10s %10s %12s' % ('stage', 'kappa', 'mix', 'iterations', 'seconds', 'deviation')]
+    for stage in stages:
+        lines.append('%5d %10.4g %12.4g %10d %10.3f %12.4g' % (stage['stage'], stage['kappa'], stage['mixParameter'],
+                                                             stage['iterations'], stage['seconds'], stage['deviation']))
+
+    return '\n'.join(lines)
@@ -0,0 +1,104 @@
+#------------------------------------------------------------
+# Name: Stability.py
+#
+# Description: Whether a converged state is one the Picard iteration would
+#              stay on. Anderson mixing and Newton-Krylov converge on any
+#              zero of the residual, saddle points of the free energy
+#              included, while the Picard step runs downhill and leaves a
+#              saddle along its unstable direction. Started from the same
+#              densities the accelerated solves can so report a converged
+#              state of higher free energy than Picard finds.
+#
+#              The unstable direction is the leading eigenvector of the
+#              Jacobian of the residual, found with a few products of a
+#              finite difference Jacobian with a vector (ARPACK), so the
+#              check costs about as much as a few dozen iterations. A
+#              saddle is left by a line search on the free energy along it.
+#------------------------------------------------------------
+
+import numpy as np
+from scipy.sparse.linalg import LinearOperator, eigs
+
+
+#----------------------------------------------------------------------------------------
+#Name: leadingEigenpair
+#
+#Description: residual(x) returns the Picard direction G(x) - x (or the DFT like
+#             residual) with the shape of x. The Jacobian of residual at x is applied by
+#             a forward difference of relative size step. The slow modes of a converged
+#             state crowd the eigenvalues near zero, which a Krylov basis of basisSize
+#             vectors gets past in far fewer products than the ARPACK default.
+#
+#Returns: The eigenvalue of the Jacobian with the largest real part and its eigenvector,
+#         real parts only, the eigenvector with the shape of x and its largest entry 1
+#----------------------------------------------------------------------------------------
+def leadingEigenpair(residual, x, step = 1e-7, tolerance = 1e-2, basisSize = 30):
+    x     = np.asarray(x, dtype = float)
+    shape = x.shape
+    F     = np.ravel(residual(x))
+    h     = step*max(np.max(np.abs(x)), 1.0)
+
+    J = LinearOperator((x.size, x.size), dtype = float,
+                       matvec = lambda v: (np.ravel(residual(x + h*np.reshape(v, shape))) - F)/h)
+
+    values, vectors = eigs(J, k = 1, which = 'LR', tol = tolerance, ncv = min(basisSize, x.size - 1))
+    vector = np.reshape(vectors[:, 0].real, shape)
+
+    return float(values[0].real), vector/np.max(np.abs(vector))
+
+
+#----------------------------------------------------------------------------------------
+#Name: picardLeaves
+#
+#Description: True if x is a state the Picard iteration x + stepSize*residual(x) would
+#             leave within numberOfIterations steps: the leading eigenvalue of the
+#             Jacobian makes a perturbation grow by more than a factor e over them, and
+#             the free energy falls along the eigenvector, i.e. x is a saddle point.
+#             freeEnergy(x) is the free energy of x, which is compared with that of x
+#             moved a short way along the eigenvector either side, well inside (0, 1).
+#
+#Returns: True or False, the leading eigenvalue and its eigenvector
+#----------------------------------------------------------------------------------------
+def picardLeaves(residual, freeEnergy, x, stepSize, numberOfIterations):
+    eigenvalue, vector = leadingEigenpair(residual, x)
+    if eigenvalue*stepSize*numberOfIterations < 1.0:
+        return False, eigenvalue, vector
+
+    size      = 0.01*min(np.min(x), np.min(1.0 - x))
+    curvature = freeEnergy(x + size*vector) + freeEnergy(x - size*vector) - 2.0*freeEnergy(x)
+
+    return bool(curvature < 0.0), eigenvalue, vector
+
+
+#----------------------------------------------------------------------------------------
+#Name: leaveSaddle
+#
+#Description: Moves the saddle point x downhill along direction (the eigenvector of
+#             picardLeaves), either way: the step starts as short as the one picardLeaves
+#             tried and doubles while the free energy keeps falling. Every entry moves at
+#             most half way to 0 or 1, so the densities stay inside (0, 1) however long
+#             the step, and the search ends once that holds every entry back.
+#
+#Returns: The densities of the lower of the two ends, or x if the free energy rises
+#         both ways
+#----------------------------------------------------------------------------------------
+def leaveSaddle(freeEnergy, x, direction):
+    lower, upper = 0.5*x, 0.5*(1.0 + x)
+    start        = 0.01*min(np.min(x), np.min(1.0 - x))
+
+    best, bestEnergy = x, freeEnergy(x)
+    for sign in (1.0, -1.0):
+        moved, energy = x, freeEnergy(x)
+        size = start
+        while size <= 2.0:
+            trial       = np.clip(x + sign*size*direction, lower, upper)
+            trialEnergy = freeEnergy(trial)
+            if not trialEnergy < energy:
+                break
+            moved, energy = trial, trialEnergy
+            size *= 2.0
+
+        if energy < bestEnergy:
+            best, bestEnergy = moved, energy
+
+    return best
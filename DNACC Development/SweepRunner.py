@@ -0,0 +1,502 @@
+#------------------------------------------------------------
+# Name: SweepRunner.py
+#
+# Description: Runs a parameter sweep on a pool of worker processes. The
+#              (A1, A2, length, gamma, alpha) grid is expanded into points,
+#              the points are handed to the workers one at a time and the
+#              state of every point is kept in a JSON manifest that is
+#              rewritten after each point finishes. Starting the same sweep
+#              again skips the points that already finished and reruns the
+#              ones that failed or had not finished when the job died.
+#
+#              Every worker is limited to one BLAS / FFT thread so that N
+#              workers use N cores instead of fighting over them. A worker that
+#              dies in the middle of a point (killed by the OOM killer or a
+#              signal) has that point recorded as failed, and the sweep goes on.
+#
+#              Converged solutions are written to a ResultStore under the keys
+#              Output<t>/i_j_k_l (OutputSCFT<t>/ for SCFT), the layout
+#              searchParameters.py uses.
+#
+#              With --abort a point whose solve goes NaN, blows up or stagnates is
+#              stopped as soon as that is clear (see Divergence.py), which frees
+#              its worker for the next point, and is recorded as aborted with the
+#              reason. Without it every point runs as in the drivers.
+#
+#              The iterations and seconds of every incompressibility stage of a
+#              point are kept in the manifest, and --adaptive-stages replaces the
+#              fixed stages by a Schedule.AdaptiveSchedule.
+#
+#              With continuation the points are walked along a nearest
+#              neighbour path through parameter space and every solve starts
+#              from the converged density of the closest point solved so far,
+#              instead of from dots.txt.
+#
+#              python SweepRunner.py --method DFT --workers 8 --continuation
+#------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import multiprocessing
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# written straight to its pipe, without the feeder thread of a Queue whose buffered items
+# die with a killed worker
+try:
+    from multiprocessing import SimpleQueue
+except ImportError:
+    from multiprocessing.queues import SimpleQueue
+
+import numpy as np
+
+import dnacc
+import FFTBackend
+from Schedule import AdaptiveSchedule
+from ResultStore import ResultStore, loadDensity
+
+
+# thread pools that are sized from the environment when they start
+threadVariables = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                   'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS', 'DNACC_FFT_WORKERS']
+
+# solver settings of the sweep drivers (ParticlesFunction.Particles2D and
+# ParticlesFunctionSCFT.Particles2SCFT)
+defaultSettings = {
+    'DFT':  dict(numberOfIterations = 30000, tolerance = 1e-4, smallmix = 0.01, bigmix = 0.1,
+                 perc = 0.1, bigStepCount = 1000),
+    'SCFT': dict(incompressibility = [10, 100, 900], mixParameter = [0.01, 0.005, 0.0005],
+                 numberOfIterations = 30000, tolerance = 1e-4),
+}
+
+# a point with one of these states is not solved again
+finishedStates = ('converged', 'unconverged', 'aborted')
+
+# seconds between the checks for workers that died
+pollInterval = 1.0
+
+
+#----------------------------------------------------------------------------------------
+#Name: parameterGrid
+#
+#Description: Expands one level of a sweep, every combination of the given A1, A2, length
+#             and gamma values at a single alpha, into a list of points. A point is a
+#             dictionary holding the parameters, the level and the indices (i, j, k, l)
+#             of the values in their lists.
+#----------------------------------------------------------------------------------------
+def parameterGrid(A1List, A2List, lengthList, gammaList, alpha, level = 0):
+    points = []
+    for i, A1 in enumerate(A1List):
+        for j, A2 in enumerate(A2List):
+            for k, length in enumerate(lengthList):
+                for l, gamma in enumerate(gammaList):
+                    points.append({'level': level, 'indices': [i, j, k, l], 'alpha': float(alpha),
+                                   'A1': float(A1), 'A2': float(A2), 'length': float(length), 'gamma': float(gamma)})
+
+    return points
+
+
+#----------------------------------------------------------------------------------------
+#Name: searchParameterGrid
+#
+#Description: The grid of searchParameters.py, six alpha levels of 3^4 points each
+#----------------------------------------------------------------------------------------
+def searchParameterGrid(numberOfParameters = 3):
+    alphaA = [1, 0.1, 0.01, 0.001, 0.0001, 0.00001, 0.000001]
+
+    A1  = [0.9, 0.4, 0.2, 0.15, 0.1, 0.08]
+    A2  = [0.2, 0.17, 0.13, 0.09, 0.07, 0.03]
+    dA1 = [0.1, 0.01, 0.01, 0.01, 0.01, 0.01]
+    dA2 = [0.1, 0.01, 0.01, 0.01, 0.01, 0.01]
+
+    length  = 1.9
+    gamma   = 0.4
+    dlength = 0.1
+    dgamma  = 0.1
+
+    points = []
+    for t in range(len(A1)):
+        points += parameterGrid([i*dA1[t] + A1[t] for i in range(numberOfParameters)],
+                                [i*dA2[t] + A2[t] for i in range(numberOfParameters)],
+                                [i*dlength + length for i in range(numberOfParameters)],
+                                [i*dgamma + gamma for i in range(numberOfParameters)],
+                                alphaA[t], t)
+
+    return points
+
+
+def pointKey(point):
+    return str(point['level']) + '/' + '_'.join(str(index) for index in point['indices'])
+
+
+#----------------------------------------------------------------------------------------
+#Name: parameterCoordinates
+#
+#Description: The position of every point in (A1, A2, length, gamma, log10 alpha) space,
+#             with each axis divided by its spread so that no parameter dominates the
+#             distances. alpha goes on a log scale since the sweeps step it by decades.
+#
+#Returns: An array [number of points, 5]
+#----------------------------------------------------------------------------------------
+def parameterCoordinates(points):
+    coordinates = np.array([[point['A1'], point['A2'], point['length'], point['gamma'], np.log10(point['alpha'])]
+                            for point in points], dtype = float)
+
+    spread = np.ptp(coordinates, axis = 0)
+    spread[spread == 0] = 1.0
+
+    return coordinates/spread
+
+
+#----------------------------------------------------------------------------------------
+#Name: continuationOrder
+#
+#Description: Orders the points into a path that always steps to the closest point not
+#             visited yet, starting from the first point in the list (for the search grid
+#             that is alpha = 1, where the solver converges from any initial condition).
+#----------------------------------------------------------------------------------------
+def continuationOrder(points):
+    if len(points) == 0:
+        return []
+
+    coordinates = parameterCoordinates(points)
+    visited     = np.zeros(len(points), dtype = bool)
+    order       = [0]
+    visited[0]  = True
+
+    for n in range(1, len(points)):
+        distances = np.sum((coordinates - coordinates[order[-1]])**2, axis = 1)
+        distances[visited] = np.inf
+        order.append(int(np.argmin(distances)))
+        visited[order[-1]] = True
+
+    return [points[index] for index in order]
+
+
+#----------------------------------------------------------------------------------------
+#Name: nearestSolved
+#
+#Description: solved maps the keys of the converged points to their entries.
+#
+#Returns: The key of the solved point closest to point, or None if nothing is solved yet
+#----------------------------------------------------------------------------------------
+def nearestSolved(point, solved):
+    if len(solved) == 0:
+        return None
+
+    keys        = list(solved)
+    coordinates = parameterCoordinates([point] + [solved[key] for key in keys])
+    distances   = np.sum((coordinates[1:] - coordinates[0])**2, axis = 1)
+
+    return keys[int(np.argmin(distances))]
+
+
+def outputKey(method, point):
+    prefix = 'Output' if method == 'DFT' else 'Output' + method
+
+    return prefix + str(point['level']) + '/' + '_'.join(str(index) for index in point['indices'])
+
+
+class Manifest(object):
+
+#----------------------------------------------------------------------------------------
+#Name: __init__
+#
+#Description: The record of a sweep, kept in fileName. Every point has an entry holding
+#             its parameters and its state: pending, converged, unconverged (the solver
+#             finished without reaching the tolerance), aborted (the solver was stopped
+#             early, with the Divergence.Abort in abort) or failed (the solve raised).
+#             Solved points also hold the stages of their Result.
+#             An existing manifest is read back so a restarted sweep carries on from it.
+#----------------------------------------------------------------------------------------
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.points   = {}
+
+        if os.path.exists(fileName):
+            with open(fileName) as manifestFile:
+                self.points = json.load(manifestFile)['points']
+
+    def add(self, points):
+        for point in points:
+            key = pointKey(point)
+            if key not in self.points:
+                self.points[key] = dict(point, status = 'pending')
+
+    def remaining(self):
+        return [entry for key, entry in sorted(self.points.items()) if entry['status'] not in finishedStates]
+
+    def update(self, key, **values):
+        self.points[key].update(values)
+        self.save()
+
+    def counts(self):
+        counts = {}
+        for entry in self.points.values():
+            counts[entry['status']] = counts.get(entry['status'], 0) + 1
+
+        return counts
+
+    # write to a temporary file first so a killed run never leaves half a manifest behind
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.fileName))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        handle, temporaryName = tempfile.mkstemp(suffix = '.json', dir = directory)
+        with os.fdopen(handle, 'w') as temporaryFile:
+            json.dump({'points': self.points}, temporaryFile, indent = 1, sort_keys = True)
+        os.rename(temporaryName, self.fileName)
+
+
+#----------------------------------------------------------------------------------------
+#Name: limitThreads
+#
+#Description: Restricts BLAS, OpenMP and FFT libraries of the process it runs in to one
+#             thread. The environment variables cover libraries that start their pools
+#             later, the FFT backend among them; threadpoolctl, when it is installed, also
+#             caps pools that were already started before the fork. Only called in the
+#             workers, the process running the sweep keeps its own settings.
+#----------------------------------------------------------------------------------------
+def limitThreads():
+    for variable in threadVariables:
+        os.environ[variable] = '1'
+    FFTBackend.resetDefaultBackend()
+
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+
+    threadpool_limits(1)
+
+
+# the queue a worker reports the points it starts on, see runSweep
+_started = None
+
+# the initializer of the workers
+def _startWorker(started):
+    global _started
+    _started = started
+    limitThreads()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+
+    return True
+
+
+#----------------------------------------------------------------------------------------
+#Name: _deadPoints
+#
+#Description: Takes the (key, pid) the workers reported on started into running, the
+#             worker of every point that has started.
+#
+#Returns: The keys of inFlight whose worker is gone
+#----------------------------------------------------------------------------------------
+def _deadPoints(started, running, inFlight):
+    while not started.empty():
+        key, pid = started.get()
+        running[key] = pid
+
+    return [key for key in list(inFlight) if key in running and not _alive(running[key])]
+
+
+# hands a task to the pool; an error of the pool itself (e.g. a task that cannot be pickled)
+# fails the point, where the interpreter has error_callback (Python 3)
+def _submit(pool, task, key, finished):
+    def failed(error):
+        finished.put((key, {'status': 'failed', 'error': repr(error)}, None))
+
+    try:
+        pool.apply_async(solvePoint, (task,), callback = finished.put, error_callback = failed)
+    except TypeError:
+        pool.apply_async(solvePoint, (task,), callback = finished.put)
+
+
+#----------------------------------------------------------------------------------------
+#Name: solvePoint
+#
+#Description: Solves a single sweep point. task is (point, method, settings, initial
+#             density, grid shape, box size, output directory). Runs in the workers, so
+#             every error is caught and reported back instead of killing the pool.
+#
+#Returns: The key of the point, the values to record for it in the manifest and the
+#         converged density (None if it did not converge)
+#----------------------------------------------------------------------------------------
+def solvePoint(task):
+    point, method, settings, initialDensity, gridShape, boxSize, outputDirectory = task
+    key   = pointKey(point)
+    start = time.time()
+
+    if _started is not None:
+        _started.put((key, os.getpid()))
+
+    try:
+        alphas = [point['alpha'], 1.0] if method == 'DFT' else [1.0, point['alpha']]
+        system = dnacc.System.withPairPotential(tuple(gridShape), boxSize, [0.5, 0.5], alphas,
+                                                point['A1'], point['A2'], point['length'], point['gamma'])
+        result = dnacc.Solver(system, method, **settings).solve(initialDensity)
+
+        values = {'status':     'converged' if result.flag else 'unconverged',
+                  'deviation':  float(result.deviation),
+                  'iterations': int(result.iterations),
+                  'peakMemory': result.peakMemory,
+                  'seconds':    time.time() - start,
+                  'stages':     result.stages}
+        if result.abort is not None:
+            values['status'] = 'aborted'
+            values['abort']  = result.abort.asDict()
+        if not result.flag:
+            return key, values, None
+
+        values['file']       = ResultStore(outputDirectory).saveResult(outputKey(method, point), result, point)
+        values['freeEnergy'] = float(result.freeEnergy)
+        values['contrast']   = float(np.max(result.densities[0]) - np.min(result.densities[0]))
+    except Exception as error:
+        return key, {'status': 'failed', 'error': repr(error), 'seconds': time.time() - start}, None
+
+    return key, values, result.densities[0]
+
+
+#----------------------------------------------------------------------------------------
+#Name: runSweep
+#
+#Description: Solves every point of the sweep that the manifest does not already list as
+#             finished, on numberOfWorkers processes. settings are passed on to
+#             dnacc.Solver and default to the ones the sweep drivers use.
+#
+#             Without continuation every point starts from initialDensity. With it the
+#             points are solved in continuationOrder and each one starts from the density
+#             of the nearest converged point, including the ones converged by an earlier
+#             run of the sweep. The seed of every point is recorded in the manifest.
+#
+#Returns: The Manifest
+#----------------------------------------------------------------------------------------
+def runSweep(points, initialDensity, method = 'DFT',
+             manifestFile    = 'manifest.json',
+             outputDirectory = '.',
+             numberOfWorkers = None,
+             settings        = None,
+             gridShape       = (64, 64),
+             boxSize         = 15.0,
+             continuation    = False):
+
+    if settings is None:
+        settings = defaultSettings[method]
+    if numberOfWorkers is None:
+        numberOfWorkers = multiprocessing.cpu_count()
+
+    manifest = Manifest(manifestFile)
+    manifest.add(points)
+    manifest.save()
+
+    remaining = manifest.remaining()
+    if continuation:
+        remaining = continuationOrder(remaining)
+
+    # converged densities the remaining points can start from
+    solved = dict((key, entry) for key, entry in manifest.points.items()
+                  if entry['status'] == 'converged' and os.path.exists(entry.get('file', '')))
+    densities = {}
+
+    def task(point):
+        seed = nearestSolved(point, solved) if continuation else None
+        manifest.points[pointKey(point)]['seed'] = seed or 'initial'
+        if seed is None:
+            density = initialDensity
+        else:
+            if seed not in densities:
+                densities[seed] = loadDensity(solved[seed]['file'])
+            density = densities[seed]
+
+        return (point, method, settings, density, gridShape, boxSize, outputDirectory)
+
+    started  = SimpleQueue()
+    pool     = multiprocessing.Pool(numberOfWorkers, initializer = _startWorker, initargs = (started,))
+    finished = queue.Queue()
+    running  = {}
+    lost     = False
+    try:
+        # keep one point per worker in flight so every new point can start from the latest solutions
+        inFlight = set()
+        while remaining or inFlight:
+            while remaining and len(inFlight) < numberOfWorkers:
+                point = remaining.pop(0)
+                _submit(pool, task(point), pointKey(point), finished)
+                inFlight.add(pointKey(point))
+
+            try:
+                key, values, density = finished.get(timeout = pollInterval)
+            except queue.Empty:
+                for key in _deadPoints(started, running, inFlight):
+                    finished.put((key, {'status': 'failed', 'error': 'the worker solving it died'}, None))
+                    lost = True
+                continue
+
+            # the result of a point already failed for a dead worker is still recorded
+            inFlight.discard(key)
+            running.pop(key, None)
+
+            if density is not None:
+                solved[key]    = manifest.points[key]
+                densities[key] = density
+            manifest.update(key, **values)
+            print(key + ' ' + values['status'] + (' (' + values['abort']['reason'] + ')' if 'abort' in values else ''))
+    finally:
+        # the pool waits for the result of a point whose worker died forever
+        if lost:
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+
+    return manifest
+
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(description = 'Runs the searchParameters sweep on a pool of processes.')
+    parser.add_argument('--method', default = 'DFT', choices = ['DFT', 'SCFT'])
+    parser.add_argument('--workers', type = int, default = None, help = 'number of processes (default: all cores)')
+    parser.add_argument('--manifest', default = None, help = 'manifest file (default: manifest<method>.json)')
+    parser.add_argument('--output', default = os.getcwd(), help = 'directory the Output folders go in')
+    parser.add_argument('--initial', default = 'dots.txt', help = 'initial density (.txt, .npy or a saved .npz result)')
+    parser.add_argument('--continuation', action = 'store_true',
+                        help = 'start every point from the nearest converged point instead of the initial density')
+    parser.add_argument('--precision', default = 'double', choices = ['double', 'single'],
+                        help = 'single iterates in float32 and polishes in float64, for screening sweeps')
+    parser.add_argument('--abort', action = 'store_true',
+                        help = 'stop the points that diverge or stagnate instead of running them to numberOfIterations')
+    parser.add_argument('--adaptive-stages', dest = 'adaptiveStages', action = 'store_true',
+                        help = 'let the solver pick the incompressibility stages and their mixing parameters')
+    arguments = parser.parse_args(arguments)
+
+    manifestFile = arguments.manifest or os.path.join(arguments.output, 'manifest' + arguments.method + '.json')
+
+    settings = dict(defaultSettings[arguments.method], precision = arguments.precision, abort = arguments.abort)
+    if arguments.adaptiveStages:
+        settings['incompressibility'] = AdaptiveSchedule(target = settings.get('incompressibility', [None])[-1])
+
+    manifest = runSweep(searchParameterGrid(), loadDensity(arguments.initial), arguments.method,
+                        manifestFile    = manifestFile,
+                        outputDirectory = arguments.output,
+                        numberOfWorkers = arguments.workers,
+                        settings        = settings,
+                        continuation    = arguments.continuation)
+
+    print(manifest.counts())
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,190 @@
+#------------------------------------------------------------
+# Name: Symmetry.py
+#
+# Description: Symmetry reduced solves. Candidate phases such as lamellae
+#              (stripes that only vary along one axis), cylinders (a 2D
+#              cross section extended along the third axis) or a pattern
+#              that repeats several times across the box hold far fewer
+#              independent values than the grid they are solved on, and the
+#              fixed point iterations keep that symmetry. A Symmetry says
+#              which axes the densities do not vary along and how many times
+#              they repeat along the others, so the solve can run on the
+#              reduced cell, with the potentials projected onto it, and the
+#              solution be broadcast back to the full grid. The free energy
+#              per unit volume is the same on both.
+#
+#              Solver(symmetry = 'detect') finds the symmetry of the initial
+#              densities itself, see dnacc.Solver.
+#------------------------------------------------------------
+
+import numpy as np
+
+
+class Symmetry(object):
+
+#----------------------------------------------------------------------------------------
+#Name: __init__
+#
+#Description: repeats holds one entry per grid axis: 0 if the densities do not vary along
+#             it, otherwise the number of times they repeat across the box along it (1 for
+#             no reduction).
+#----------------------------------------------------------------------------------------
+    def __init__(self, repeats):
+        self.repeats = tuple(int(m) for m in repeats)
+
+        if any(m < 0 for m in self.repeats):
+            raise ValueError("repeats must be 0 (invariant) or a positive number of repeats, got %s" % (self.repeats,))
+        if all(m == 0 for m in self.repeats):
+            raise ValueError("the densities have to vary along at least one axis")
+
+    # stripes on a grid of numberOfDimensions axes that only vary along axis
+    @classmethod
+    def lamellar(cls, numberOfDimensions, axis = 0):
+        repeats = [0]*numberOfDimensions
+        repeats[axis] = 1
+
+        return cls(repeats)
+
+    # a cross section of a 3D grid that does not vary along axis
+    @classmethod
+    def cylinder(cls, axis = -1):
+        repeats = [1, 1, 1]
+        repeats[axis] = 0
+
+        return cls(repeats)
+
+    # a cell repeated repeats[i] times along axis i
+    @classmethod
+    def unitCell(cls, repeats):
+        return cls(repeats)
+
+    def __repr__(self):
+        return 'Symmetry(%s)' % (self.repeats,)
+
+    # True if the symmetry leaves the grid as it is
+    def trivial(self):
+        return all(m == 1 for m in self.repeats)
+
+#----------------------------------------------------------------------------------------
+#Name: reducedShape
+#
+#Returns: The shape of the reduced cell of a grid of shape gridShape, without the
+#         invariant axes
+#----------------------------------------------------------------------------------------
+    def reducedShape(self, gridShape):
+        if len(gridShape) != len(self.repeats):
+            raise ValueError("the symmetry %s is for grids of %d dimensions, not %s" % (self.repeats, len(self.repeats), gridShape))
+        for n, m in zip(gridShape, self.repeats):
+            if m > 0 and n % m:
+                raise ValueError("%d repeats do not fit on an axis of %d points" % (m, n))
+
+        return tuple(n//m for n, m in zip(gridShape, self.repeats) if m > 0)
+
+#----------------------------------------------------------------------------------------
+#Name: reduce
+#
+#Description: Averages values, whose trailing axes hold the full grid, over the invariant
+#             axes and over the repeats of the cell, which leaves values that have the
+#             symmetry as they are.
+#
+#Returns: The values on the reduced cell
+#----------------------------------------------------------------------------------------
+    def reduce(self, values):
+        values, collapsed = self._cells(values)
+
+        return np.mean(values, axis = collapsed)
+
+    # values with every reduced grid axis split into its repeats and the cell (an invariant
+    # axis is all repeats), and the axes that run over the repeats
+    def _cells(self, values):
+        values    = np.asarray(values)
+        first     = values.ndim - len(self.repeats)
+        gridShape = values.shape[first:]
+        self.reducedShape(gridShape)
+
+        shape, collapsed = list(values.shape[:first]), []
+        for n, m in zip(gridShape, self.repeats):
+            collapsed.append(len(shape))
+            shape.extend([n] if m == 0 else [m, n//m])
+
+        return np.reshape(values, shape), tuple(collapsed)
+
+#----------------------------------------------------------------------------------------
+#Name: expand
+#
+#Description: Broadcasts values on the reduced cell back onto the full grid of shape
+#             gridShape.
+#
+#Returns: The values on the full grid
+#----------------------------------------------------------------------------------------
+    def expand(self, values, gridShape):
+        values = np.asarray(values)
+        first  = values.ndim - len(self.reducedShape(gridShape))
+
+        index, tiles = [slice(None)]*first, [1]*first
+        for n, m in zip(gridShape, self.repeats):
+            index.append(np.newaxis if m == 0 else slice(None))
+            tiles.append(n if m == 0 else m)
+
+        return np.tile(values[tuple(index)], tiles)
+
+#----------------------------------------------------------------------------------------
+#Name: reducePotential
+#
+#Description: The real space potentials V, whose trailing axes hold a grid with the given
+#             spacing along each axis, as seen by densities with the symmetry: summed over
+#             the repeats of the cell (the cell is periodic with its own length) and
+#             integrated over the invariant axes.
+#
+#Returns: The potentials on the reduced cell
+#----------------------------------------------------------------------------------------
+    def reducePotential(self, V, spacing):
+        V, collapsed = self._cells(V)
+        scale = np.prod([h for h, m in zip(spacing, self.repeats) if m == 0])
+
+        return scale*np.sum(V, axis = collapsed)
+
+#----------------------------------------------------------------------------------------
+#Name: detect
+#
+#Description: Finds the symmetry of densities (the [species, *grid] array), to within
+#             tolerance: the axes they do not vary along and the largest number of times
+#             they repeat along each of the others.
+#
+#Returns: A Symmetry, or None if the densities have none
+#----------------------------------------------------------------------------------------
+    @classmethod
+    def detect(cls, densities, tolerance = 1e-8):
+        densities = np.asarray(densities)
+        repeats   = []
+        for axis in range(1, densities.ndim):
+            n = densities.shape[axis]
+            if np.max(np.abs(densities - np.mean(densities, axis = axis, keepdims = True))) <= tolerance:
+                repeats.append(0)
+                continue
+
+            repeats.append(1)
+            for m in range(n, 1, -1):
+                if n % m == 0 and np.max(np.abs(densities - np.roll(densities, n//m, axis = axis))) <= tolerance:
+                    repeats[-1] = m
+                    break
+
+        if all(m == 0 for m in repeats) or all(m == 1 for m in repeats):
+            return None
+
+        return cls(repeats)
+
+
+#----------------------------------------------------------------------------------------
+#Name: screenPhases
+#
+#Description: Solves each of the named candidate initial densities with solver, which
+#             should be made with symmetry = 'detect' so that every candidate is solved on
+#             its own reduced cell.
+#
+#Returns: The (name, Result) pairs of the candidates, lowest free energy first
+#----------------------------------------------------------------------------------------
+def screenPhases(solver, candidates):
+    results = [(name, solver.solve(densities)) for name, densities in sorted(candidates.items())]
+
+    return sorted(results, key = lambda item: item[1].freeEnergy if np.isfinite(item[1].freeEnergy) else np.inf)
@@ -0,0 +1,237 @@
+#------------------------------------------------------------
+# Name: Telemetry.py
+#
+# Description: Convergence telemetry of the solvers. Instead of appending to
+#              Python lists and printing inside the iteration loop, a solver
+#              hands every step to a Telemetry object, which keeps one record
+#              in every "every" steps: the residual, the mixing parameter, the
+#              incompressibility stage and kappa, the free energy (only
+#              computed when asked for, it costs an FFT) and the wall time.
+#
+#              Records go into a ring buffer of NumPy records that grows up to
+#              a fixed size (or without bound, with capacity = None), can be
+#              passed to a callback as they arrive and can be streamed to a
+#              compact binary log file, which readLog turns back into a record
+#              array while the run is still going. A mixer that learns its own settings
+#              hands over its policy (see Mixing.AdaptiveMixer.policy) with
+#              every record as well, which is kept alongside the records.
+#------------------------------------------------------------
+
+import collections
+import json
+import os
+import time
+
+import numpy as np
+
+
+recordType = np.dtype([('iteration',    np.int64),
+                       ('stage',        np.int32),
+                       ('residual',     np.float64),
+                       ('mixParameter', np.float64),
+                       ('kappa',        np.float64),
+                       ('freeEnergy',   np.float64),
+                       ('time',         np.float64)])
+
+# a log starts with this, the length of the JSON header and the header
+logMagic = b'DNACCTLM'
+
+
+class Telemetry(object):
+
+#----------------------------------------------------------------------------------------
+#Name: __init__
+#
+#Description: every is the decimation, one step in every is recorded. capacity is the
+#             number of records the ring buffer holds before the oldest are dropped, None
+#             to keep them all. freeEnergyEvery asks the solver for the free energy on
+#             every freeEnergyEvery'th recorded step (never by default). callback, if
+#             given, is called with a dictionary for every record. logFile names the
+#             binary log, which is written in blocks of flushEvery records.
+#
+#             A Telemetry can be handed to one solve after another: each solve starts
+#             with reset, so the history is that of the solve, while the log keeps every
+#             solve in turn.
+#----------------------------------------------------------------------------------------
+    def __init__(self, every = 1, capacity = 100000, logFile = None, callback = None, freeEnergyEvery = None,
+                 flushEvery = 256):
+        self.every           = max(1, int(every))
+        self.capacity        = capacity
+        self.logFile         = logFile
+        self.callback        = callback
+        self.freeEnergyEvery = freeEnergyEvery
+        self.flushEvery      = flushEvery
+
+        self._pending   = []      # records not yet in the log
+        self._log       = None
+        self._resumed   = None    # the last iteration of a restored history
+        self.reset()
+
+    # forgets the history, for a new solve
+    def reset(self):
+        self._records  = self._buffer(0)
+        self._policies = collections.deque(maxlen = self.capacity)
+        self._count    = 0     # records ever made
+        self._start    = time.time()
+
+    # an empty buffer for at least size records, it grows as records arrive
+    def _buffer(self, size):
+        size = max(size, 1024)
+        if self.capacity is not None:
+            size = min(size, self.capacity)
+
+        return np.zeros(size, dtype = recordType)
+
+    def due(self, iteration):
+        return iteration % self.every == 0
+
+    def wantsFreeEnergy(self, iteration):
+        return (self.freeEnergyEvery is not None and self.due(iteration) and
+                (iteration//self.every) % self.freeEnergyEvery == 0)
+
+#----------------------------------------------------------------------------------------
+#Name: record
+#
+#Description: Records a step if the decimation asks for it. policy, if given, returns the
+#             policy of the mixer as a dictionary; it is only called for recorded steps.
+#----------------------------------------------------------------------------------------
+    def record(self, iteration, stage, residual, mixParameter, kappa, freeEnergy = np.nan, policy = None):
+        if not self.due(iteration):
+            return
+
+        record = (iteration, stage, residual, mixParameter, kappa, freeEnergy, time.time() - self._start)
+
+        if self._count == len(self._records) and (self.capacity is None or self._count < self.capacity):
+            size          = 2*self._count if self.capacity is None else min(2*self._count, self.capacity)
+            self._records = np.concatenate((self._records, np.zeros(size - self._count, dtype = recordType)))
+        self._records[self._count % len(self._records)] = record
+        self._count += 1
+
+        if self.logFile is not None:
+            self._pending.append(record)
+            if len(self._pending) >= self.flushEvery:
+                self.flush()
+
+        entry = dict(zip(recordType.names, record))
+        if policy is not None:
+            entry['policy'] = policy()
+            self._policies.append((iteration, entry['policy']))
+
+        if self.callback is not None:
+            self.callback(entry)
+
+#----------------------------------------------------------------------------------------
+#Name: history
+#
+#Returns: The records in the ring buffer, oldest first
+#----------------------------------------------------------------------------------------
+    def history(self):
+        if self._count <= len(self._records):
+            return self._records[:self._count].copy()
+
+        split = self._count % len(self._records)
+
+        return np.concatenate((self._records[split:], self._records[:split]))
+
+    def residuals(self):
+        return self.history()['residual']
+
+    # the (iteration, policy) pairs of the mixer, oldest first, as many as there are records
+    def policies(self):
+        return list(self._policies)
+
+    # puts back the history of a checkpoint, the log carries on after its last record
+    def restore(self, history):
+        self.reset()
+        history = np.asarray(history, dtype = recordType)
+        if self.capacity is not None:
+            history = history[-self.capacity:]
+
+        self._records = self._buffer(len(history))
+        self._records[:len(history)] = history
+        self._count = len(history)
+        if len(history):
+            self._start   = time.time() - history['time'][-1]
+            self._resumed = int(history['iteration'][-1])
+
+    def flush(self):
+        if self.logFile is None or not self._pending:
+            return
+
+        if self._log is None:
+            self._log = self._openLog()
+
+        self._log.write(np.array(self._pending, dtype = recordType).tobytes())
+        self._log.flush()
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+#----------------------------------------------------------------------------------------
+#Name: _openLog
+#
+#Description: A resumed solve appends to the log of the run it resumes, cut back to the
+#             last record of the restored history (the interrupted run may have logged
+#             steps after its checkpoint) and given the records of the history that had
+#             not reached it. Otherwise the log is started afresh.
+#
+#Returns: The log, open for writing at its end
+#----------------------------------------------------------------------------------------
+    def _openLog(self):
+        if self._resumed is not None and os.path.exists(self.logFile):
+            log = open(self.logFile, 'r+b')
+            dtype, start = _readHeader(log, self.logFile)
+            if dtype == recordType:
+                data    = log.read()
+                records = np.frombuffer(data[:len(data) - len(data) % dtype.itemsize], dtype = dtype)
+                kept    = np.nonzero(records['iteration'] <= self._resumed)[0]
+                kept    = kept[-1] + 1 if len(kept) else 0
+                log.seek(start + kept*dtype.itemsize)
+                log.truncate()
+
+                history = self.history()
+                missing = history['iteration'] <= self._resumed
+                if kept:
+                    missing &= history['iteration'] > records['iteration'][kept - 1]
+                log.write(history[missing].tobytes())
+
+                return log
+            log.close()
+
+        log    = open(self.logFile, 'wb')
+        header = json.dumps({'dtype': [list(field) for field in recordType.descr], 'every': self.every}).encode('ascii')
+        log.write(logMagic + np.array(len(header), dtype = '<u4').tobytes() + header)
+
+        return log
+
+
+# the record dtype and length of the header of an open log, which is left positioned after it
+def _readHeader(log, fileName):
+    if log.read(len(logMagic)) != logMagic:
+        raise ValueError("%s is not a telemetry log" % fileName)
+
+    length = int(np.frombuffer(log.read(4), dtype = '<u4')[0])
+    header = json.loads(log.read(length).decode('ascii'))
+    dtype  = np.dtype([tuple(field) for field in header['dtype']])
+
+    return dtype, len(logMagic) + 4 + length
+
+
+#----------------------------------------------------------------------------------------
+#Name: readLog
+#
+#Description: Reads a binary telemetry log, also one that is still being written
+#
+#Returns: The record array
+#----------------------------------------------------------------------------------------
+def readLog(fileName):
+    with open(fileName, 'rb') as log:
+        dtype, start = _readHeader(log, fileName)
+        data = log.read()
+
+    # a record cut short by a write in progress is left out
+    return np.frombuffer(data[:len(data) - len(data) % dtype.itemsize], dtype = dtype)
@@ -1,138 +1,1494 @@
 #------------------------------------------------------------
 # Name: dnacc.py
 #
-# Description: Contains functions used to create multi particle DNA covered colloid(dnacc) 
-#              Which are solutions to a set of self consistent equations 
+# Description: Contains the classes used to find multi particle DNA covered colloid(dnacc)
+#              densities, which are solutions to a set of self consistent equations.
 #
+#              A System holds the physical description: the number of species, the grid
+#              (any shape, one to three dimensions), the box, the volume fractions, the
+#              alphas and the matrix of pair potentials. A Solver iterates a System to
+#              its equilibrium densities with either the self consistent field theory
+#              (SCFT) equations or the reformulated DFT like / asymptotic preserving (AP)
+#              equations. The solver functions in the other modules are thin wrappers
+#              around these two classes.
 #------------------------------------------------------------
 
-import numpy as np
-import matplotlib.pyplot as plt
-import scipy as sci
-import math as m
+import copy
 import time
-from decimal import *
 
-class dnacc:
-    # The member variables that our functions need to run properly
-    incompresibilityFactor 	        = [10.0,100.0 ,1000.0]# Default 1850, 2050 [10 100 1000]
-    mixParameter 			        = [0.01, 0.005, 0.0005] 
-    number_of_lattice_points        = 32
-    size 							= 15.0    								#  
+import numpy as np
+
+from Potentials import gridCoordinates
+from PotentialCache import fourierPotential
+from Mixing import AndersonMixer, AdaptiveMixer
+from NewtonKrylov import newtonKrylov
+from Kernels import SCFTKernel, DFTKernel, peakMemory, exponentShifts
+from FFTBackend import getBackend
+from Telemetry import Telemetry
+from Profiling import getTimer
+from Divergence import Abort, DivergenceDetector, getDetector
+from Schedule import FixedSchedule, AdaptiveSchedule
+from Refinement import resample, resampleSpectrum
+from Symmetry import Symmetry
+from Stability import picardLeaves, leaveSaddle
+
+# settings given by name may be unicode under Python 2
+try:
+    _stringTypes = basestring
+except NameError:
+    _stringTypes = str
+
+
+class System(object):
+
+#----------------------------------------------------------------------------------------
+#Name: __init__
+#
+#Description: gridShape is the number of lattice points along each axis and boxSize the
+#             size of the box (one number, or one per axis). volumeFractions and alphas
+#             hold one value per species.
+#
+#             The pair potentials are given either in real space as an NxN matrix
+#             "potentials" (already shifted so the zero of the potential is the zero of
+#             the grid, see Potentials.createPotential), or already Fourier transformed
+#             and divided by the number of lattice points as "fourierPotentials". Entries
+#             that are None are treated as no interaction.
+#----------------------------------------------------------------------------------------
+    def __init__(self, gridShape, boxSize, volumeFractions, alphas, potentials = None, fourierPotentials = None):
+        self.gridShape          = tuple(int(n) for n in np.atleast_1d(gridShape))
+        self.numberOfDimensions = len(self.gridShape)
+        self.boxSize            = np.broadcast_to(np.asarray(boxSize, dtype = float), (self.numberOfDimensions,)).copy()
+        self.volumeFractions    = np.asarray(volumeFractions, dtype = float)
+        self.alphas             = np.asarray(alphas, dtype = float)
+        self.numberOfSpecies    = len(self.volumeFractions)
+
+        if len(self.alphas) != self.numberOfSpecies:
+            raise ValueError("one alpha is needed per species")
+        if abs(np.sum(self.volumeFractions) - 1.0) > 1e-6:
+            raise ValueError("the volume fractions must add up to one")
+
+        self.spacing        = self.boxSize/np.asarray(self.gridShape, dtype = float)
+        self.cellVolume     = float(np.prod(self.spacing))
+        self.volume         = float(np.prod(self.boxSize))
+        self.numberOfPoints = int(np.prod(self.gridShape))
+        self.coordinates    = gridCoordinates(self.gridShape, self.boxSize)
+
+        # the axes of a [species, *grid] array that hold the grid
+        self.axes         = tuple(range(1, self.numberOfDimensions + 1))
+        self.fourierShape = self.gridShape[:-1] + (self.gridShape[-1]//2 + 1,)
+
+        if fourierPotentials is None:
+            if potentials is None:
+                raise ValueError("either potentials or fourierPotentials must be given")
+            fourierPotentials = [[None if V is None else np.fft.rfftn(V)/float(self.numberOfPoints) for V in row]
+                                 for row in potentials]
+
+        self.fourierPotentials = np.zeros((self.numberOfSpecies, self.numberOfSpecies) + self.fourierShape, dtype = complex)
+        self.interacting       = np.zeros((self.numberOfSpecies, self.numberOfSpecies), dtype = bool)
+        for i in range(self.numberOfSpecies):
+            for j in range(self.numberOfSpecies):
+                if fourierPotentials[i][j] is not None:
+                    self.fourierPotentials[i, j] = fourierPotentials[i][j]
+                    self.interacting[i, j]       = np.any(self.fourierPotentials[i, j] != 0)
+
+#----------------------------------------------------------------------------------------
+#Name: withPairPotential
+#
+#Description: Creates a System in which every pair of different species interacts through
+#             the same piecewise potential, which is how all the older solvers were set
+#             up. The transformed potential comes from the potential cache.
+#----------------------------------------------------------------------------------------
+    @classmethod
+    def withPairPotential(cls, gridShape, boxSize, volumeFractions, alphas, A1, A2, length, gamma):
+        Vk = fourierPotential(A1, A2, length, gamma, gridShape, boxSize)
+        numberOfSpecies = len(volumeFractions)
+        fourierPotentials = [[None if i == j else Vk for j in range(numberOfSpecies)] for i in range(numberOfSpecies)]
+
+        return cls(gridShape, boxSize, volumeFractions, alphas, fourierPotentials = fourierPotentials)
+
+#----------------------------------------------------------------------------------------
+#Name: withPairParameters
+#
+#Description: Creates a System of any number of species N in which every pair interacts
+#             through its own piecewise potential. pairParameters is an NxN matrix whose
+#             entry [i][j] is the (A1, A2, length, gamma) of the potential between species
+#             i and j, or None where they do not interact. The matrix must be symmetric.
+#             Pairs with the same parameters share one transformed potential from the
+#             potential cache.
+#----------------------------------------------------------------------------------------
+    @classmethod
+    def withPairParameters(cls, gridShape, boxSize, volumeFractions, alphas, pairParameters):
+        numberOfSpecies = len(volumeFractions)
+        if len(pairParameters) != numberOfSpecies or any(len(row) != numberOfSpecies for row in pairParameters):
+            raise ValueError("pairParameters must be a %dx%d matrix" % (numberOfSpecies, numberOfSpecies))
+
+        def parameters(i, j):
+            entry = pairParameters[i][j]
+            return None if entry is None else tuple(float(value) for value in entry)
+
+        for i in range(numberOfSpecies):
+            for j in range(i):
+                if parameters(i, j) != parameters(j, i):
+                    raise ValueError("pairParameters is not symmetric: %r between %d and %d but %r between %d and %d"
+                                     % (pairParameters[i][j], i, j, pairParameters[j][i], j, i))
+
+        fourierPotentials = [[None if parameters(i, j) is None else fourierPotential(*(parameters(i, j) + (gridShape, boxSize)))
+                              for j in range(numberOfSpecies)] for i in range(numberOfSpecies)]
+
+        return cls(gridShape, boxSize, volumeFractions, alphas, fourierPotentials = fourierPotentials)
+
+#----------------------------------------------------------------------------------------
+#Name: resampled
+#
+#Description: The same System on a grid of shape gridShape over the same box. The spectra
+#             of the potentials are truncated or zero padded (see Refinement.py), which
+#             for a coarser grid keeps exactly the part of the potentials it can resolve.
+#----------------------------------------------------------------------------------------
+    def resampled(self, gridShape):
+        gridShape = tuple(int(n) for n in np.atleast_1d(gridShape))
+        if len(gridShape) != self.numberOfDimensions:
+            raise ValueError("expected a grid of %d dimensions, got %s" % (self.numberOfDimensions, gridShape))
+
+        axes              = tuple(range(2, self.numberOfDimensions + 2))
+        fourierPotentials = resampleSpectrum(self.fourierPotentials, self.gridShape, gridShape, axes)
+
+        return System(gridShape, self.boxSize, self.volumeFractions, self.alphas, fourierPotentials = fourierPotentials)
+
+#----------------------------------------------------------------------------------------
+#Name: reduced
+#
+#Description: The System seen by densities with the given Symmetry, on its reduced cell:
+#             the potentials are summed over the repeats of the cell and integrated over
+#             the axes the densities do not vary along, which are dropped. For such
+#             densities every convolution, and so the whole solve, is the same as on the
+#             full grid.
+#----------------------------------------------------------------------------------------
+    def reduced(self, symmetry):
+        gridShape = symmetry.reducedShape(self.gridShape)
+        boxSize   = [L/m for L, m in zip(self.boxSize, symmetry.repeats) if m > 0]
+
+        axes       = tuple(range(2, self.numberOfDimensions + 2))
+        potentials = np.fft.irfftn(self.numberOfPoints*self.fourierPotentials, self.gridShape, axes = axes)
+        potentials = symmetry.reducePotential(potentials, self.spacing)
+        axes       = tuple(range(2, len(gridShape) + 2))
+
+        fourierPotentials = np.fft.rfftn(potentials, axes = axes)/float(np.prod(gridShape))
+
+        return System(gridShape, boxSize, self.volumeFractions, self.alphas, fourierPotentials = fourierPotentials)
+
+#----------------------------------------------------------------------------------------
+#Name: generateRandomInitialDensities
+#
+#Description: Generates random initial densities for every species using a gaussian
+#             distribution around its volume fraction. The last species takes up whatever
+#             is left, so the densities add up to one at every point.
+#----------------------------------------------------------------------------------------
+    def generateRandomInitialDensities(self, std = 0.15, seed = None):
+        randomState = np.random.RandomState(seed)
+        densities   = np.empty((self.numberOfSpecies,) + self.gridShape)
+        for i in range(self.numberOfSpecies - 1):
+            densities[i] = self.volumeFractions[i] + std*randomState.randn(*self.gridShape)
+        densities[-1] = 1.0 - np.sum(densities[:-1], axis = 0)
+
+        return densities
+
+#----------------------------------------------------------------------------------------
+#Name: densityArray
+#
+#Description: Turns the densities passed in by a user into one [species, *grid] array.
+#             Either all N densities or the first N - 1 can be given, in which case the
+#             last one is one minus the others.
+#----------------------------------------------------------------------------------------
+    def densityArray(self, densities):
+        densities = np.array(densities, dtype = float)
+        if densities.shape == self.gridShape:
+            densities = densities[np.newaxis]
+
+        if densities.shape[0] == self.numberOfSpecies - 1:
+            densities = np.concatenate((densities, 1.0 - np.sum(densities, axis = 0)[np.newaxis]))
+
+        if densities.shape != (self.numberOfSpecies,) + self.gridShape:
+            raise ValueError("expected densities of shape %s, got %s" % ((self.numberOfSpecies,) + self.gridShape, densities.shape))
+
+        return densities
+
+
+class Result(object):
+
+#----------------------------------------------------------------------------------------
+#Name: __init__
+#
+#Description: The outcome of a solve. densities is the [species, *grid] array of final
+#             densities, flag is 1 if the solve converged to the tolerance and 0 if not,
+#             deviation is the final deviation and divergence the deviation at every
+#             iteration. peakMemory is the peak resident memory of the process in bytes
+#             when the solve finished and workspaceBytes the size of the work arrays of
+#             the iteration kernel (see Kernels.py), for sizing jobs. phaseTimes is the
+#             Profiling.PhaseTimer summary of the solve when it was profiled. abort is the
+#             Divergence.Abort saying why the solve was stopped early, None if it was not.
+#             stages holds a dictionary per incompressibility stage with its kappa, mixing
+#             parameter, iterations, seconds and final deviation (see Schedule.py). A coarse
+#             to fine solve keeps a dictionary per grid in levels, with its gridShape,
+#             tolerance, flag, deviation, iterations and seconds; everything else describes
+#             the solve on the finest grid. symmetry is the Symmetry.Symmetry of a solve
+#             that ran on a reduced cell; its densities are broadcast back onto the full
+#             grid and its free energy is that of the full grid. fallback is set when the
+#             stability check found an Anderson mixing solve converged on a saddle point,
+#             which Picard steps of the last stage then carried on from, moved downhill
+#             along its unstable direction: it holds the mixing, backend, iterations, free
+#             energy and leading eigenvalue of the solve that was rejected, and everything
+#             else describes the Picard steps.
+#----------------------------------------------------------------------------------------
+    def __init__(self, densities, flag, deviation, iterations, divergence, freeEnergy,
+                 peakMemory = None, workspaceBytes = None, phaseTimes = None, abort = None, stages = None,
+                 levels = None, symmetry = None, fallback = None):
+        self.densities      = densities
+        self.flag           = flag
+        self.deviation      = deviation
+        self.iterations     = iterations
+        self.divergence     = divergence
+        self.freeEnergy     = freeEnergy
+        self.peakMemory     = peakMemory
+        self.workspaceBytes = workspaceBytes
+        self.phaseTimes     = phaseTimes
+        self.abort          = abort
+        self.stages         = stages
+        self.levels         = levels
+        self.symmetry       = symmetry
+        self.fallback       = fallback
+
+
+class Solver(object):
+
+    methods       = ('SCFT', 'DFT')
+    mixingSchemes = ('picard', 'anderson', 'adaptive')
+    backends      = ('fixedpoint', 'newton-krylov')
+    precisions    = {'double': np.float64, 'single': np.float32, 'extended': np.longdouble}
+
+#----------------------------------------------------------------------------------------
+#Name: __init__
+#
+#Description: method is 'SCFT' (any number of species) or 'DFT' (the DFT like equations
+#             of two species, also 'AP'). SCFT runs one Picard stage per entry of
+#             incompressibility, with the matching entry of mixParameter. DFT mixes with
+#             smallmix, trying a bigmix step when the deviation changed by less than perc
+#             percent over five iterations after bigStepCount small steps, and clamps the
+#             densities outside bounds to clampedValues; asymptoticPreserving multiplies
+#             the equations through by alphaA. Its incompressibility defaults to 100/alphaA.
+#
+#             incompressibility may be a Schedule.FixedSchedule or AdaptiveSchedule
+#             ('adaptive'), see Schedule.py.
+#             mixing is 'picard', 'anderson' (over historyDepth iterates, see Mixing.py)
+#             or 'adaptive' (Mixing.AdaptiveMixer).
+#             stabilityCheck checks a state Anderson mixing converged on for a saddle
+#             point and carries on downhill from one, see Stability.py.
+#             backend = 'newton-krylov' minimizes the DFT like free energy by Newton-Krylov,
+#             see NewtonKrylov.py, with newtonIterations steps per stage.
+#             checkpoint is a Checkpoint.Checkpointer to resume an interrupted solve from.
+#             fft is an FFTBackend or its name, by default set by DNACC_FFT_BACKEND.
+#             telemetry is a Telemetry.Telemetry every iteration is reported to.
+#             profile is a Profiling.PhaseTimer, or True, timing the phases of a solve.
+#             precision is 'double', 'single' (polished in double below
+#             polishFactor*tolerance) or 'extended'.
+#             abort is a Divergence.DivergenceDetector, or True, that stops a solve that
+#             diverges or stagnates.
+#             levels lists coarser grids to solve on first, to levelTolerance.
+#             symmetry is a Symmetry.Symmetry, or 'detect', to solve on the reduced cell.
+#----------------------------------------------------------------------------------------
+    def __init__(self, system, method = 'SCFT',
+                 incompressibility    = None,
+                 mixParameter         = (0.01, 0.005, 0.0005),
+                 numberOfIterations   = 30000,
+                 tolerance            = 1e-4,
+                 smallmix             = 0.01,
+                 bigmix               = 0.1,
+                 perc                 = 0.1,
+                 bigStepCount         = 1000,
+                 bounds               = (0.01, 0.99),
+                 clampedValues        = (0.0001, 0.9999),
+                 asymptoticPreserving = False,
+                 mixing               = 'picard',
+                 historyDepth         = 5,
+                 stabilityCheck       = False,
+                 backend              = 'fixedpoint',
+                 newtonIterations     = 100,
+                 krylovTolerance      = 0.1,
+                 krylovIterations     = 50,
+                 checkpoint           = None,
+                 fft                  = None,
+                 telemetry            = None,
+                 profile              = None,
+                 precision            = 'double',
+                 polishFactor         = 10.0,
+                 abort                = None,
+                 levels               = None,
+                 levelTolerance       = None,
+                 symmetry             = None):
+
+        method = method.upper()
+        if method == 'AP':
+            method = 'DFT'
+        if method not in self.methods:
+            raise ValueError("unknown method %r, expected one of %s" % (method, ", ".join(self.methods)))
+        if method == 'DFT' and system.numberOfSpecies != 2:
+            raise ValueError("the DFT like equations are only formulated for two species")
+
+        if incompressibility is None or isinstance(incompressibility, (_stringTypes, AdaptiveSchedule)):
+            if method == 'SCFT':
+                defaultKappas = (10.0, 100.0, 1000.0)
+            else:
+                defaultKappas = (100.0/system.alphas[0],)
 
-    # These values can be calculated from the user inputed values
-    half_number_of_lattice_points 	= number_of_lattice_points/2 # the halfway point in the lattice
-    dx 								= xsize/float(number_of_lattice_points)
-    xxs 							= [i*dx - size/2.0 for i in range(0,number_of_lattice_points)]
+        # an adaptive schedule keeps its own kappas, incompressibility is left with its target
+        schedule = None
+        if isinstance(incompressibility, _stringTypes):
+            if incompressibility.lower() != 'adaptive':
+                raise ValueError("unknown incompressibility schedule %r, expected 'adaptive'" % incompressibility)
+            incompressibility = AdaptiveSchedule()
+        if isinstance(incompressibility, AdaptiveSchedule):
+            schedule = copy.deepcopy(incompressibility)
+            schedule.prepare(system, defaultKappas[-1])
+            incompressibility = (schedule.target,)
+        elif isinstance(incompressibility, FixedSchedule):
+            incompressibility, mixParameter = incompressibility.kappas, incompressibility.mixes
+        elif incompressibility is None:
+            incompressibility = defaultKappas
 
-    m_volumeFractions               = np.array([])
-    m_NumberOfDimensions            = 1
-    m_NumberOfParticles             = 3
-    m_InitalDensities               = np.array([])
-    m_FinalDensities                = np.array([])
-    m_Potentials                    = np.array([])
-    flag  = 0
+        mixing = mixing.lower()
+        if mixing not in self.mixingSchemes:
+            raise ValueError("unknown mixing %r, expected one of %s" % (mixing, ", ".join(self.mixingSchemes)))
 
+        backend = backend.lower()
+        if backend not in self.backends:
+            raise ValueError("unknown backend %r, expected one of %s" % (backend, ", ".join(self.backends)))
+        if backend == 'newton-krylov' and method != 'DFT':
+            raise ValueError("the newton-krylov backend is only available for the DFT like equations")
 
+        precision = precision.lower()
+        if precision not in self.precisions:
+            raise ValueError("unknown precision %r, expected one of %s" % (precision, ", ".join(self.precisions)))
+        if precision != 'double' and backend == 'newton-krylov':
+            raise ValueError("the newton-krylov backend only runs in double precision")
+
+        levels = [tuple(int(n) for n in np.broadcast_to(level, (system.numberOfDimensions,))) for level in (levels or [])]
+        for level in levels:
+            if any(n > m for n, m in zip(level, system.gridShape)):
+                raise ValueError("the level %s is finer than the grid %s" % (level, system.gridShape))
+        if levelTolerance is None:
+            levelTolerance = tolerance
+        if len(np.atleast_1d(levelTolerance)) not in (1, len(levels)):
+            raise ValueError("one levelTolerance is needed per level")
+
+        if isinstance(symmetry, _stringTypes):
+            if symmetry.lower() != 'detect':
+                raise ValueError("unknown symmetry %r, expected 'detect' or a Symmetry" % symmetry)
+            symmetry = 'detect'
+        elif symmetry is not None:
+            for level in [system.gridShape] + levels:
+                symmetry.reducedShape(level)
+
+        if method == 'SCFT' and schedule is None and len(np.atleast_1d(mixParameter)) not in (1, len(np.atleast_1d(incompressibility))):
+            raise ValueError("one mixParameter is needed per incompressibility stage")
+
+        self.system               = system
+        self.method               = method
+        self.incompressibility    = list(np.atleast_1d(incompressibility))
+        self.mixParameter         = list(np.atleast_1d(mixParameter))
+        self.numberOfIterations   = numberOfIterations
+        self.tolerance            = tolerance
+        self.smallmix             = smallmix
+        self.bigmix               = bigmix
+        self.perc                 = perc
+        self.bigStepCount         = bigStepCount
+        self.bounds               = bounds
+        self.clampedValues        = clampedValues
+        self.asymptoticPreserving = asymptoticPreserving
+        self.mixing               = mixing
+        self.historyDepth         = historyDepth
+        self.stabilityCheck       = stabilityCheck
+        self.backend              = backend
+        self.newtonIterations     = newtonIterations
+        self.krylovTolerance      = krylovTolerance
+        self.krylovIterations     = krylovIterations
+        self.checkpoint           = checkpoint
+        self.fft                  = getBackend(fft)
+        self.telemetry            = telemetry
+        self.profile              = getTimer(profile)
+        self.precision            = precision
+        self.polishFactor         = polishFactor
+        self.dtype                = np.dtype(self.precisions[precision])
+        self.abort                = abort
+        self.schedule             = schedule
+        self.levels               = levels
+        self.levelTolerance       = list(np.broadcast_to(levelTolerance, (len(levels),)))
+        self.symmetry             = symmetry
+
+    # the telemetry of one solve, with the history of the checkpoint being resumed
+    def _telemetry(self, state = None):
+        telemetry = self.telemetry if self.telemetry is not None else Telemetry()
+        if state is not None:
+            telemetry.restore(state['telemetry'])
+        else:
+            telemetry.reset()
+
+        return telemetry
+
+    # the phase times of a finished solve, for its Result
+    def _phaseTimes(self):
+        self.profile.finish()
+
+        return self.profile.summary() if self.profile.enabled else None
+
+    # the iteration kernel of the given precision, made the first time it is needed
+    def _kernel(self, kernels, dtype):
+        if dtype not in kernels:
+            if self.method == 'SCFT':
+                kernels[dtype] = SCFTKernel(self.system, self.fft, self.profile, dtype)
+            else:
+                kernels[dtype] = DFTKernel(self.system, self.asymptoticPreserving, self.fft, self.profile, dtype)
+
+        return kernels[dtype]
+
+    # True when a single precision iteration is close enough to converged to be polished
+    def _polishDue(self, field, deviation):
+        return (field.dtype == np.float32 and self.polishFactor is not None and
+                abs(deviation) < self.polishFactor*self.tolerance)
+
+    # state is a checkpoint to take the Anderson history from
+    def _mixer(self, state = None):
+        if self.mixing == 'anderson':
+            mixer = AndersonMixer(self.historyDepth)
+        elif self.mixing == 'adaptive':
+            mixer = AdaptiveMixer()
+        else:
+            return None
+
+        self._restoreState(mixer, 'mixer', state)
+
+        return mixer
+
+    # the early abort detector of a stage, with the counters of the checkpoint being resumed
+    def _detector(self, state = None):
+        detector = getDetector(self.abort)
+        if detector is not None:
+            detector.reset()
+            self._restoreState(detector, 'detector', state)
+
+        return detector
+
+    # the incompressibility stages of a solve, with the records of the checkpoint being resumed
+    def _schedule(self, state = None):
+        if self.schedule is None:
+            schedule = FixedSchedule(self.incompressibility, self.mixParameter)
+        else:
+            schedule = copy.copy(self.schedule)
+            schedule.reset()
+
+        self._restoreState(schedule, 'schedule', state)
+
+        return schedule
+
+    # True if the abort stops the whole solve, not just the stage; last is True in the last stage
+    def _endsSolve(self, abort, last):
+        return abort is not None and (abort.reason not in DivergenceDetector.stagnationReasons or last)
+
+    # the name _saveCheckpoint stores the entry name of the state of a mixer, detector or schedule under
+    @staticmethod
+    def _stateKey(prefix, name):
+        return prefix + name[0].upper() + name[1:]
+
+    def _restoreState(self, target, prefix, state):
+        keys = dict((name, self._stateKey(prefix, name)) for name in target.state())
+        if state is not None and all(key in state for key in keys.values()):
+            target.setState(dict((name, state[key]) for name, key in keys.items()))
 
 #----------------------------------------------------------------------------------------
-#Name: _init_
+#Name: _loadCheckpoint
 #
-#Description: Takes in the number of dimensions and number of Particles. Will also set the
-#             the volume fractions so that each particle takes up an equal space in the box
+#Description: field names the array the fixed point iteration works on and shape its
+#             shape; a checkpoint that does not match them belongs to another problem.
+#
+#Returns: The state of the checkpoint, or None if there is nothing to resume from
 #----------------------------------------------------------------------------------------
-    def _init_(self,dimensions, numberOfParticles):
-        self.m_NumberOfDimensions = dimensions
-        self.m_NumberOfParticles  = numberOfParticles
-        self.m_volumeFractions    = np.array([float(1/numberOfParticles) for i in range(0,numberOfParticles)])
+    def _loadCheckpoint(self, field, shape):
+        if self.checkpoint is None:
+            return None
+
+        state = self.checkpoint.load()
+        if state is None:
+            return None
 
+        if (state.get('method') != self.method or state.get('backend', 'fixedpoint') != self.backend or
+                field not in state or state[field].shape != shape):
+            raise ValueError("the checkpoint %s was written by a different solve" % self.checkpoint.fileName)
 
+        return state
+
+    # stage and start are the stage and the iteration within it to carry on from
+    def _saveCheckpoint(self, iterations, stage, start, mixer, detector, schedule, **state):
+        if self.checkpoint is None or not self.checkpoint.due(iterations):
+            return
+
+        for prefix, target in (('mixer', mixer), ('detector', detector), ('schedule', schedule)):
+            if target is not None:
+                for name, value in target.state().items():
+                    state[self._stateKey(prefix, name)] = value
+
+        state['telemetry'] = state['telemetry'].history()
+        self.checkpoint.save(iterations, method = self.method, backend = self.backend, iterations = iterations,
+                             stage = stage, start = start, **state)
+
+    def _removeCheckpoint(self):
+        if self.checkpoint is not None:
+            self.checkpoint.remove()
 
 #----------------------------------------------------------------------------------------
-#Name: setVolumeFractions
+#Name: solve
 #
-#Description: Sets the number of volume fractions based on the user input.
+#Description: Iterates the initial densities (see System.densityArray) until they are a
+#             solution of the self consistent equations or the iterations run out.
+#
+#Returns: A Result
+#----------------------------------------------------------------------------------------
+    def solve(self, initialDensities):
+        densities = self.system.densityArray(initialDensities)
+
+        symmetry = Symmetry.detect(densities) if self.symmetry == 'detect' else self.symmetry
+        if symmetry is not None and not symmetry.trivial():
+            return self._solveReduced(densities, symmetry)
+
+        if self.levels:
+            return self._solveLevels(densities)
+
+        return self._solveGrid(densities)
+
+    def _solveGrid(self, densities):
+        if self.method == 'SCFT':
+            result = self._solveSCFT(densities)
+        elif self.backend == 'newton-krylov':
+            result = self._solveDFTNewtonKrylov(densities)
+        else:
+            result = self._solveDFTLike(densities)
+
+        if result.flag == 1 and self.stabilityCheck and self.mixing == 'anderson' and self.backend == 'fixedpoint':
+            leaves, eigenvalue, direction = self._picardLeaves(result)
+            if leaves:
+                fallback = {'mixing': self.mixing, 'backend': self.backend, 'iterations': int(result.iterations),
+                            'freeEnergy': float(result.freeEnergy), 'eigenvalue': eigenvalue}
+                result = self._leaveSaddle(result, direction)
+                result.fallback = fallback
+
+        return result
+
+#----------------------------------------------------------------------------------------
+#Name: _leaveSaddle
 #
+#Description: Carries on from the saddle point result converged on with the Picard steps
+#             of its last stage, which run downhill, after moving it along direction
+#             (Stability.leaveSaddle), so they need not first grow the unstable direction
+#             out of rounding errors. Starting over from the initial densities would lose
+#             the iterations the solve took to get there. The Picard steps run without
+#             the checkpoint, which belongs to the stages of the whole solve.
 #
-#Returns: 0 if user input is not valid
+#Returns: The Result of the Picard steps
 #----------------------------------------------------------------------------------------
+    def _leaveSaddle(self, result, direction):
+        stage     = result.stages[-1]
+        densities = np.asarray(result.densities, dtype = np.float64)
 
-    def setVolumeFractions(self, listOfVolumeFractions):
+        solver = copy.copy(self)
+        solver.mixing            = 'picard'
+        solver.backend           = 'fixedpoint'
+        solver.incompressibility = [stage['kappa']]
+        solver.mixParameter      = [stage['mixParameter']]
+        solver.schedule          = None
+        solver.checkpoint        = None
 
-        if np.ceil(np.sum(listOfVolumeFractions)) == 1 and len(listOfVolumeFractions) == self.m_NumberOfParticles:
-            self.m_volumeFractions = listOfVolumeFractions
+        if self.method == 'SCFT':
+            densities = leaveSaddle(self.freeEnergy, densities, direction)
         else:
-            return 0
+            phia      = leaveSaddle(lambda phia: self.freeEnergy(np.array([phia, 1.0 - phia])), densities[0], direction)
+            densities = np.array([phia, 1.0 - phia])
+
+        return solver._solveGrid(densities)
+
+#----------------------------------------------------------------------------------------
+#Name: _picardLeaves
+#
+#Description: Whether the converged densities of result are a saddle point that the
+#             Picard steps of its last stage would leave within numberOfIterations, see
+#             Stability.picardLeaves.
+#
+#Returns: True or False, the leading eigenvalue of the Jacobian of the Picard direction
+#         and its eigenvector
+#----------------------------------------------------------------------------------------
+    def _picardLeaves(self, result):
+        kappa     = result.stages[-1]['kappa']
+        densities = np.asarray(result.densities, dtype = np.float64)
+
+        if self.method == 'SCFT':
+            return picardLeaves(lambda x: self._scftUpdate(x, kappa) - x, self.freeEnergy, densities,
+                                result.stages[-1]['mixParameter'], self.numberOfIterations)
+
+        stepScale = 1.0 if self.asymptoticPreserving else self.system.alphas[0]
+
+        return picardLeaves(lambda phia: self._dftResidual(phia, kappa),
+                            lambda phia: self.freeEnergy(np.array([phia, 1.0 - phia])), densities[0],
+                            stepScale*self.smallmix, self.numberOfIterations)
+
+    # a Solver with the same settings for another System, with a schedule of its own
+    def _derivedSolver(self, system):
+        solver = copy.copy(self)
+        solver.system = system
+        if self.schedule is not None:
+            solver.schedule = copy.copy(self.schedule)
+            solver.schedule.prepare(system, self.schedule.target)
+
+        return solver
 
+    # the Solver of one coarse level, without checkpoint or telemetry
+    def _levelSolver(self, gridShape, tolerance):
+        solver = self._derivedSolver(self.system.resampled(gridShape))
+        solver.tolerance  = tolerance
+        solver.checkpoint = None
+        solver.telemetry  = None
+        solver.levels     = []
 
+        return solver
 
+    def _solveReduced(self, densities, symmetry):
+        solver = self._derivedSolver(self.system.reduced(symmetry))
+        solver.symmetry = None
+        solver.levels   = [symmetry.reducedShape(level) for level in self.levels]
 
+        result = solver.solve(symmetry.reduce(densities))
+        result.densities  = symmetry.expand(result.densities, self.system.gridShape)
+        result.freeEnergy = self.freeEnergy(result.densities)
+        result.symmetry   = symmetry
 
+        return result
+
+    def _solveLevels(self, densities):
+        solvers = [self._levelSolver(gridShape, tolerance) for gridShape, tolerance in zip(self.levels, self.levelTolerance)]
+        levels  = []
+
+        for solver in solvers + [self]:
+            start  = time.time()
+            result = solver._solveGrid(resample(densities, solver.system.gridShape, self.fft))
+            levels.append({'gridShape': list(solver.system.gridShape), 'tolerance': float(solver.tolerance),
+                           'flag': result.flag, 'deviation': float(result.deviation),
+                           'iterations': int(result.iterations), 'seconds': time.time() - start})
+
+            if np.all(np.isfinite(result.densities)):
+                densities = result.densities
+
+        result.levels = levels
+
+        return result
 
 #----------------------------------------------------------------------------------------
-# Generates Random initial densites for the number of particles using a gaussian distribution.
-# Normalizes the densities so the sum equals one.
+#Name: convolve
+#
+#Description: The interaction field felt by every species, the sum over the other species
+#             of the convolution of their density with the pair potential, done as a real
+#             space FFT. The transform is linear, so the spectra of the convolutions are
+#             summed first: the field spectrum of species i is sum_j V_ij(k) phi_j(k), one
+#             contraction of the potential matrix with the density spectra, and each field
+#             then takes one inverse transform, N in all instead of one per pair.
+#----------------------------------------------------------------------------------------
+    def convolve(self, densities):
+        system  = self.system
+        spectra = self.fft.rfftn(densities, system.axes)
+        spectra = np.einsum('ij...,j...->i...', system.fourierPotentials, spectra)
+
+        return system.volume*self.fft.irfftn(spectra, system.gridShape, system.axes)
+
 #----------------------------------------------------------------------------------------
-    def generateRandomIntialDensities(self):
-        std = 0.15
-        if self.m_NumberOfDimensions == 1:
-            for i in range(0,len(self.m_volumeFractions)):
-               
-                if i != len(self.m_volumeFractions) - 1:
-                    np.append(self.m_InitalDensities,volumeFraction[i] + std*np.random.randn(number_of_lattice_points))
+#Name: convolvePair
+#
+#Description: The convolution of a single density with the potential between species i
+#             and j.
+#----------------------------------------------------------------------------------------
+    def convolvePair(self, density, i, j):
+        system = self.system
+
+        return system.volume*self.fft.irfftn(self.fft.rfftn(density)*system.fourierPotentials[i, j], system.gridShape)
+
+#----------------------------------------------------------------------------------------
+# SCFT
+#----------------------------------------------------------------------------------------
+    def _chemicalPotentialFields(self, densities, kappa):
+        return self.convolve(densities) - kappa*(1.0 - np.sum(densities, axis = 0))
+
+    # The weights and partition functions are both divided by exp(shifts), see
+    # Kernels.exponentShifts, so log Q is log(Q) + shifts
+    def _partitionFunctions(self, fields):
+        system    = self.system
+        expand    = (-1,) + (1,)*system.numberOfDimensions
+        exponents = -system.alphas.reshape(expand)*fields
+        shifts    = exponentShifts(np.max(exponents, axis = system.axes), exponents.dtype)
+        weights   = np.exp(exponents - shifts.reshape(expand))
+        Q         = system.cellVolume*np.sum(weights, axis = system.axes)
+
+        return weights, Q, shifts
+
+    def _scftUpdate(self, densities, kappa):
+        system       = self.system
+        expand       = (-1,) + (1,)*system.numberOfDimensions
+        fractions    = system.volumeFractions.reshape(expand)
+
+        fields       = self._chemicalPotentialFields(densities, kappa)
+        weights, Q, shifts = self._partitionFunctions(fields)
+
+        tempDensities    = fractions*system.volume*weights/Q.reshape(expand)
+        averageDensities = system.volumeFractions - system.cellVolume*np.sum(tempDensities, axis = system.axes)/system.volume
+
+        return tempDensities + averageDensities.reshape(expand)
+
+    def _solveSCFT(self, densities):
+        timer      = self.profile
+        kernels    = {}
+        phidev     = np.inf
+        iterations = 0
+        stage      = 0
+        start      = 0
+        polishing  = False
+
+        state = self._loadCheckpoint('densities', densities.shape)
+        if state is not None:
+            densities  = state['densities']
+            phidev     = state['deviation']
+            iterations = state['iterations']
+            stage      = state['stage']
+            start      = state['start']
+            polishing  = bool(state.get('polishing', False))
+
+        telemetry = self._telemetry(state)
+        schedule  = self._schedule(state)
+        abort     = None
+        b         = stage
+        timer.begin()
+
+        while b is not None:
+            kappa      = schedule.kappa(b)
+            mix        = schedule.mix(b)
+            mixer      = self._mixer(state if b == stage else None)
+            detector   = self._detector(state if b == stage else None)
+            first      = start if b == stage else 0
+            stageStart = iterations - first
+            stageClock = time.time()
+
+            # every stage starts in the working precision
+            polishing = polishing and b == stage
+            densities = np.asarray(densities, dtype = np.float64 if polishing else self.dtype)
+            kernel    = self._kernel(kernels, densities.dtype)
+
+            for j in range(first, self.numberOfIterations):
+                newDensities = kernel.update(densities, kappa)
+
+                #picard mixing to increase the convergence
+                if mixer is None:
+                    kernel.mix(densities, newDensities, mix)
+                    phidev = kernel.deviation(newDensities, densities)
                 else:
-                    np.append(self.m_InitalDensities,1 - np.sum(self.m_InitalDensities))
+                    # the deviation of the iterate itself, the next iterate of a mixer can be
+                    # close to newDensities far from the solution
+                    phidev    = kernel.deviation(newDensities, densities)
+                    previous  = densities
+                    clock     = timer.start()
+                    densities = mixer.update(densities, newDensities - densities, mix)
+                    timer.lap('mixing', clock)
+                iterations += 1
+                telemetry.record(iterations, b, phidev, mix if mixer is None else mixer.relaxation(mix), kappa,
+                                 self.freeEnergy(densities) if telemetry.wantsFreeEnergy(iterations) else np.nan,
+                                 None if mixer is None else mixer.policy)
 
+                if self._polishDue(densities, phidev):
+                    polishing = True
+                    densities = densities.astype(np.float64)
+                    kernel    = self._kernel(kernels, densities.dtype)
+                    mixer     = self._mixer()
+                elif schedule.converged(b, phidev, self.tolerance):
+                    if mixer is not None:
+                        densities = previous
+                    break
+                elif detector is not None:
+                    abort = detector.check(iterations, b, phidev)
+                    if abort is not None:
+                        break
 
+                self._saveCheckpoint(iterations, b, j + 1, mixer, detector, schedule, densities = densities,
+                                     telemetry = telemetry, deviation = phidev, polishing = polishing)
 
+            nextStage = schedule.finish(b, iterations - stageStart, time.time() - stageClock, phidev, mix)
+            if self._endsSolve(abort, schedule.isLast(b)):
+                break
+            abort = None
+            b     = nextStage
 
+        self._removeCheckpoint()
+        telemetry.flush()
+        flag      = 1 if phidev <= self.tolerance else 0
+        densities = np.asarray(densities, dtype = np.result_type(self.dtype, np.float64))
 
+        return Result(densities, flag, phidev, iterations, telemetry.residuals(), self.freeEnergy(densities),
+                      peakMemory(), sum(kernel.nbytes for kernel in kernels.values()), self._phaseTimes(), abort,
+                      schedule.stages())
 
 #----------------------------------------------------------------------------------------
-# Generates potentials based on user specified values. If no values given it defaults to 
-# chosen values.
+# DFT like
 #----------------------------------------------------------------------------------------
-    def generatePotential(self,A1 = 3.0, A2 = 1.0, length = 6.0, halfWidthHalfMaximum = 0.65):
-        gamma = halfWidthHalfMinimum/(m.sqrt(2*m.log(2)))
-        for potential in range(0,nCr(self.m_NumberOfParticles,2)):
-            tempPotential = np.zeros(self.number_of_lattice_points,1)
-            for i in range(0,self.number_of_lattice_points):
-                r = abs(xxs[i])
-                if r <= length:
-                    tempPotential[i] = (A1+A2)*(m.cos((sci.pi)*r/length))/2.0 + (A1 - A2)/2.0
+    def _dftResidual(self, phia, kappa):
+        system = self.system
+        volumeFractionA, volumeFractionB = system.volumeFractions
+        alphaA, alphaB = system.alphas
+
+        convolution_Phia_PotentialAb = self.convolvePair(phia - volumeFractionA, 0, 1)
+
+        lgaterm = -(1/alphaA)*np.log(phia/volumeFractionA)
+        lgbterm = (1/alphaB)*np.log((1 - phia)/volumeFractionB)
+        kpterm  = kappa*(volumeFractionA - np.mean(phia))
+
+        #self consistent equations in reformulated form
+        phianew = lgaterm + lgbterm + (2/(alphaA*alphaB))*convolution_Phia_PotentialAb + kpterm
+        if self.asymptoticPreserving:
+            phianew *= alphaA
+
+        return phianew
+
+    # J v, the derivative of _dftResidual at phia in the direction v
+    def _dftJacobianVector(self, phia, v, kappa):
+        system = self.system
+        alphaA, alphaB = system.alphas
+
+        Jv = (-(1/alphaA)*v/phia - (1/alphaB)*v/(1 - phia) +
+              (2/(alphaA*alphaB))*self.convolvePair(v, 0, 1) - kappa*np.mean(v))
+        if self.asymptoticPreserving:
+            Jv *= alphaA
+
+        return Jv
+
+    # Spectral preconditioner: -J with the log terms replaced by their average is diagonal in
+    # Fourier space (the convolution multiplies by volume*Vkab and the incompressibility
+    # term only touches k = 0), so it is inverted with one FFT pair. Its symbol is taken by
+    # absolute value, as the conjugate gradient solve needs a positive definite one.
+    def _dftPreconditioner(self, phia, kappa):
+        system = self.system
+        alphaA, alphaB = system.alphas
+
+        symbol = (np.mean((1/alphaA)/phia + (1/alphaB)/(1 - phia)) -
+                  (2/(alphaA*alphaB))*system.volume*system.fourierPotentials[0, 1].real)
+        symbol.flat[0] += kappa
+        if self.asymptoticPreserving:
+            symbol *= alphaA
+
+        symbol   = np.abs(symbol)
+        smallest = 1e-12*np.max(symbol)
+        symbol[symbol < smallest] = smallest
+
+        return lambda r: self.fft.irfftn(self.fft.rfftn(r)/symbol, system.gridShape)
+
+#----------------------------------------------------------------------------------------
+#Name: _solveDFTNewtonKrylov
+#
+#Description: Minimizes the free energy stage by stage with NewtonKrylov.newtonKrylov, at
+#             most newtonIterations Newton steps per stage. Converged in the last stage,
+#             the densities are checked for a saddle point the smallmix Picard steps would
+#             leave (Stability.picardLeaves); the Newton steps then carry on from them moved
+#             downhill along its unstable direction (Stability.leaveSaddle), which no
+#             Newton step sees from the saddle itself. Every Newton step counts as an
+#             iteration for the telemetry, the checkpoint and the abort detector, which
+#             starts over after such a move, as that raises the deviation.
+#----------------------------------------------------------------------------------------
+    def _solveDFTNewtonKrylov(self, densities):
+        timer  = self.profile
+        alphaA = self.system.alphas[0]
+        phia   = densities[0].copy()
+
+        phia[phia >= 1.0] = 0.9999999
+        phia[phia <= 0.0] = 0.0000001
+
+        iterations = 0
+        stage      = 0
+        start      = 0
+
+        state = self._loadCheckpoint('phia', phia.shape)
+        if state is not None:
+            phia       = state['phia']
+            iterations = state['iterations']
+            stage      = state['stage']
+            start      = state['start']
+
+        telemetry = self._telemetry(state)
+        schedule  = self._schedule(state)
+        abort     = None
+        flag      = 0
+        b         = stage
+        timer.begin()
+
+        # the Picard step is phia + stepScale*smallmix*phianew
+        stepScale  = 1.0 if self.asymptoticPreserving else float(alphaA)
+        freeEnergy = lambda phia: self.freeEnergy(np.array([phia, 1.0 - phia]))
+
+        while b is not None:
+            kappa      = schedule.kappa(b)
+            detector   = self._detector(state if b == stage else None)
+            steps      = start if b == stage else 0
+            stageClock = time.time()
+
+            while True:
+                # records the iterate after n Newton steps, returns the Abort that stops the solve
+                def record(n, phia, deviation, freeEnergy, first = iterations, steps = steps, detector = detector):
+                    telemetry.record(first + n + 1, b, deviation, np.nan, kappa, freeEnergy)
+                    if np.isnan(deviation):
+                        return Abort('nan', first + n + 1, b, np.nan, 'the Newton-Krylov residual is NaN')
+                    if detector is not None:
+                        abort = detector.check(first + n + 1, b, deviation, 0.0)
+                        if abort is not None:
+                            return abort
+
+                    self._saveCheckpoint(first + n + 1, b, steps + n + 1, None, detector, schedule,
+                                         phia = phia, telemetry = telemetry)
+
+                phia, flag, deviations, abort = newtonKrylov(
+                    lambda x: self._dftResidual(x, kappa),
+                    lambda x, v: self._dftJacobianVector(x, v, kappa),
+                    freeEnergy,
+                    phia,
+                    preconditioner          = lambda x: self._dftPreconditioner(x, kappa),
+                    tolerance               = self.tolerance,
+                    maximumNewtonIterations = max(self.newtonIterations - steps, 0),
+                    krylovTolerance         = self.krylovTolerance,
+                    krylovIterations        = self.krylovIterations,
+                    callback                = record,
+                    timer                   = timer)
+
+                iterations += len(deviations)
+                steps      += len(deviations)
+
+                if flag != 1 or not schedule.isLast(b):
+                    break
+
+                clock = timer.start()
+                leaves, eigenvalue, direction = picardLeaves(lambda x: self._dftResidual(x, kappa), freeEnergy, phia,
+                                                             stepScale*self.smallmix, self.numberOfIterations)
+                moved = leaveSaddle(freeEnergy, phia, direction) if leaves else phia
+                timer.lap('stability check', clock)
+
+                if moved is phia:
+                    break
+                phia     = moved
+                flag     = 0
+                detector = self._detector()
+
+            nextStage = schedule.finish(b, steps - (start if b == stage else 0), time.time() - stageClock,
+                                        deviations[-1], np.nan)
+            if self._endsSolve(abort, schedule.isLast(b)):
+                break
+            abort = None
+            b     = nextStage
+
+        self._removeCheckpoint()
+        telemetry.flush()
+        densities = np.array([phia, 1.0 - phia])
+
+        return Result(densities, flag, deviations[-1], iterations, telemetry.residuals(), self.freeEnergy(densities),
+                      peakMemory(), None, self._phaseTimes(), abort, schedule.stages())
+
+    def _solveDFTLike(self, densities):
+        timer   = self.profile
+        kernels = {}
+        alphaA  = self.system.alphas[0]
+        phia   = densities[0].copy()
+
+        phia[phia >= 1.0] = 0.9999999
+        phia[phia <= 0.0] = 0.0000001
+
+        devtot     = 100.0*np.ones(5)
+        count      = 0
+        iterations = 0
+        stage      = 0
+        start      = 0
+        polishing  = False
+
+        state = self._loadCheckpoint('phia', phia.shape)
+        if state is not None:
+            phia       = state['phia']
+            devtot     = state['devtot']
+            count      = state['count']
+            iterations = state['iterations']
+            stage      = state['stage']
+            start      = state['start']
+            polishing  = bool(state.get('polishing', False))
+
+        telemetry = self._telemetry(state)
+        schedule  = self._schedule(state)
+        abort     = None
+        b         = stage
+        timer.begin()
+
+        # the Picard step is phia + stepScale*mixParameter*phianew
+        stepScale = 1.0 if self.asymptoticPreserving else float(alphaA)
+
+        while b is not None:
+            kappa      = schedule.kappa(b)
+            mixer      = self._mixer(state if b == stage else None)
+            detector   = self._detector(state if b == stage else None)
+            first      = start if b == stage else 0
+            stageStart = iterations - first
+            stageClock = time.time()
+
+            # every stage starts in the working precision
+            polishing = polishing and b == stage
+            phia      = np.asarray(phia, dtype = np.float64 if polishing else self.dtype)
+            kernel    = self._kernel(kernels, phia.dtype)
+
+            for j in range(first, self.numberOfIterations):
+                phianew = kernel.residual(phia, kappa)
+
+                #check if phianew has obtained any incorrect values
+                if np.isnan(np.sum(phianew)):
+                    devtot[0] = np.nan
+                    abort     = Abort('nan', iterations, b, np.nan, 'phianew is NaN')
+                    break
+
+                devtot    = np.roll(devtot, 1)     # Remember previous deviations.
+                devtot[0] = kernel.deviation(phianew, phia)
+                perdev    = np.sum(abs(devtot))/5.0
+                perdev    = abs(100.0*(perdev - devtot[0])/perdev)   # % change in deviation.
+
+                if mixer is not None:
+                    mixParameter = mixer.relaxation(self.smallmix)
+                elif perdev < self.perc and count > self.bigStepCount:
+                    mixParameter = self.bigmix        # Try a big step
+                    count        = 0
                 else:
-                    tempPotential[i] -A2*(m.exp(-(r-length)))**2.0/(2.0*gamma**2.0)
-            np.append(self.m_Potentials,tempPotential)
+                    mixParameter = self.smallmix      # Stick with small step.
+                    count        = count + 1
+
+                iterations += 1
+                telemetry.record(iterations, b, devtot[0], mixParameter, kappa,
+                                 self.freeEnergy(np.array([phia, 1.0 - phia])) if telemetry.wantsFreeEnergy(iterations) else np.nan,
+                                 None if mixer is None else mixer.policy)
+
+                # close to converged in single precision, the next residual is worked out in double
+                if self._polishDue(phia, devtot[0]):
+                    polishing = True
+                    phia      = phia.astype(np.float64)
+                    kernel    = self._kernel(kernels, phia.dtype)
+                    mixer     = self._mixer()
+                    continue
+
+                if schedule.converged(b, devtot[0], self.tolerance):
+                    break
+
+                if mixer is None:
+                    kernel.step(phia, phianew, stepScale*mixParameter)
+                else:
+                    clock = timer.start()
+                    phia  = mixer.update(phia, stepScale*phianew, mixParameter)
+                    timer.lap('mixing', clock)
+
+                # threshold the values of phi, so no number is less than zero, greater than one
+                kernel.clamp(phia, self.bounds, self.clampedValues, count = detector is not None)
+
+                if detector is not None:
+                    abort = detector.check(iterations, b, devtot[0], kernel.clampedFraction)
+                    if abort is not None:
+                        break
+
+                self._saveCheckpoint(iterations, b, j + 1, mixer, detector, schedule, phia = phia, telemetry = telemetry,
+                                     devtot = devtot, count = count, polishing = polishing)
+
+            nextStage = schedule.finish(b, iterations - stageStart, time.time() - stageClock, devtot[0], self.smallmix)
+            if self._endsSolve(abort, schedule.isLast(b)):
+                break
+            abort = None
+            b     = nextStage
+
+        self._removeCheckpoint()
+        telemetry.flush()
+        flag      = 1 if devtot[0] <= self.tolerance else 0
+        densities = np.array([phia, 1.0 - phia], dtype = np.result_type(self.dtype, np.float64))
+
+        return Result(densities, flag, devtot[0], iterations, telemetry.residuals(), self.freeEnergy(densities),
+                      peakMemory(), sum(kernel.nbytes for kernel in kernels.values()), self._phaseTimes(), abort,
+                      schedule.stages())
+
+#----------------------------------------------------------------------------------------
+#Name: freeEnergy
+#
+#Description: The free energy per unit volume of the given densities, evaluated with the
+#             last incompressibility stage (the target kappa of an adaptive schedule).
+#
+#             SCFT:  F = sum_i -(f_i/alpha_i) log(Q_i/V) + (1/2V) int sum_ij phi_i (V_ij * phi_j)
+#                        - (1/V) int sum_i w_i phi_i + (kappa/2V) int (1 - sum_i phi_i)^2
+#
+#             DFT:   the functional whose stationary points are the reformulated equations,
+#                    with the zero of the free energy moved to the uniform state.
+#----------------------------------------------------------------------------------------
+    def freeEnergy(self, densities):
+        system = self.system
+        kappa  = self.incompressibility[-1]
+        axes   = system.axes
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore', over = 'ignore'):
+            if self.method == 'SCFT':
+                convolutions = self.convolve(densities)
+                fields       = convolutions - kappa*(1.0 - np.sum(densities, axis = 0))
+                weights, Q, shifts = self._partitionFunctions(fields)
+
+                return float(np.sum(-(system.volumeFractions/system.alphas)*(np.log(Q/system.volume) + shifts)) +
+                             np.sum(0.5*densities*convolutions - fields*densities)/system.numberOfPoints +
+                             (kappa/2.0)*np.mean((1.0 - np.sum(densities, axis = 0))**2))
+
+            volumeFractionA, volumeFractionB = system.volumeFractions
+            alphaA, alphaB = system.alphas
+            phia = densities[0]
+            phib = 1.0 - phia
+
+            phiaVphia = self.convolvePair(phia - volumeFractionA, 0, 1)
+
+            return float((1/alphaA)*np.mean(phia*(np.log(phia/volumeFractionA) - 1)) +
+                         (1/alphaB)*np.mean(phib*(np.log(phib/volumeFractionB) - 1)) -
+                         (1/(alphaA*alphaB))*np.mean(phiaVphia*(phia - volumeFractionA)) +
+                         (kappa/2.0)*(volumeFractionA - np.mean(phia))**2)
+
+
+
+class BatchSolver(Solver):
+
+#----------------------------------------------------------------------------------------
+#Name: __init__
+#
+#Description: Solves a whole stack of Systems at once, e.g. the points of a parameter
+#             sweep. The Systems must share the grid, the box and the number of species;
+#             their potentials, volume fractions and alphas may all differ. Every
+#             iteration transforms the whole [batch, species, *grid] stack with one rfftn
+#             over the trailing axes, sums the field spectra of every species in k-space
+#             and takes one irfftn per species, so the NumPy call overhead is paid once
+#             per iteration instead of once per point. A member that has converged drops
+#             out of the stack for the rest of the stage, and with abort one that is
+#             stopped early drops out too (every member gets a copy of the detector).
+#
+#             Takes the same settings as Solver, except that only Picard mixing, the
+#             fixed point backend and double precision are available. When
+#             incompressibility is not given the DFT default 100/alphaA is worked out for
+#             every member separately.
+#----------------------------------------------------------------------------------------
+    def __init__(self, systems, method = 'SCFT', **settings):
+        Solver.__init__(self, systems[0], method, **settings)
+        self.settings = settings
+
+        if self.mixing != 'picard' or self.backend != 'fixedpoint':
+            raise ValueError("the batched solver only supports Picard mixing")
+        if self.precision != 'double':
+            raise ValueError("the batched solver only runs in double precision")
+        if self.levels or self.symmetry is not None:
+            raise ValueError("the batched solver only solves on the grid of its systems")
+        if self.schedule is not None:
+            raise ValueError("the batched solver runs every member through the same fixed incompressibility stages")
+
+        first = systems[0]
+        for system in systems:
+            if (system.gridShape != first.gridShape or system.numberOfSpecies != first.numberOfSpecies or
+                    np.any(system.boxSize != first.boxSize)):
+                raise ValueError("all systems in a batch need the same grid, box and number of species")
+
+        self.systems           = list(systems)
+        self.batchSize         = len(self.systems)
+        self.fourierPotentials = np.array([system.fourierPotentials for system in self.systems])
+        self.interacting       = np.any([system.interacting for system in self.systems], axis = 0)
+        self.volumeFractions   = np.array([system.volumeFractions for system in self.systems])
+        self.alphas            = np.array([system.alphas for system in self.systems])
+
+        # the grid axes of a [batch, *grid] and of a [batch, species, *grid] array
+        self.memberAxes  = tuple(range(1, first.numberOfDimensions + 1))
+        self.speciesAxes = tuple(range(2, first.numberOfDimensions + 2))
+
+        # incompressibility of every stage for every member, [stage, batch]
+        if settings.get('incompressibility') is None and self.method == 'DFT':
+            self.kappas = (100.0/self.alphas[:, 0])[np.newaxis]
+        else:
+            self.kappas = np.repeat(np.array(self.incompressibility, dtype = float)[:, np.newaxis], self.batchSize, axis = 1)
+
+#----------------------------------------------------------------------------------------
+#Name: solve
+#
+#Description: initialDensities is a single set of densities that every member starts from,
+#             in any of the forms System.densityArray accepts, or with perMember = True
+#             the initial densities of every member, one such set per member. Left at
+#             None, perMember is True only for a [batch, species, *grid] stack (all N or
+#             the first N - 1 species), the one form a shared start cannot have.
+#
+#Returns: A list of Results, one per System
+#----------------------------------------------------------------------------------------
+    def solve(self, initialDensities, perMember = None):
+        initialDensities = np.asarray(initialDensities, dtype = float)
+        if perMember is None:
+            perMember = initialDensities.ndim == self.system.numberOfDimensions + 2
+
+        if not perMember:
+            initialDensities = [initialDensities]*self.batchSize
+        elif len(initialDensities) != self.batchSize:
+            raise ValueError("expected the initial densities of %d members, got %d" % (self.batchSize, len(initialDensities)))
+
+        densities = np.array([system.densityArray(initial) for system, initial in zip(self.systems, initialDensities)])
+
+        if self.method == 'SCFT':
+            return self._solveSCFTBatch(densities)
+        else:
+            return self._solveDFTLikeBatch(densities)
+
+    # the Solver settings applied to a single member, for its free energy
+    def _memberSolver(self, member):
+        settings = dict(self.settings, incompressibility = list(self.kappas[:, member]))
+
+        return Solver(self.systems[member], self.method, **settings)
+
+    # every member gets the phase times of the whole batch
+    def _results(self, densities, flags, deviations, iterations, divergence, aborts):
+        phaseTimes = self._phaseTimes()
+
+        return [Result(densities[m], flags[m], deviations[m], iterations[m], divergence[m],
+                       self._memberSolver(m).freeEnergy(densities[m]), phaseTimes = phaseTimes, abort = aborts[m])
+                for m in range(self.batchSize)]
+
+    # a detector per member, None without early abort
+    def _detectors(self):
+        detector = getDetector(self.abort)
+        if detector is None:
+            return None
+
+        return [copy.deepcopy(detector) for m in range(self.batchSize)]
 
 #----------------------------------------------------------------------------------------
-# Generates potentials based on user specified values. If no values given it defaults to 
-# chosen values.
+#Name: _checkMembers
+#
+#Description: Hands the residuals of the active members that have not converged to their
+#             detectors, recording the Aborts in aborts. clampedFractions are those of the
+#             DFT like equations.
+#
+#Returns: A mask of the active members that were stopped
 #----------------------------------------------------------------------------------------
+    def _checkMembers(self, detectors, aborts, active, stage, iterations, residuals, clampedFractions = None):
+        stopped = np.zeros(len(active), dtype = bool)
+        if detectors is None:
+            return stopped
+
+        for n, m in enumerate(active):
+            if abs(residuals[n]) < self.tolerance:
+                continue
+            aborts[m] = detectors[m].check(iterations[m], stage, residuals[n],
+                                           None if clampedFractions is None else clampedFractions[n])
+            stopped[n] = aborts[m] is not None
 
-    def _fourierTransform(self, ListOfArrays):
-        fourierList = np.array([])
-        for things in ListOfArrays
-              np.append(fourierList, np.fft.fft(things))
-        return fourierList
+        return stopped
 
-    def _inverseFourierTransform(self,ListOfFourierArrays
-        inverseFourierList = np.array([])
-        for things in ListOfArrays
-              np.append(fourierList, np.fft.fft(things))
-        return fourierList
+    # members stopped for good are left out of the next stage, the others are started again
+    def _nextStage(self, detectors, aborts, stage):
+        for m in range(self.batchSize):
+            if not self._endsSolve(aborts[m], stage == self.kappas.shape[0] - 1):
+                aborts[m] = None
+                if detectors is not None:
+                    detectors[m].reset()
 
+        return np.array([m for m in range(self.batchSize) if aborts[m] is None], dtype = int)
 
+    def _expand(self, values):
+        return np.reshape(values, np.shape(values) + (1,)*self.system.numberOfDimensions)
 
 #----------------------------------------------------------------------------------------
-# Takes the intial densites and the potential that was specified by the user and
-# calculates the final densities using a real space FFT method.
+# SCFT
 #----------------------------------------------------------------------------------------
-    def findFinalDensities(self):
-        
-        for i in range(0,3):
-            for j in range(0, 100000):
+    # interaction fields of a [batch, species, *grid] stack, one inverse transform per
+    # species of every member, see Solver.convolve
+    def _convolveBatch(self, densities, fourierPotentials):
+        system  = self.system
+        spectra = self.fft.rfftn(densities, self.speciesAxes)
+        spectra = np.einsum('bij...,bj...->bi...', fourierPotentials, spectra)
+
+        return system.volume*self.fft.irfftn(spectra, system.gridShape, self.speciesAxes)
+
+    def _solveSCFTBatch(self, densities):
+        system     = self.system
+        timer      = self.profile
+        deviations = np.inf*np.ones(self.batchSize)
+        iterations = np.zeros(self.batchSize, dtype = int)
+        divergence = [[] for m in range(self.batchSize)]
+        detectors  = self._detectors()
+        aborts     = [None]*self.batchSize
+        active     = np.arange(self.batchSize)
+        timer.begin()
+
+        for b in range(len(self.incompressibility)):
+            mix = self.mixParameter[min(b, len(self.mixParameter) - 1)]
+            if len(active) == 0:
+                break
+
+            # working copies holding only the members that are still iterating
+            current   = densities[active]
+            Vk        = self.fourierPotentials[active]
+            fractions = self.volumeFractions[active]
+            alphas    = self._expand(self.alphas[active])
+            kappa     = self._expand(self.kappas[b, active])[:, np.newaxis]
+
+            for j in range(self.numberOfIterations):
+                start   = timer.start()
+                fields  = self._convolveBatch(current, Vk)
+                start   = timer.lap('convolution', start)
+                fields -= kappa*(1.0 - np.sum(current, axis = 1, keepdims = True))
+                start   = timer.lap('field update', start)
+                weights = -alphas*fields
+                shifts  = exponentShifts(np.max(weights, axis = self.speciesAxes))
+                if np.any(shifts):
+                    weights -= self._expand(shifts)
+                weights = np.exp(weights)
+                start   = timer.lap('exponentiation', start)
+                Q       = system.cellVolume*np.sum(weights, axis = self.speciesAxes)
+
+                tempDensities    = self._expand(fractions)*system.volume*weights/self._expand(Q)
+                averageDensities = fractions - system.cellVolume*np.sum(tempDensities, axis = self.speciesAxes)/system.volume
+                newDensities     = tempDensities + self._expand(averageDensities)
+                start            = timer.lap('normalization', start)
+
+                #picard mixing to increase the convergence
+                current = mix*newDensities + (1.0 - mix)*current
+                start   = timer.lap('mixing', start)
+
+                dev    = newDensities[:, 0] - current[:, 0]
+                phidev = np.sum(dev*dev, axis = self.memberAxes)/np.sum(newDensities[:, 0]**2, axis = self.memberAxes)
+                timer.lap('convergence check', start)
+
+                deviations[active]  = phidev
+                iterations[active] += 1
+                for m, deviation in zip(active, phidev):
+                    divergence[m].append(deviation)
+
+                # members that have converged or were stopped leave the stack
+                converged = np.abs(phidev) < self.tolerance
+                converged |= self._checkMembers(detectors, aborts, active, b, iterations, phidev)
+                if np.any(converged):
+                    densities[active[converged]] = current[converged]
+
+                    keep      = ~converged
+                    active    = active[keep]
+                    current   = current[keep]
+                    Vk        = Vk[keep]
+                    fractions = fractions[keep]
+                    alphas    = alphas[keep]
+                    kappa     = kappa[keep]
+                    if len(active) == 0:
+                        break
+
+            densities[active] = current
+            active            = self._nextStage(detectors, aborts, b)
+
+        flags = [1 if deviation <= self.tolerance else 0 for deviation in deviations]
+
+        return self._results(densities, flags, deviations, iterations, divergence, aborts)
+
+#----------------------------------------------------------------------------------------
+# DFT like
+#----------------------------------------------------------------------------------------
+    def _solveDFTLikeBatch(self, densities):
+        system = self.system
+        timer  = self.profile
+        phia   = densities[:, 0].copy()
+
+        phia[phia >= 1.0] = 0.9999999
+        phia[phia <= 0.0] = 0.0000001
+
+        devtot     = 100.0*np.ones((self.batchSize, 5))
+        count      = np.zeros(self.batchSize, dtype = int)
+        iterations = np.zeros(self.batchSize, dtype = int)
+        divergence = [[] for m in range(self.batchSize)]
+        detectors  = self._detectors()
+        aborts     = [None]*self.batchSize
+        active     = np.arange(self.batchSize)
+        timer.begin()
+
+        for b in range(self.kappas.shape[0]):
+            clamped = None
+            current = phia[active]
+            Vk      = self.fourierPotentials[active, 0, 1]
+            volumeFractionA, volumeFractionB = [self._expand(f) for f in self.volumeFractions[active].T]
+            alphaA, alphaB                   = [self._expand(a) for a in self.alphas[active].T]
+            kappa                            = self.kappas[b, active]
+
+            for j in range(self.numberOfIterations):
+                if len(active) == 0:
+                    break
+
+                start   = timer.start()
+                spectra = self.fft.rfftn(current - volumeFractionA, self.memberAxes)
+                convolution_Phia_PotentialAb = system.volume*self.fft.irfftn(spectra*Vk, system.gridShape, self.memberAxes)
+                start   = timer.lap('convolution', start)
+
+                lgaterm = -(1/alphaA)*np.log(current/volumeFractionA)
+                lgbterm = (1/alphaB)*np.log((1 - current)/volumeFractionB)
+                kpterm  = self._expand(kappa*(volumeFractionA.ravel() - np.mean(current, axis = self.memberAxes)))
+
+                #self consistent equations in reformulated form
+                phianew = lgaterm + lgbterm + (2/(alphaA*alphaB))*convolution_Phia_PotentialAb + kpterm
+                if self.asymptoticPreserving:
+                    phianew *= alphaA
+                start = timer.lap('field update', start)
+
+                deviation = np.sum(phianew**2, axis = self.memberAxes)/np.sum(current**2, axis = self.memberAxes)
+                timer.lap('convergence check', start)
+                devtot[active]     = np.roll(devtot[active], 1, axis = 1)     # Remember previous deviations.
+                devtot[active, 0]  = deviation
+                perdev             = np.sum(abs(devtot[active]), axis = 1)/5.0
+                perdev             = abs(100.0*(perdev - deviation)/perdev)   # % change in deviation.
+
+                bigStep              = (perdev < self.perc) & (count[active] > self.bigStepCount)
+                mixParameter         = np.where(bigStep, self.bigmix, self.smallmix)
+                count[active]        = np.where(bigStep, 0, count[active] + 1)
+                iterations[active]  += 1
+                for m, value in zip(active, deviation):
+                    divergence[m].append(value)
+
+                # members that have converged, gone NaN or were stopped leave the stack
+                stopped = self._checkMembers(detectors, aborts, active, b, iterations, deviation, clamped)
+                for m in active[np.isnan(deviation)]:
+                    aborts[m] = Abort('nan', iterations[m], b, np.nan, 'phianew is NaN')
+                finished = np.isnan(deviation) | (np.abs(deviation) < self.tolerance) | stopped
+                if np.any(finished):
+                    phia[active[finished]] = current[finished]
+
+                    keep            = ~finished
+                    active          = active[keep]
+                    current         = current[keep]
+                    phianew         = phianew[keep]
+                    mixParameter    = mixParameter[keep]
+                    Vk              = Vk[keep]
+                    volumeFractionA = volumeFractionA[keep]
+                    volumeFractionB = volumeFractionB[keep]
+                    alphaA          = alphaA[keep]
+                    alphaB          = alphaB[keep]
+                    kappa           = kappa[keep]
+                    if clamped is not None:
+                        clamped = clamped[keep]
+
+                start     = timer.start()
+                stepScale = 1.0 if self.asymptoticPreserving else alphaA
+                current   = current + stepScale*self._expand(mixParameter)*phianew
+
+                # threshold the values of phi, so no number is less than zero, greater than one
+                current[current >= self.bounds[1]] = self.clampedValues[1]
+                current[current <= self.bounds[0]] = self.clampedValues[0]
+                timer.lap('mixing', start)
+
+                # the detectors see the clamping of this step with the residual of the next
+                if detectors is not None:
+                    clamped = np.mean((current >= self.bounds[1]) | (current <= self.bounds[0]), axis = self.memberAxes)
+
+            phia[active] = current
+            active       = self._nextStage(detectors, aborts, b)
 
+        deviations = devtot[:, 0]
+        flags      = [1 if deviation <= self.tolerance else 0 for deviation in deviations]
+        densities  = np.stack((phia, 1.0 - phia), axis = 1)
 
-    def nCr(n,r):
-        f = math.factorial
-        return f(n) / f(r) / f(n-r)
+        return self._results(densities, flags, deviations, iterations, divergence, aborts)
@@ -1,11 +1,13 @@
 import ParticlesFunction as p
 import numpy as np
 import os 
+from ResultStore import ResultStore
 
 
 
 alphaA = [1, 0.1, 0.01, 0.001, 0.0001, 0.00001, 0.000001]
 intialCondtion = np.loadtxt('dots.txt')
+store          = ResultStore(os.getcwd())
 
 
 A1		= [0.9 , 0.4, 0.2, 0.15, 0.1, 0.08]
@@ -41,21 +43,19 @@ for t in range(0,6):
 
 
 
-	for i in range(parameters.shape[1]):
-		for j in range(parameters.shape[1]):
-			for k in range(parameters.shape[1]):
-				for l in range(parameters.shape[1]):
-					x = p.Particles2D(intialCondtion, parameters[0][i],parameters[1][j],parameters[2][k],parameters[3][l], 0.5,  alpha)
-					x_max = np.max(x)
-					x_min = np.min(x)
-					diff = abs(x_max - x_min)
-					if np.sum(x) != 0 and diff > 0.01:
-						newFileName ="/Output" + str(t) +"/" + str(i) + "_" + str(j) + "_" + str(k) + "_" + str(l) +".txt"
-						z = os.getcwd()
-						if not os.path.exists(os.path.dirname(z + newFileName)):
-	    						os.makedirs(os.path.dirname(z + newFileName))
-						
-						np.savetxt(z + newFileName, x)
-						
-					 
-			
+	# all 3^4 parameter points of this alpha level are solved together
+	indices = [(i, j, k, l) for i in range(parameters.shape[1]) for j in range(parameters.shape[1])
+	                        for k in range(parameters.shape[1]) for l in range(parameters.shape[1])]
+	parameterList = [(parameters[0][i],parameters[1][j],parameters[2][k],parameters[3][l]) for i, j, k, l in indices]
+
+	densities = p.Particles2DBatch(intialCondtion, parameterList, 0.5, alphaA[t])
+
+	for n, ((i, j, k, l), x) in enumerate(zip(indices, densities)):
+		x_max = np.max(x)
+		x_min = np.min(x)
+		diff = abs(x_max - x_min)
+		if np.sum(x) != 0 and diff > 0.01:
+			key = "Output" + str(t) +"/" + str(i) + "_" + str(j) + "_" + str(k) + "_" + str(l)
+			store.save(key, [x], {'A1': parameterList[n][0], 'A2': parameterList[n][1], 'length': parameterList[n][2],
+			                      'gamma': parameterList[n][3], 'alpha': alphaA[t], 'volumeFraction': 0.5})
+
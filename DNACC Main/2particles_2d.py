@@ -1,24 +1,26 @@
 
 #------------------------------------------------------------
 # This is essentially the same as the other DNACC code for 3 particles.
-# This code is for 2 particles and it is using the arbitrary precision
-# library mpmath
+# This code is for 2 particles. It used to do the Boltzmann weights with
+# the arbitrary precision library mpmath at 350 digits, because exp(-w)
+# overflows for potentials as strong as A1 = 9000. The weights are now
+# shifted by their largest exponent before they are exponentiated (the
+# log-sum-exp trick); the shift cancels in phi = f V exp(-w)/Q, so plain
+# NumPy floats cannot overflow and grids of 128x128 run at NumPy speed.
 #------------------------------------------------------------
 
 import numpy as np
 import matplotlib.pyplot as plt
 import scipy as sci
 import math as m
-from mpmath import *
 import time
 from decimal import *
-from mpmath_utils import *
 
 #------------------------------------------------------------
 # Initialize the Variables
 #------------------------------------------------------------
 
-mp.dps = 350
+precision = np.float64   # np.longdouble for extended precision weights
 getcontext().prec = 7
 t1 = time.clock()
 fa = 0.5
@@ -95,22 +97,22 @@ for i in range(0,3):
         wa =  icnvb   - incompresibilityFactor[i]*(  1  - phia - phib)
         wb =  icnvba  - incompresibilityFactor[i]*(  1  - phia - phib)
         
-        wa_mp = array2mp(-wa)
+        wa_exponent = -wa.astype(precision)
+        wb_exponent = -alpha*wb.astype(precision)
 
-        wb_mp = array2mp(-alpha*wb)
-        
-        wa_mp_exp = apply2mparray(wa_mp,exp)
-        wb_mp_exp = apply2mparray(wb_mp,exp)
+        # shifted Boltzmann weights, the largest one is 1
+        wa_exp = np.exp(wa_exponent - np.max(wa_exponent))
+        wb_exp = np.exp(wb_exponent - np.max(wb_exponent))
 
-        QA = np.sum(wa_mp_exp)
+        QA = np.sum(wa_exp)
         if m.isnan(QA):
 			flag = 1
 			break
         
         
-        QB = np.sum(wb_mp_exp)
-        phiatemp = mparray2npfloat( fa*xsize*ysize*wa_mp_exp/QA)
-        phibtemp = mparray2npfloat(fb*xsize*ysize*wb_mp_exp/QB)
+        QB = np.sum(wb_exp)
+        phiatemp = (fa*xsize*ysize*wa_exp/QA).astype(float)
+        phibtemp = (fb*xsize*ysize*wb_exp/QB).astype(float)
         
         phiaave = fa - dy*dx*np.sum(phiatemp)/(xsize*ysize)
         phibave = fb - dy*dx*np.sum(phibtemp)/(xsize*ysize)
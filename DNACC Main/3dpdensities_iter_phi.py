@@ -99,6 +99,12 @@ Vkab = (np.fft.rfftn(Vab))/((float(number_of_lattice_pointsY)*float(number_of_la
 Vkac = (np.fft.rfftn(Vac))/((float(number_of_lattice_pointsY)*float(number_of_lattice_pointsX)*float(number_of_lattice_pointsZ)))
 Vkbc = (np.fft.rfftn(Vbc))/((float(number_of_lattice_pointsY)*float(number_of_lattice_pointsX)*float(number_of_lattice_pointsZ)))
 
+#row i holds the potentials species i feels from species a, b and c, so the
+#field spectrum of every species is one contraction with the density spectra
+Vk = np.array([[np.zeros_like(Vkab), Vkab, Vkac],
+               [Vkab, np.zeros_like(Vkab), Vkbc],
+               [Vkac, Vkbc, np.zeros_like(Vkab)]])
+
 
 std = 0.15;
 phia = fa + std*np.random.randn(number_of_lattice_pointsX, number_of_lattice_pointsY, number_of_lattice_pointsZ)
@@ -112,33 +118,18 @@ phib1 = phib
 phic1 = phic
 
 g = 0
+diverged = False
 for i in range(0,3):
     for j in range(0, number_of_iterations):
-        iphia = np.fft.rfftn(phia)
-        iphib = np.fft.rfftn(phib)
-        iphic = np.fft.rfftn(phic)
-
-        cnva  = iphia*Vkac
-        cnvac = iphic*Vkac
-
-        cnvb  = iphib*Vkab
-        cnvba = iphia*Vkab
-
-        cnvc  = iphic*Vkbc
-        cnvcb = iphib*Vkbc
+        iphi = np.fft.rfftn(np.array([phia, phib, phic]), axes = (1, 2, 3))
 
-        icnva =  zsize*ysize*xsize*np.fft.irfftn(cnva)
-        icnvb =  zsize*ysize*xsize*np.fft.irfftn(cnvb)
-        icnvc =  zsize*ysize*xsize*np.fft.irfftn(cnvc)
-
-        icnvba =  zsize*ysize*xsize*np.fft.irfftn(cnvba)
-        icnvac =  zsize*ysize*xsize*np.fft.irfftn(cnvac)
-        icnvcb =  zsize*ysize*xsize*np.fft.irfftn(cnvcb)
+        #the convolutions are summed in k-space, three inverse transforms instead of six
+        icnv = zsize*ysize*xsize*np.fft.irfftn(np.einsum('ij...,j...->i...', Vk, iphi), s = phia.shape, axes = (1, 2, 3))
 
         #self conistent equations
-        wa =  icnvac + icnvb - incompresibilityFactor[i]*(  1  - phia - phib - phic)
-        wb =  icnvba + icnvc - incompresibilityFactor[i]*(  1  - phia - phib - phic)
-        wc =  icnvcb + icnva - incompresibilityFactor[i]*(  1  - phia - phib - phic)
+        wa =  icnv[0] - incompresibilityFactor[i]*(  1  - phia - phib - phic)
+        wb =  icnv[1] - incompresibilityFactor[i]*(  1  - phia - phib - phic)
+        wc =  icnv[2] - incompresibilityFactor[i]*(  1  - phia - phib - phic)
 
         ewa = np.exp(-wa)
         ewb = np.exp(-wb)
@@ -146,8 +137,11 @@ for i in range(0,3):
 
         QA = dx*dy*dz*np.sum(np.sum(np.sum(ewa)))
 
+        #the fields have overflowed, no later iteration can recover from a NaN
         if m.isnan(QA):
-            print "this is bad"
+            print "this is bad, QA is NaN at stage %d iteration %d" % (i, j)
+            diverged = True
+            break
 
         QB = dx*dy*dz*np.sum(np.sum(np.sum(ewb)))
         QC = dx*dy*dz*np.sum(np.sum(np.sum(ewc)))
@@ -177,6 +171,9 @@ for i in range(0,3):
         if phidev < tolerence:
             break
 
+    if diverged:
+        break
+
 print g
 t2 = time.clock()
 print t2 - t1
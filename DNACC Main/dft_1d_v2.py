@@ -8,6 +8,11 @@ from numpy.fft import rfft, irfft
 from numpy.linalg import solve
 from pylab import plot, xlabel, ylabel, show, figure
 from sys import exit
+import os, sys
+
+# the Telemetry of the solvers in DNACC Development
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'DNACC Development'))
+from Telemetry import Telemetry
 
 # Computational inputs
 mj = 264   # Need an even value please (for convenience in defining potential).
@@ -52,8 +57,7 @@ phia = rand(mj)
 
 devtot = 100.0*ones(his)         # Initialize some variables.
 count = 0
-divergence = []
-steps = []
+telemetry = Telemetry(every = 10, logFile = 'dft_1d_v2.telemetry')    # watch it with Telemetry.readLog
 i = 0
 # Do the actual computation
 for n in range(maxit): 
@@ -79,17 +83,19 @@ for n in range(maxit):
 	if (perdev<perc and count>100):
 		mix = bigmix        # Try a big step
 		count = 0
-		print('Big!')
 	else:
 		mix = smallmix      # Stick with small step.
 		count = count+1
-	divergence.append(devtot[0])    
-	steps.append(i)
+	telemetry.record(i, 0, devtot[0], mix, kappa)    # Iteration output.
 	i = i + 1
-	print(n, devtot[0], perdev)    # Iteration output.
 	if (devtot[0]<mindev):
 		break
 
+telemetry.close()
+history = telemetry.history()
+steps = history['iteration']
+divergence = history['residual']
+
 phib = 1.0-phia
 phiaave = sum(phia)/mj
 phibave = sum(phib)/mj
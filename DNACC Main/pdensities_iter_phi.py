@@ -60,6 +60,13 @@ Vkab = (np.fft.rfft(Vab))/float(number_of_lattice_points)
 Vkac = (np.fft.rfft(Vac))/float(number_of_lattice_points)
 Vkbc = (np.fft.rfft(Vbc))/float(number_of_lattice_points)
 
+#row i holds the potentials species i feels from species a, b and c, so the
+#field spectrum of every species is one contraction with the density spectra.
+#as in the pairwise loop this replaces, each species feels its own density
+Vk = np.array([[Vkab + Vkac, np.zeros_like(Vkab), np.zeros_like(Vkab)],
+               [np.zeros_like(Vkab), Vkab + Vkbc, np.zeros_like(Vkab)],
+               [np.zeros_like(Vkab), np.zeros_like(Vkab), Vkac + Vkbc]])
+
 
 std = 0.15;
 phia = fa + std*np.random.randn(number_of_lattice_points)
@@ -73,33 +80,18 @@ phib1 = phib;
 phic1 = phic; 
 
 g = 0
+diverged = False
 for i in range(0,3):
     for j in range(0, number_of_iterations):
-        iphia = np.fft.rfft(phia)
-        iphib = np.fft.rfft(phib)
-        iphic = np.fft.rfft(phic)
-
-        cnva  = iphia*Vkac
-        cnvac = iphic*Vkac
-
-        cnvb  = iphib*Vkab
-        cnvba = iphia*Vkab
-
-        cnvc  = iphic*Vkbc
-        cnvcb = iphib*Vkbc
+        iphi = np.fft.rfft(np.array([phia, phib, phic]), axis = 1)
 
-        icnva = xsize*np.fft.irfft(cnva)
-        icnvb = xsize*np.fft.irfft(cnvb)
-        icnvc = xsize*np.fft.irfft(cnvc)
-
-        icnvba = xsize*np.fft.irfft(cnvba)
-        icnvac = xsize*np.fft.irfft(cnvac)
-        icnvcb = xsize*np.fft.irfft(cnvcb)
+        #the convolutions are summed in k-space, three inverse transforms instead of six
+        icnv = xsize*np.fft.irfft(np.einsum('ij...,j...->i...', Vk, iphi), n = len(phia), axis = 1)
 
         #self conistent equations
-        wa =  icnvba + icnva - incompresibilityFactor[i]*(  1  - phia - phib - phic)
-        wb =  icnvcb + icnvb - incompresibilityFactor[i]*(  1  - phia - phib - phic)
-        wc =  icnvac + icnvc - incompresibilityFactor[i]*(  1  - phia - phib - phic)
+        wa =  icnv[0] - incompresibilityFactor[i]*(  1  - phia - phib - phic)
+        wb =  icnv[1] - incompresibilityFactor[i]*(  1  - phia - phib - phic)
+        wc =  icnv[2] - incompresibilityFactor[i]*(  1  - phia - phib - phic)
 
         ewa = np.exp(-wa)
         ewb = np.exp(-wb)
@@ -107,8 +99,11 @@ for i in range(0,3):
 
         QA = dx*np.sum(ewa)
 
+        #the fields have overflowed, no later iteration can recover from a NaN
         if m.isnan(QA):
-            print "this is bad"
+            print "this is bad, QA is NaN at stage %d iteration %d" % (i, j)
+            diverged = True
+            break
 
         QB = dx*np.sum(ewb)
         QC = dx*np.sum(ewc)
@@ -138,6 +133,9 @@ for i in range(0,3):
         if phidev < tolerence:
             break
 
+    if diverged:
+        break
+
 
 t2 = time.clock()
 